@@ -0,0 +1,28 @@
+"""Link crash rounds to the precomputed seed chain
+
+Revision ID: 20250125_01_crash_seed_chain
+Revises: 20250120_01_crash_idx
+Create Date: 2025-01-25 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250125_01_crash_seed_chain"
+down_revision = "20250120_01_crash_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("crash_rounds", sa.Column("chain_index", sa.BigInteger()))
+    op.create_index("uq_crash_rounds_chain_index", "crash_rounds", ["chain_index"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_crash_rounds_chain_index", table_name="crash_rounds")
+    op.drop_column("crash_rounds", "chain_index")
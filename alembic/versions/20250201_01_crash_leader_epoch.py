@@ -0,0 +1,29 @@
+"""Stamp crash rounds with the round-loop leader's fencing token
+
+Revision ID: 20250201_01_crash_leader_epoch
+Revises: 20250125_01_crash_seed_chain
+Create Date: 2025-02-01 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250201_01_crash_leader_epoch"
+down_revision = "20250125_01_crash_seed_chain"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "crash_rounds",
+        sa.Column("leader_epoch", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("crash_rounds", "leader_epoch")
@@ -0,0 +1,34 @@
+"""Record which formula derived each crash round's crash point
+
+Revision ID: 20250202_01_crash_point_version
+Revises: 20250201_01_crash_leader_epoch
+Create Date: 2025-02-02 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250202_01_crash_point_version"
+down_revision = "20250201_01_crash_leader_epoch"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Random-seed rounds that exist now were derived with plain sha256(seed)
+    # (version 1). Seed-chain rounds only ever used the HMAC derivation
+    # (version 2), as does every round created from here on.
+    op.add_column(
+        "crash_rounds",
+        sa.Column("crash_point_version", sa.SmallInteger(), nullable=False, server_default="1"),
+    )
+    op.execute("UPDATE crash_rounds SET crash_point_version = 2 WHERE chain_index IS NOT NULL")
+    op.alter_column("crash_rounds", "crash_point_version", server_default="2")
+
+
+def downgrade() -> None:
+    op.drop_column("crash_rounds", "crash_point_version")
@@ -0,0 +1,50 @@
+"""Crash rooms: one live round per room instead of one globally
+
+Revision ID: 20250203_01_crash_rooms
+Revises: 20250202_01_crash_point_version
+Create Date: 2025-02-03 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250203_01_crash_rooms"
+down_revision = "20250202_01_crash_point_version"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Every existing round belongs to the single room there was.
+    op.add_column(
+        "crash_rounds",
+        sa.Column("room", sa.String(length=32), nullable=False, server_default="main"),
+    )
+    op.drop_index("uq_crash_rounds_active", table_name="crash_rounds")
+    op.create_index(
+        "uq_crash_rounds_active",
+        "crash_rounds",
+        ["room"],
+        unique=True,
+        postgresql_where=sa.text("status IN ('betting','flying')"),
+        sqlite_where=sa.text("status IN ('betting','flying')"),
+    )
+    op.create_index("ix_crash_rounds_room_id", "crash_rounds", ["room", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_crash_rounds_room_id", table_name="crash_rounds")
+    op.drop_index("uq_crash_rounds_active", table_name="crash_rounds")
+    op.create_index(
+        "uq_crash_rounds_active",
+        "crash_rounds",
+        ["status"],
+        unique=True,
+        postgresql_where=sa.text("status IN ('betting','flying')"),
+        sqlite_where=sa.text("status IN ('betting','flying')"),
+    )
+    op.drop_column("crash_rounds", "room")
@@ -0,0 +1,29 @@
+"""Wallet version counter for the balance cache
+
+Revision ID: 20250204_01_wallet_version
+Revises: 20250203_01_crash_rooms
+Create Date: 2025-02-04 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250204_01_wallet_version"
+down_revision = "20250203_01_crash_rooms"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "wallets",
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("wallets", "version")
@@ -0,0 +1,40 @@
+"""Active bonus award counter on wallets
+
+Revision ID: 20250205_01_wallet_active_bonus_count
+Revises: 20250204_01_wallet_version
+Create Date: 2025-02-05 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250205_01_wallet_active_bonus_count"
+down_revision = "20250204_01_wallet_version"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "wallets",
+        sa.Column("active_bonus_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        """
+        UPDATE wallets SET active_bonus_count = (
+            SELECT count(*) FROM bonus_awards
+            WHERE bonus_awards.user_id = wallets.user_id
+              AND bonus_awards.status IN ('active', 'ready')
+        )
+        """
+    )
+    op.create_index("ix_bonus_awards_user_status", "bonus_awards", ["user_id", "status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_bonus_awards_user_status", table_name="bonus_awards")
+    op.drop_column("wallets", "active_bonus_count")
@@ -0,0 +1,36 @@
+"""Idempotency keys of wallet operations
+
+Revision ID: 20250206_01_idempotency_keys
+Revises: 20250205_01_wallet_active_bonus_count
+Create Date: 2025-02-06 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "20250206_01_idempotency_keys"
+down_revision = "20250205_01_wallet_active_bonus_count"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    json_type = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key", sa.String(length=200), primary_key=True),
+        sa.Column("response", json_type),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_idempotency_keys_created_at", "idempotency_keys", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_idempotency_keys_created_at", table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,35 @@
+"""Shared cursor for crash seed chain indexes
+
+Revision ID: 20250207_01_crash_chain_cursor
+Revises: 20250206_01_idempotency_keys
+Create Date: 2025-02-07 12:00:00.000000
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20250207_01_crash_chain_cursor"
+down_revision = "20250206_01_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "crash_chain_cursor",
+        sa.Column("id", sa.SmallInteger(), primary_key=True),
+        sa.Column("next_index", sa.BigInteger(), nullable=False),
+    )
+    # Rounds of every room draw from one chain; continue after the last index used.
+    op.execute(
+        "INSERT INTO crash_chain_cursor (id, next_index) "
+        "SELECT 1, COALESCE(MAX(chain_index) + 1, 0) FROM crash_rounds"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("crash_chain_cursor")
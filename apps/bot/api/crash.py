@@ -1,14 +1,21 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+import json
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, conint, confloat
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from apps.bot.api.deps import get_current_user, get_session
+from apps.bot.api.deps import get_current_user, get_current_user_id, get_session, load_user
+from apps.bot.core import idempotency
 from apps.bot.db.models import User
+from apps.bot.infra.settings import get_settings
 from apps.bot.services import crash as crash_service
+from apps.bot.services import crash_audit
 
 router = APIRouter(prefix="/api/crash", tags=["crash"])
+settings = get_settings()
 
 
 class BetRequest(BaseModel):
@@ -24,12 +31,33 @@ def _as_http_error(error: ValueError) -> HTTPException:
     return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
 
 
+_ROOM_QUERY = Query(crash_service.DEFAULT_ROOM, max_length=32, description="Crash room")
+
+
+@router.get("/rooms")
+async def crash_rooms(user: User = Depends(get_current_user)):
+    return [
+        {
+            "code": room.code,
+            "betMin": room.bet_min,
+            "betMax": room.bet_max,
+            "betDurationMs": room.bet_duration_ms,
+            "cooldownMs": room.cooldown_ms,
+        }
+        for room in crash_service.crash_rooms().values()
+    ]
+
+
 @router.get("/state")
 async def crash_state(
+    room: str = _ROOM_QUERY,
     session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    snapshot = await crash_service.get_state(session, user.id)
+    try:
+        snapshot = await crash_service.get_state(session, user.id, room)
+    except ValueError as exc:
+        raise _as_http_error(exc)
     return snapshot.to_dict()
 
 
@@ -37,35 +65,86 @@ async def crash_state(
 async def crash_bet(
     request: BetRequest,
     fastapi_request: Request,
+    room: str = _ROOM_QUERY,
+    idempotency_key: str | None = Header(
+        default=None,
+        max_length=100,
+        description="Retries with the same key get the first response back instead of a second bet",
+    ),
     session: AsyncSession = Depends(get_session),
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
-    try:
-        snapshot = await crash_service.place_bet(
-            session,
-            user=user,
-            amount=int(request.amount),
-            auto_cashout=float(request.auto_cashout) if request.auto_cashout else None,
-        )
-    except ValueError as exc:
-        raise _as_http_error(exc)
+    placed: list[crash_service.CrashSnapshot] = []
+
+    async def bet() -> dict:
+        user = await load_user(session, user_id)
+        try:
+            snapshot = await crash_service.place_bet(
+                session,
+                user=user,
+                amount=int(request.amount),
+                auto_cashout=float(request.auto_cashout) if request.auto_cashout else None,
+                room=room,
+                commit=False,
+            )
+        except ValueError as exc:
+            raise _as_http_error(exc)
+        placed.append(snapshot)
+        return snapshot.to_dict()
+
+    if not idempotency_key:
+        response = await bet()
+        await session.commit()
+    else:
+        # A replayed key is answered before the user row is even loaded; a
+        # new one commits the bet together with its stored response.
+        try:
+            response, _ = await idempotency.run_once(session, f"crash_bet:{user_id}:{idempotency_key}", bet)
+        except idempotency.RequestInProgress:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Request with this Idempotency-Key is in progress")
     manager = getattr(fastapi_request.app.state, "crash_ws", None)
-    if manager:
-        await manager.notify_bet(user.id, snapshot)
-    return snapshot.to_dict()
+    if manager and placed:
+        await manager.notify_bet(user_id, placed[0])
+    return response
 
 
 @router.post("/cashout")
 async def crash_cashout(
     fastapi_request: Request,
+    room: str = _ROOM_QUERY,
     session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
     try:
-        snapshot = await crash_service.cashout(session, user=user)
+        snapshot = await crash_service.cashout(session, user=user, room=room)
     except ValueError as exc:
         raise _as_http_error(exc)
     manager = getattr(fastapi_request.app.state, "crash_ws", None)
     if manager:
         await manager.notify_cashout(user.id, snapshot)
     return snapshot.to_dict()
+
+
+@router.get("/verify")
+async def crash_verify(
+    fastapi_request: Request,
+    from_id: int = Query(..., ge=1),
+    to_id: int = Query(..., ge=1),
+    user: User = Depends(get_current_user),
+):
+    if to_id < from_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="to_id must not be below from_id")
+    if to_id - from_id >= settings.crash_verify_max_rounds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.crash_verify_max_rounds} rounds per request",
+        )
+    database = fastapi_request.app.state.database
+
+    async def _stream():
+        # Request-scoped sessions are closed before a streaming body is sent.
+        async with database.session() as session:
+            async for item in crash_audit.iter_round_verifications(session, from_id, to_id):
+                yield json.dumps(item) + "\n"
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
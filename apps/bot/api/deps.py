@@ -31,15 +31,23 @@ async def get_session(request: Request) -> AsyncSession:
                 raise
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    session: AsyncSession = Depends(get_session),
-) -> User:
+async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
+    """User id from the bearer token alone; `load_user` still has to vet the account."""
     try:
         payload = decode_crash_jwt(credentials.credentials)
     except AuthError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc))
-    user_id = int(payload.get("sub", 0))
+    return int(payload.get("sub", 0))
+
+
+async def get_current_user(
+    user_id: int = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
+) -> User:
+    return await load_user(session, user_id)
+
+
+async def load_user(session: AsyncSession, user_id: int) -> User:
     user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
@@ -6,10 +6,20 @@ from decimal import Decimal
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from sqlalchemy import func, select
+from sqlalchemy import func, select, update
 
-from apps.bot.core.wallets import add_coins_bonus, add_coins_cash, consume_coins, get_wallet
-from apps.bot.db.models import BonusAward, BonusAwardStatus, TurnoverRule
+from apps.bot.core.wallets import (
+    add_coins_bonus,
+    add_coins_cash,
+    adjust_active_bonuses,
+    consume_coins,
+    get_wallet,
+    has_active_bonuses,
+)
+from apps.bot.db.models import BonusAward, BonusAwardStatus, TurnoverRule, Wallet
+
+# Statuses counted by `wallets.active_bonus_count`.
+_ACTIVE_STATUSES = (BonusAwardStatus.ACTIVE.value, BonusAwardStatus.READY.value)
 
 
 async def create_bonus_award(
@@ -42,32 +52,22 @@ async def create_bonus_award(
     session.add(award)
     await session.flush()
     await add_coins_bonus(session, user_id, granted, award_id=award.id, reason=f"bonus_{kind}")
+    await adjust_active_bonuses(session, user_id, 1)
     return award
 
 
-async def apply_turnover(session: AsyncSession, user_id: int, game: str, stake: int) -> int:
-    if stake <= 0:
-        return 0
+# Keeps IN (...) lists well below driver bind-parameter limits.
+_BULK_CHUNK = 1000
 
-    rule = await session.scalar(select(TurnoverRule.contribution).where(TurnoverRule.game == game))
-    if rule is None or rule <= 0:
-        return 0
 
+def _contribution(stake: int, rule: int) -> int:
     contribution = int(stake * rule / 100)
     if contribution <= 0:
         contribution = stake if rule > 0 else 0
-    if contribution <= 0:
-        return 0
+    return contribution
 
-    awards = (
-        await session.scalars(
-            select(BonusAward).where(
-                BonusAward.user_id == user_id,
-                BonusAward.status.in_([BonusAwardStatus.ACTIVE.value, BonusAwardStatus.READY.value]),
-            )
-        )
-    ).all()
 
+def _apply_contribution(awards: list[BonusAward], contribution: int) -> int:
     applied_total = 0
     for award in awards:
         remaining = award.turnover_required - award.turnover_progress
@@ -79,14 +79,80 @@ async def apply_turnover(session: AsyncSession, user_id: int, game: str, stake:
         applied_total += delta
         if award.turnover_progress >= award.turnover_required:
             award.status = BonusAwardStatus.READY.value
+    return applied_total
+
+
+async def apply_turnover(session: AsyncSession, user_id: int, game: str, stake: int) -> int:
+    # ACTIVE -> READY keeps an award counted, so the wallet counter needs no
+    # update here; it only lets users without awards skip the lookups.
+    if stake <= 0 or not await has_active_bonuses(session, user_id):
+        return 0
+
+    rule = await session.scalar(select(TurnoverRule.contribution).where(TurnoverRule.game == game))
+    if rule is None or rule <= 0:
+        return 0
+
+    contribution = _contribution(stake, rule)
+    if contribution <= 0:
+        return 0
 
+    awards = (
+        await session.scalars(
+            select(BonusAward).where(
+                BonusAward.user_id == user_id,
+                BonusAward.status.in_(_ACTIVE_STATUSES),
+            )
+        )
+    ).all()
+
+    return _apply_contribution(list(awards), contribution)
+
+
+async def apply_turnover_bulk(session: AsyncSession, game: str, stakes: dict[int, int]) -> int:
+    """Apply one stake per user in a single pass.
+
+    Equivalent to calling `apply_turnover` for every `(user_id, stake)` pair, but
+    the rule is read once and awards are fetched per chunk of users.
+    """
+    stakes = {user_id: stake for user_id, stake in stakes.items() if stake > 0}
+    if not stakes:
+        return 0
+
+    rule = await session.scalar(select(TurnoverRule.contribution).where(TurnoverRule.game == game))
+    if rule is None or rule <= 0:
+        return 0
+
+    awards_by_user: dict[int, list[BonusAward]] = {}
+    user_ids = list(stakes)
+    for start in range(0, len(user_ids), _BULK_CHUNK):
+        awards = (
+            await session.scalars(
+                select(BonusAward)
+                .where(
+                    BonusAward.user_id.in_(user_ids[start : start + _BULK_CHUNK]),
+                    BonusAward.status.in_(_ACTIVE_STATUSES),
+                )
+                .order_by(BonusAward.id)
+            )
+        ).all()
+        for award in awards:
+            awards_by_user.setdefault(award.user_id, []).append(award)
+
+    applied_total = 0
+    for user_id, awards in awards_by_user.items():
+        contribution = _contribution(stakes[user_id], rule)
+        if contribution > 0:
+            applied_total += _apply_contribution(awards, contribution)
     return applied_total
 
 
 async def try_unlock_bonuses(session: AsyncSession, user_id: int) -> dict:
     wallet = await get_wallet(session, user_id, for_update=True)
     unlocked: list[dict[str, int]] = []
+    if wallet.active_bonus_count <= 0:
+        return {"awards": unlocked}
 
+    completed = 0
     awards = (
         await session.scalars(
             select(BonusAward).where(
@@ -100,6 +166,7 @@ async def try_unlock_bonuses(session: AsyncSession, user_id: int) -> dict:
         transferable = max(0, award.cap_cashout - award.cashed_out)
         if transferable == 0:
             award.status = BonusAwardStatus.COMPLETED.value
+            completed += 1
             continue
         available_bonus = wallet.coins_bonus
         transfer_amount = min(available_bonus, transferable)
@@ -123,16 +190,45 @@ async def try_unlock_bonuses(session: AsyncSession, user_id: int) -> dict:
         award.cashed_out += transfer_amount
         award.status = BonusAwardStatus.COMPLETED.value
         award.unlocked_at = datetime.utcnow()
+        completed += 1
         unlocked.append({"award_id": award.id, "transferred": transfer_amount})
         wallet = await get_wallet(session, user_id, for_update=True)
 
+    if completed:
+        await adjust_active_bonuses(session, user_id, -completed)
     return {"awards": unlocked}
 
 
 async def user_has_locked_bonuses(session: AsyncSession, user_id: int) -> bool:
-    stmt = select(func.count()).where(
-        BonusAward.user_id == user_id,
-        BonusAward.status.in_([BonusAwardStatus.ACTIVE.value, BonusAwardStatus.READY.value]),
+    return await has_active_bonuses(session, user_id)
+
+
+async def rebuild_active_bonus_counts(session: AsyncSession, *, fix: bool = True) -> list[tuple[int, int, int]]:
+    """Recount `wallets.active_bonus_count` from `bonus_awards`.
+
+    Returns `(user_id, stored, actual)` for every wallet whose counter is
+    off; with `fix` those wallets are set to the recount, which is redone
+    inside the UPDATE so awards committed in between are not lost.
+    """
+    actual = (
+        select(func.count())
+        .where(BonusAward.user_id == Wallet.user_id, BonusAward.status.in_(_ACTIVE_STATUSES))
+        .correlate(Wallet)
+        .scalar_subquery()
     )
-    total = await session.scalar(stmt)
-    return bool(total)
+    mismatched = (
+        await session.execute(
+            select(Wallet.user_id, Wallet.active_bonus_count, actual)
+            .where(Wallet.active_bonus_count != actual)
+            .order_by(Wallet.user_id)
+        )
+    ).all()
+    user_ids = [row[0] for row in mismatched] if fix else []
+    for start in range(0, len(user_ids), _BULK_CHUNK):
+        await session.execute(
+            update(Wallet)
+            .where(Wallet.user_id.in_(user_ids[start : start + _BULK_CHUNK]))
+            .values(active_bonus_count=actual)
+            .execution_options(synchronize_session=False)
+        )
+    return [tuple(row) for row in mismatched]
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from apps.bot.db.models import IdempotencyKey
+from apps.bot.db.statements import insert_or_skip
+
+logger = logging.getLogger(__name__)
+
+# Value of a claimed key whose first request has not finished yet.
+_PENDING = ""
+
+_redis: Redis | None = None
+_ttl = 86_400
+# Used without Redis: key -> (expires at, value), oldest first.
+_local: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+
+class RequestInProgress(Exception):
+    """A request with the same idempotency key is still running."""
+
+
+def set_idempotency_store(redis: Redis | None, *, ttl: int = 86_400) -> None:
+    """Keep claimed keys and responses in `redis` (None: in this process only)."""
+    global _redis, _ttl
+    _redis = redis
+    _ttl = ttl
+    _local.clear()
+
+
+def _redis_key(key: str) -> str:
+    return f"idem:{key}"
+
+
+def _local_claim(key: str) -> str | None:
+    now = time.monotonic()
+    while _local:
+        oldest, (expires, _) = next(iter(_local.items()))
+        if expires > now:
+            break
+        del _local[oldest]
+    entry = _local.get(key)
+    if entry is not None:
+        return entry[1]
+    _local[key] = (now + _ttl, _PENDING)
+    return None
+
+
+async def _claim(key: str) -> str | None:
+    """Take `key` for this request: None if taken, else what the first request left."""
+    if _redis is None:
+        return _local_claim(key)
+    try:
+        while True:
+            if await _redis.set(_redis_key(key), _PENDING, nx=True, ex=_ttl):
+                return None
+            value = await _redis.get(_redis_key(key))
+            if value is not None:
+                return value
+    except RedisError:
+        # The unique row in the database still catches the duplicate.
+        logger.warning("idempotency store unavailable", exc_info=True)
+        return None
+
+
+async def _remember(key: str, response: dict) -> None:
+    value = json.dumps(response)
+    if _redis is None:
+        if key in _local:
+            _local[key] = (_local[key][0], value)
+        return
+    try:
+        await _redis.set(_redis_key(key), value, ex=_ttl)
+    except RedisError:
+        logger.warning("idempotency store unavailable", exc_info=True)
+
+
+async def _release(key: str) -> None:
+    if _redis is None:
+        _local.pop(key, None)
+        return
+    try:
+        await _redis.delete(_redis_key(key))
+    except RedisError:
+        logger.warning("idempotency store unavailable", exc_info=True)
+
+
+async def run_once(
+    session: AsyncSession,
+    key: str,
+    operation: Callable[[], Awaitable[dict]],
+) -> tuple[dict, bool]:
+    """Run `operation` once per `key`, commit, and return `(response, replayed)`.
+
+    A repeated key is answered from Redis (or this process's memory) with
+    the first run's response before the database is touched; a key that is
+    still running raises `RequestInProgress`. The `idempotency_keys` row,
+    inserted in the operation's transaction, settles duplicates the fast
+    path missed. A failed operation releases the key so it can be retried.
+
+    `operation` must not commit: the row is committed together with its
+    response, so a committed key always has one to replay. The response
+    must be JSON-serialisable.
+    """
+    cached = await _claim(key)
+    if cached == _PENDING:
+        raise RequestInProgress(key)
+    if cached is not None:
+        return json.loads(cached), True
+
+    try:
+        inserted = await session.scalar(
+            insert_or_skip(session, IdempotencyKey, {"key": key}).returning(IdempotencyKey.key)
+        )
+        if inserted is None:
+            stored = await session.scalar(select(IdempotencyKey.response).where(IdempotencyKey.key == key))
+            if stored is None:
+                # Only rows left by operations that committed on their own
+                # lack a response; they go with purge_expired.
+                raise RequestInProgress(key)
+            await _remember(key, stored)
+            return stored, True
+        response = await operation()
+        await session.execute(update(IdempotencyKey).where(IdempotencyKey.key == key).values(response=response))
+        await session.commit()
+    except BaseException:
+        await _release(key)
+        raise
+    await _remember(key, response)
+    return response, False
+
+
+async def purge_expired(session: AsyncSession, *, limit: int = 1_000) -> int:
+    """Delete up to `limit` key rows older than the key TTL; returns how many went.
+
+    Replays past the TTL run the request again, as they would once Redis
+    forgot the key.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=_ttl)
+    expired = select(IdempotencyKey.key).where(IdempotencyKey.created_at < cutoff).limit(limit)
+    result = await session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired.scalar_subquery())))
+    await session.commit()
+    return result.rowcount
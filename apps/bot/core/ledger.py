@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import json
+
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import ORMExecuteState, Session, SessionTransaction
+from sqlalchemy.util import await_only
+
+from apps.bot.db.models import Ledger
+
+# Batches at least this large go through COPY on asyncpg; smaller ones are
+# cheaper as a single multi-row INSERT.
+COPY_MIN_ROWS = 1_000
+
+_PENDING_KEY = "ledger_pending"
+_COLUMNS = ("user_id", "currency", "amount", "reason", "award_id", "payload")
+
+
+def add_entry(
+    session,
+    user_id: int,
+    currency: str,
+    amount: int,
+    reason: str,
+    *,
+    award_id: int | None = None,
+    payload: dict | None = None,
+) -> None:
+    """Queue a ledger row for the session's transaction; nothing is written yet.
+
+    Rows are kept as plain tuples (no `Ledger` objects, no unit of work) and
+    written together when the transaction commits, or earlier if the session
+    selects from the ledger. A rollback drops them. Savepoints are not
+    tracked: call `flush_ledger` before `begin_nested` if that matters.
+    """
+    pending(session).append((user_id, currency, amount, reason, award_id, payload))
+
+
+def pending(session) -> list[tuple]:
+    info = session.info
+    rows = info.get(_PENDING_KEY)
+    if rows is None:
+        rows = info[_PENDING_KEY] = []
+    return rows
+
+
+def flush_ledger(session: Session) -> int:
+    """Write the queued rows of a (sync) session now; returns how many were written."""
+    rows = session.info.get(_PENDING_KEY)
+    if not rows:
+        return 0
+    session.info[_PENDING_KEY] = []
+    connection = session.connection()
+    if len(rows) >= COPY_MIN_ROWS and connection.dialect.driver == "asyncpg":
+        _copy_rows(connection, rows)
+    else:
+        connection.execute(insert(Ledger.__table__), [dict(zip(_COLUMNS, row)) for row in rows])
+    return len(rows)
+
+
+def _copy_rows(connection: Connection, rows: list[tuple]) -> None:
+    # Same connection and transaction as the session. asyncpg takes JSONB as
+    # text; None becomes JSON null, as the INSERT path stores it.
+    driver = connection.connection.driver_connection
+    records = [(*row[:5], json.dumps(row[5])) for row in rows]
+    await_only(driver.copy_records_to_table(Ledger.__tablename__, records=records, columns=list(_COLUMNS)))
+
+
+@event.listens_for(Session, "before_commit")
+def _write_before_commit(session: Session) -> None:
+    if session.info.get(_PENDING_KEY):
+        # Rows referencing objects still pending in the unit of work go in after them.
+        session.flush()
+        flush_ledger(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _write_before_ledger_reads(state: ORMExecuteState) -> None:
+    if state.is_select and state.session.info.get(_PENDING_KEY):
+        if any(mapper.class_ is Ledger for mapper in state.all_mappers):
+            flush_ledger(state.session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_uncommitted(session: Session, transaction: SessionTransaction) -> None:
+    # After a commit the queue is already empty; anything left was rolled back.
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
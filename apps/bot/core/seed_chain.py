@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import mmap
+import secrets
+from functools import lru_cache
+from pathlib import Path
+
+LINK_SIZE = 32
+
+
+def next_link(seed: str) -> str:
+    """Hash a round seed into the seed of the round before it.
+
+    This is the same formula as `CrashRound.seed_hash`, so for consecutive
+    rounds `seed_hash(n + 1) == seed(n)` and anyone can walk the chain back.
+    """
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+# Crash point derivations, stored per round in `crash_rounds.crash_point_version`.
+CRASH_POINT_SHA256 = 1  # plain sha256(seed): every round created before the HMAC switch
+CRASH_POINT_HMAC = 2
+
+
+def crash_point_from_seed(seed: str, salt: str = "", version: int = CRASH_POINT_HMAC) -> float:
+    """Derive the crash point of a round from its seed.
+
+    Keyed with the seed (HMAC) rather than hashed plainly: a plain SHA-256 of
+    the seed is the published `seed_hash`, which would leak the crash point
+    while bets are still open. `CRASH_POINT_SHA256` reproduces the old formula
+    so rounds played before the switch still verify.
+    """
+    if version == CRASH_POINT_SHA256:
+        digest = hashlib.sha256(seed.encode()).hexdigest()
+    elif version == CRASH_POINT_HMAC:
+        digest = hmac.new(seed.encode(), salt.encode(), hashlib.sha256).hexdigest()
+    else:
+        raise ValueError(f"unknown crash point version {version}")
+    value = int(digest[:13], 16)
+    if value == 0:
+        return 1.0
+    base = (2**52 - value % (2**52)) / 2**52
+    return max(1.01, round(base * 20, 2))
+
+
+def generate_chain(path: str | Path, length: int, *, terminal_seed: str | None = None) -> str:
+    """Write a reverse hash chain of `length` links to `path`.
+
+    Links are stored as raw 32-byte digests in the order rounds consume them:
+    link 0 is played first and the random terminal seed last. Returns the
+    commitment `next_link(link 0)` that can be published before round 0.
+    """
+    if length <= 0:
+        raise ValueError("length must be positive")
+    seed = terminal_seed or secrets.token_hex(LINK_SIZE)
+    path = Path(path)
+    with path.open("wb") as fh:
+        fh.truncate(length * LINK_SIZE)
+    with path.open("r+b") as fh, mmap.mmap(fh.fileno(), 0) as buf:
+        for index in range(length - 1, -1, -1):
+            offset = index * LINK_SIZE
+            buf[offset : offset + LINK_SIZE] = bytes.fromhex(seed)
+            seed = next_link(seed)
+        buf.flush()
+    return seed
+
+
+# (round id, seed, seed_hash, stored crash point, chain index, crash point version)
+RoundRow = tuple[int, str, str, float, "int | None", int]
+
+
+def verify_rounds(rows: list[RoundRow], previous: RoundRow | None = None, salt: str = "") -> list[dict]:
+    """Recompute hashes and crash points for consecutive revealed rounds.
+
+    `previous` is the row just before `rows[0]`, so chunks can be verified
+    independently and still check the link across the chunk boundary.
+    `linkValid` is None when the previous row is not the preceding chain link.
+    """
+    results = []
+    for row in rows:
+        round_id, seed, seed_hash, stored_point, chain_index, version = row
+        recomputed = crash_point_from_seed(seed, salt, version)
+        link_valid = None
+        if chain_index is not None and previous is not None and previous[4] == chain_index - 1:
+            link_valid = next_link(seed) == previous[1]
+        results.append(
+            {
+                "roundId": round_id,
+                "chainIndex": chain_index,
+                "crashPointVersion": version,
+                "seed": seed,
+                "seedHash": seed_hash,
+                "crashPoint": float(stored_point),
+                "recomputedCrashPoint": recomputed,
+                "hashValid": next_link(seed) == seed_hash,
+                "crashPointValid": abs(recomputed - float(stored_point)) < 1e-9,
+                "linkValid": link_valid,
+            }
+        )
+        previous = row
+    return results
+
+
+class SeedChain:
+    """Read-only memory-mapped view of a chain written by `generate_chain`."""
+
+    def __init__(self, path: str | Path) -> None:
+        self._file = Path(path).open("rb")
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buf) % LINK_SIZE:
+            self.close()
+            raise ValueError(f"Seed chain {path} is not a multiple of {LINK_SIZE} bytes")
+        self.length = len(self._buf) // LINK_SIZE
+
+    def seed_at(self, index: int) -> str:
+        if not 0 <= index < self.length:
+            raise IndexError(f"seed chain index {index} out of range (length {self.length})")
+        offset = index * LINK_SIZE
+        return self._buf[offset : offset + LINK_SIZE].hex()
+
+    def commitment(self) -> str:
+        return next_link(self.seed_at(0))
+
+    def close(self) -> None:
+        self._buf.close()
+        self._file.close()
+
+
+@lru_cache(maxsize=4)
+def load_seed_chain(path: str) -> SeedChain:
+    return SeedChain(path)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, SessionTransaction
+from sqlalchemy.util import await_only
+
+from apps.bot.db.models import Wallet
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "wallet_cache_pending"
+_COMMITTED_KEY = "wallet_cache_committed"
+_FIELDS = ("coins_cash", "coins_bonus", "free_spins_left", "version")
+_BALANCE_FIELDS = _FIELDS[:3]
+
+# Wallets per EVAL; a large write-through goes out as one pipeline of these.
+_CHUNK = 500
+
+# KEYS: wallet hashes; ARGV: ttl, then _FIELDS values per key. A hash is
+# only overwritten by a strictly newer version.
+_COMPARE_AND_SET = """
+local ttl = tonumber(ARGV[1])
+local written = 0
+for i, key in ipairs(KEYS) do
+    local at = 2 + (i - 1) * 4
+    local cached = redis.call('HGET', key, 'version')
+    if not cached or tonumber(cached) < tonumber(ARGV[at + 3]) then
+        redis.call('HSET', key, 'coins_cash', ARGV[at], 'coins_bonus', ARGV[at + 1],
+            'free_spins_left', ARGV[at + 2], 'version', ARGV[at + 3])
+        redis.call('EXPIRE', key, ttl)
+        written = written + 1
+    end
+end
+return written
+"""
+
+_redis: Redis | None = None
+_compare_and_set = None
+_ttl = 300
+
+
+@dataclass(frozen=True)
+class WalletBalance:
+    """Read-only balances of a wallet, for display only.
+
+    Never base a debit on it: debits lock and read the wallet row itself.
+    """
+
+    user_id: int
+    coins_cash: int
+    coins_bonus: int
+    free_spins_left: int
+    version: int
+
+    @classmethod
+    def of(cls, wallet: Wallet) -> WalletBalance:
+        return cls(wallet.user_id, wallet.coins_cash, wallet.coins_bonus, wallet.free_spins_left, wallet.version)
+
+
+def set_wallet_cache(redis: Redis | None, *, ttl: int = 300) -> None:
+    """Serve balance reads from `redis` (None turns the cache off)."""
+    global _redis, _compare_and_set, _ttl
+    _redis = redis
+    _compare_and_set = redis.register_script(_COMPARE_AND_SET) if redis is not None else None
+    _ttl = ttl
+
+
+def enabled() -> bool:
+    return _redis is not None
+
+
+def _key(user_id: int) -> str:
+    return f"wallet:{user_id}"
+
+
+def stage(session, balance: WalletBalance) -> None:
+    """Remember balances written by the session's transaction; cached once it commits."""
+    pending = session.info.get(_PENDING_KEY)
+    if pending is None:
+        pending = session.info[_PENDING_KEY] = {}
+    pending[balance.user_id] = balance
+
+
+def staged(session, user_id: int) -> WalletBalance | None:
+    pending = session.info.get(_PENDING_KEY)
+    return pending.get(user_id) if pending else None
+
+
+async def load(user_id: int) -> WalletBalance | None:
+    if _redis is None:
+        return None
+    try:
+        values = await _redis.hgetall(_key(user_id))
+    except RedisError:
+        logger.warning("wallet cache read failed", exc_info=True)
+        return None
+    if len(values) != len(_FIELDS):
+        return None
+    return WalletBalance(user_id, *(int(values[name]) for name in _FIELDS))
+
+
+async def store(balances: list[WalletBalance]) -> int:
+    """Cache each balance unless the cache already holds its or a newer version.
+
+    The compare-and-set runs in Lua, so write-throughs of concurrent
+    transactions and read-through fills may land in any order and the
+    highest version wins, without WATCH retries. All balances go out in one
+    pipeline round trip; returns how many entries were written.
+    """
+    if _redis is None or not balances:
+        return 0
+    async with _redis.pipeline(transaction=False) as pipe:
+        for start in range(0, len(balances), _CHUNK):
+            chunk = balances[start : start + _CHUNK]
+            args = [_ttl]
+            for balance in chunk:
+                args.extend(getattr(balance, name) for name in _FIELDS)
+            await _compare_and_set(keys=[_key(balance.user_id) for balance in chunk], args=args, client=pipe)
+        return sum(await pipe.execute())
+
+
+async def publish(balances: list[WalletBalance]) -> None:
+    try:
+        await store(balances)
+    except RedisError:
+        # The entries may now lag the database until their TTL runs out.
+        logger.warning("wallet cache write-through failed for %d wallets", len(balances), exc_info=True)
+
+
+async def _invalidate(user_ids: list[int]) -> None:
+    try:
+        await _redis.delete(*(_key(user_id) for user_id in user_ids))
+    except RedisError:
+        logger.warning("wallet cache invalidation failed", exc_info=True)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_versions(session: Session, flush_context, instances) -> None:
+    for obj in session.dirty:
+        if isinstance(obj, Wallet):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _BALANCE_FIELDS):
+                obj.version = obj.version + 1
+
+
+@event.listens_for(Session, "after_flush")
+def _stage_flushed(session: Session, flush_context) -> None:
+    # `new`, `dirty` and attribute history still describe what was just flushed.
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Wallet):
+            state = inspect(obj)
+            if obj in session.new or state.attrs["version"].history.has_changes():
+                stage(session, WalletBalance.of(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session: Session) -> None:
+    # The connection is still checked out here; Redis waits for
+    # after_transaction_end, which runs once it is back in the pool.
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        session.info[_COMMITTED_KEY] = pending
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _write_through(session: Session, transaction: SessionTransaction) -> None:
+    if transaction.parent is not None:
+        return
+    committed = session.info.pop(_COMMITTED_KEY, None)
+    # Anything still staged was rolled back. Those entries are dropped too,
+    # in case the commit itself failed without telling whether it went through.
+    rolled_back = session.info.pop(_PENDING_KEY, None)
+    if _redis is None:
+        return
+    if committed:
+        await_only(publish(list(committed.values())))
+    if rolled_back:
+        await_only(_invalidate(list(rolled_back)))
@@ -3,12 +3,20 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Literal
 
-from sqlalchemy import select
+from sqlalchemy import BigInteger, bindparam, case, false, func, inspect, literal, select, true, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 
-from apps.bot.db.models import BonusAward, BonusAwardStatus, Ledger, Wallet
+from apps.bot.core import ledger, wallet_cache
+from apps.bot.core.wallet_cache import WalletBalance
+from apps.bot.db.models import Wallet
 
 Currency = Literal["coins_cash", "coins_bonus"]
+Prefer = Literal["cash_first", "bonus_first", "auto_bonus_when_active"]
+
+# Trailing RETURNING columns of every wallet UPDATE, in WalletBalance order.
+_BALANCE_COLUMNS = (Wallet.coins_cash, Wallet.coins_bonus, Wallet.free_spins_left, Wallet.version)
 
 
 class WalletError(Exception):
@@ -37,6 +45,56 @@ async def _get_or_create_wallet(session: AsyncSession, user_id: int, *, for_upda
     return wallet
 
 
+def _loaded_wallet(session: AsyncSession, user_id: int) -> Wallet | None:
+    return session.sync_session.identity_map.get(identity_key(Wallet, user_id))
+
+
+def _sync_loaded_wallet(session: AsyncSession, balance: WalletBalance) -> None:
+    # Statement-level updates bypass the unit of work; a Wallet already loaded
+    # in the session gets the new balances instead of being expired (an
+    # expired attribute would need lazy IO under asyncio).
+    wallet = _loaded_wallet(session, balance.user_id)
+    if wallet is not None:
+        set_committed_value(wallet, "coins_cash", balance.coins_cash)
+        set_committed_value(wallet, "coins_bonus", balance.coins_bonus)
+        set_committed_value(wallet, "version", balance.version)
+
+
+async def _update_wallet(session: AsyncSession, user_id: int, statement) -> tuple | None:
+    """Run a wallet UPDATE returning `(…, *_BALANCE_COLUMNS)`; None if no row matched."""
+    row = (await session.execute(statement.execution_options(synchronize_session=False))).first()
+    if row is None:
+        return None
+    balance = WalletBalance(user_id, *row[-len(_BALANCE_COLUMNS):])
+    _sync_loaded_wallet(session, balance)
+    wallet_cache.stage(session, balance)
+    return tuple(row)
+
+
+async def _credit(session: AsyncSession, user_id: int, currency: Currency, amount: int) -> int:
+    """Add `amount` to one balance and return it, in one UPDATE … RETURNING where supported.
+
+    The row lock is only taken by the UPDATE itself instead of by a SELECT
+    FOR UPDATE held across the Python side. Missing wallets (and dialects
+    without UPDATE … RETURNING) go through the ORM.
+    """
+    if session.get_bind().dialect.update_returning:
+        column = getattr(Wallet, currency)
+        row = await _update_wallet(
+            session,
+            user_id,
+            update(Wallet)
+            .where(Wallet.user_id == user_id)
+            .values({currency: column + amount, "version": Wallet.version + 1})
+            .returning(*_BALANCE_COLUMNS),
+        )
+        if row is not None:
+            return row[0] if currency == "coins_cash" else row[1]
+    wallet = await _get_or_create_wallet(session, user_id, for_update=True)
+    setattr(wallet, currency, getattr(wallet, currency) + amount)
+    return getattr(wallet, currency)
+
+
 async def _add_ledger_entry(
     session: AsyncSession,
     user_id: int,
@@ -47,15 +105,7 @@ async def _add_ledger_entry(
     award_id: int | None = None,
     metadata: dict | None = None,
 ) -> None:
-    entry = Ledger(
-        user_id=user_id,
-        currency=currency,
-        amount=amount,
-        reason=reason,
-        award_id=award_id,
-        payload=metadata,
-    )
-    session.add(entry)
+    ledger.add_entry(session, user_id, currency, amount, reason, award_id=award_id, payload=metadata)
 
 
 async def add_coins_cash(
@@ -68,10 +118,56 @@ async def add_coins_cash(
 ) -> int:
     if amount <= 0:
         raise ValueError("amount must be positive")
-    wallet = await _get_or_create_wallet(session, user_id, for_update=True)
-    wallet.coins_cash += amount
+    balance = await _credit(session, user_id, "coins_cash", amount)
     await _add_ledger_entry(session, user_id, "coins_cash", amount, reason, metadata=metadata)
-    return wallet.coins_cash
+    return balance
+
+
+async def add_coins_cash_bulk(
+    session: AsyncSession,
+    credits: list[tuple[int, int, dict | None]],
+    *,
+    reason: str = "credit",
+) -> dict[int, Wallet]:
+    """Credit `(user_id, amount, metadata)` entries to existing wallets in one pass.
+
+    One executemany UPDATE for the balances and one reload of the touched
+    wallets, which is returned keyed by user id; the ledger rows join the
+    transaction's batch.
+    """
+    totals: dict[int, int] = {}
+    for user_id, amount, _ in credits:
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        totals[user_id] = totals.get(user_id, 0) + amount
+    if not totals:
+        return {}
+
+    wallets_table = Wallet.__table__
+    # Sorted so concurrent batches lock wallet rows in the same order.
+    await session.execute(
+        update(wallets_table)
+        .where(wallets_table.c.user_id == bindparam("b_user_id"))
+        .values(
+            coins_cash=wallets_table.c.coins_cash + bindparam("b_amount"),
+            version=wallets_table.c.version + 1,
+        ),
+        [{"b_user_id": user_id, "b_amount": amount} for user_id, amount in sorted(totals.items())],
+    )
+    for user_id, amount, metadata in credits:
+        ledger.add_entry(session, user_id, "coins_cash", amount, reason, payload=metadata)
+    wallets = (
+        await session.scalars(
+            select(Wallet)
+            .where(Wallet.user_id.in_(list(totals)))
+            .execution_options(populate_existing=True)
+        )
+    ).all()
+    if len(wallets) != len(totals):
+        raise WalletError("wallet not found")
+    for wallet in wallets:
+        wallet_cache.stage(session, WalletBalance.of(wallet))
+    return {wallet.user_id: wallet for wallet in wallets}
 
 
 async def add_coins_bonus(
@@ -85,8 +181,7 @@ async def add_coins_bonus(
 ) -> int:
     if amount <= 0:
         raise ValueError("amount must be positive")
-    wallet = await _get_or_create_wallet(session, user_id, for_update=True)
-    wallet.coins_bonus += amount
+    balance = await _credit(session, user_id, "coins_bonus", amount)
     await _add_ledger_entry(
         session,
         user_id,
@@ -96,17 +191,92 @@ async def add_coins_bonus(
         award_id=award_id,
         metadata=metadata,
     )
-    return wallet.coins_bonus
+    return balance
+
+
+async def adjust_active_bonuses(session: AsyncSession, user_id: int, delta: int) -> int:
+    """Move the wallet's count of ACTIVE/READY bonus awards by `delta`; returns the new count.
+
+    Callers changing an award's status in or out of those two call this in
+    the same transaction.
+    """
+    if session.get_bind().dialect.update_returning:
+        count = await session.scalar(
+            update(Wallet)
+            .where(Wallet.user_id == user_id)
+            .values(active_bonus_count=Wallet.active_bonus_count + delta)
+            .returning(Wallet.active_bonus_count)
+            .execution_options(synchronize_session=False)
+        )
+        if count is not None:
+            wallet = _loaded_wallet(session, user_id)
+            if wallet is not None:
+                set_committed_value(wallet, "active_bonus_count", count)
+            return count
+    wallet = await _get_or_create_wallet(session, user_id, for_update=True)
+    wallet.active_bonus_count += delta
+    return wallet.active_bonus_count
+
 
+async def has_active_bonuses(session: AsyncSession, user_id: int) -> bool:
+    """Whether the wallet counts any ACTIVE/READY award.
 
-async def _has_active_bonus(session: AsyncSession, user_id: int) -> bool:
-    result = await session.scalar(
-        select(BonusAward.id).where(
-            BonusAward.user_id == user_id,
-            BonusAward.status.in_([BonusAwardStatus.ACTIVE.value, BonusAwardStatus.READY.value]),
+    The counter is read from the row: a Wallet the session loaded in an
+    earlier transaction (sessions do not expire on commit) may predate
+    awards other transactions created. A loaded Wallet gets the fresh value.
+    """
+    count = await session.scalar(select(Wallet.active_bonus_count).where(Wallet.user_id == user_id))
+    if count is None:
+        return False
+    wallet = _loaded_wallet(session, user_id)
+    if wallet is not None:
+        set_committed_value(wallet, "active_bonus_count", count)
+    return count > 0
+
+
+def _debit_statement(user_id: int, amount: int, prefer: Prefer):
+    """UPDATE debiting `amount` with the cash/bonus split computed in SQL (PostgreSQL).
+
+    A CTE locks the row and keeps its pre-update balances, so one round trip
+    checks the funds, applies the split and reports it through RETURNING
+    as `(cash taken, *_BALANCE_COLUMNS)`; no row means too few coins.
+    """
+    if prefer == "bonus_first":
+        bonus_first = true()
+    elif prefer == "auto_bonus_when_active":
+        bonus_first = Wallet.active_bonus_count > 0
+    else:
+        bonus_first = false()
+    old = (
+        select(Wallet.user_id, Wallet.coins_cash, Wallet.coins_bonus, bonus_first.label("bonus_first"))
+        .where(Wallet.user_id == user_id)
+        .with_for_update()
+        .cte("old_wallet")
+    )
+    amount = literal(amount, BigInteger)
+    cash = case(
+        (old.c.bonus_first, amount - func.least(old.c.coins_bonus, amount)),
+        else_=func.least(old.c.coins_cash, amount),
+    )
+    return (
+        update(Wallet)
+        .where(Wallet.user_id == old.c.user_id, old.c.coins_cash + old.c.coins_bonus >= amount)
+        .values(
+            coins_cash=old.c.coins_cash - cash,
+            coins_bonus=old.c.coins_bonus - (amount - cash),
+            version=Wallet.version + 1,
         )
+        .returning(cash, *_BALANCE_COLUMNS)
     )
-    return result is not None
+
+
+async def _debit_in_one_statement(
+    session: AsyncSession, user_id: int, amount: int, prefer: Prefer
+) -> WalletConsumption:
+    row = await _update_wallet(session, user_id, _debit_statement(user_id, amount, prefer))
+    if row is None:
+        raise InsufficientFunds("not enough coins")
+    return WalletConsumption(cash=row[0], bonus=amount - row[0])
 
 
 async def consume_coins(
@@ -114,13 +284,30 @@ async def consume_coins(
     user_id: int,
     amount: int,
     *,
-    prefer: Literal["cash_first", "bonus_first", "auto_bonus_when_active"] = "cash_first",
+    prefer: Prefer = "cash_first",
     reason: str = "bet",
     metadata: dict | None = None,
 ) -> WalletConsumption:
     if amount <= 0:
         raise ValueError("amount must be positive")
+    if prefer not in ("cash_first", "bonus_first", "auto_bonus_when_active"):
+        raise ValueError("unknown prefer value")
+
+    if session.get_bind().dialect.name == "postgresql":
+        consumption = await _debit_in_one_statement(session, user_id, amount, prefer)
+    else:
+        consumption = await _debit_with_row_lock(session, user_id, amount, prefer)
+    if consumption.cash:
+        await _add_ledger_entry(session, user_id, "coins_cash", -consumption.cash, reason, metadata=metadata)
+    if consumption.bonus:
+        await _add_ledger_entry(session, user_id, "coins_bonus", -consumption.bonus, reason, metadata=metadata)
+    return consumption
+
 
+async def _debit_with_row_lock(
+    session: AsyncSession, user_id: int, amount: int, prefer: Prefer
+) -> WalletConsumption:
+    """ORM fallback for dialects whose RETURNING cannot see the pre-update row (SQLite)."""
     wallet = await _get_or_create_wallet(session, user_id, for_update=True)
     available_total = wallet.coins_cash + wallet.coins_bonus
     if available_total < amount:
@@ -130,9 +317,7 @@ async def consume_coins(
     if prefer == "bonus_first":
         use_bonus_first = True
     elif prefer == "auto_bonus_when_active":
-        use_bonus_first = await _has_active_bonus(session, user_id)
-    elif prefer != "cash_first":
-        raise ValueError("unknown prefer value")
+        use_bonus_first = wallet.active_bonus_count > 0
 
     bonus_used = 0
     cash_used = 0
@@ -154,12 +339,6 @@ async def consume_coins(
 
     wallet.coins_cash -= cash_used
     wallet.coins_bonus -= bonus_used
-
-    if cash_used:
-        await _add_ledger_entry(session, user_id, "coins_cash", -cash_used, reason, metadata=metadata)
-    if bonus_used:
-        await _add_ledger_entry(session, user_id, "coins_bonus", -bonus_used, reason, metadata=metadata)
-
     return WalletConsumption(cash=cash_used, bonus=bonus_used)
 
 
@@ -167,5 +346,21 @@ async def get_wallet(session: AsyncSession, user_id: int, *, for_update: bool =
     return await _get_or_create_wallet(session, user_id, for_update=for_update)
 
 
-async def get_wallet_balance(session: AsyncSession, user_id: int) -> Wallet:
-    return await get_wallet(session, user_id, for_update=False)
+async def get_wallet_balance(session: AsyncSession, user_id: int) -> WalletBalance:
+    """Balances to show the user, without a query when the wallet cache has them.
+
+    The session's own uncommitted view wins (a wallet it has loaded, or
+    balances it has written), then the cache, then the database, which
+    also fills the cache. Debits never use this: they lock the row.
+    """
+    wallet = _loaded_wallet(session, user_id)
+    if wallet is not None and not inspect(wallet).unloaded.intersection(("coins_cash", "coins_bonus", "version")):
+        return WalletBalance.of(wallet)
+    balance = wallet_cache.staged(session, user_id) or await wallet_cache.load(user_id)
+    if balance is not None:
+        return balance
+    balance = WalletBalance.of(await get_wallet(session, user_id, for_update=False))
+    # A wallet created by this transaction is cached once it commits.
+    if wallet_cache.enabled() and wallet_cache.staged(session, user_id) is None:
+        await wallet_cache.publish([balance])
+    return balance
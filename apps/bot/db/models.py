@@ -7,6 +7,7 @@ from sqlalchemy import BigInteger, Boolean, CheckConstraint, DateTime, ForeignKe
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from apps.bot.core.seed_chain import CRASH_POINT_HMAC
 from apps.bot.db import Base
 
 JSONType = JSON().with_variant(JSONB, "postgresql")
@@ -39,6 +40,11 @@ class Wallet(Base):
     coins_cash: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
     coins_bonus: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
     free_spins_left: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Bumped by every committed balance change; orders wallet cache writes.
+    version: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    # Bonus awards of this user in ACTIVE or READY status, kept in step by
+    # core.awards so bets can pick bonus-first without reading bonus_awards.
+    active_bonus_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now(), server_default=func.now(), onupdate=func.now(), nullable=False)
 
     user: Mapped[User] = relationship(back_populates="wallet")
@@ -53,6 +59,7 @@ class BonusAwardStatus(str, Enum):
 
 class BonusAward(Base):
     __tablename__ = "bonus_awards"
+    __table_args__ = (Index("ix_bonus_awards_user_status", "user_id", "status"),)
 
     id: Mapped[int] = mapped_column(PKBigInt, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(PKBigInt, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
@@ -256,19 +263,30 @@ class CrashRound(Base):
     __tablename__ = "crash_rounds"
     __table_args__ = (
         Index("ix_crash_rounds_status", "status"),
+        Index("ix_crash_rounds_room_id", "room", "id"),
+        # One live round per room.
         Index(
             "uq_crash_rounds_active",
-            "status",
+            "room",
             unique=True,
             sqlite_where=text("status IN ('betting','flying')"),
             postgresql_where=text("status IN ('betting','flying')"),
         ),
+        Index("uq_crash_rounds_chain_index", "chain_index", unique=True),
     )
 
     id: Mapped[int] = mapped_column(PKBigInt, primary_key=True, autoincrement=True)
+    room: Mapped[str] = mapped_column(String(32), nullable=False, default="main", server_default="main")
     status: Mapped[str] = mapped_column(String(16), nullable=False, default=CrashRoundStatus.BETTING.value, server_default=CrashRoundStatus.BETTING.value)
     seed: Mapped[str] = mapped_column(String(128), nullable=False)
     seed_hash: Mapped[str] = mapped_column(String(128), nullable=False)
+    chain_index: Mapped[int | None] = mapped_column(BigInteger)
+    # Formula that derived `crash_point` from the seed (see core.seed_chain).
+    crash_point_version: Mapped[int] = mapped_column(
+        SmallInteger, nullable=False, default=CRASH_POINT_HMAC, server_default=str(CRASH_POINT_HMAC)
+    )
+    # Fencing token of the round-loop leader that last mutated the row.
+    leader_epoch: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
     crash_point: Mapped[float | None] = mapped_column(Numeric(10, 4))
     bet_ends_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     crash_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -279,6 +297,15 @@ class CrashRound(Base):
     bets: Mapped[list["CrashBet"]] = relationship(back_populates="round")
 
 
+class CrashChainCursor(Base):
+    """Next unused index of the crash seed chain, shared by every room (a single row)."""
+
+    __tablename__ = "crash_chain_cursor"
+
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    next_index: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
 class CrashBet(Base):
     __tablename__ = "crash_bets"
     __table_args__ = (
@@ -318,3 +345,13 @@ class Payment(Base):
     state: Mapped[str] = mapped_column(String(16), nullable=False, default="WAITING", server_default="WAITING")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+class IdempotencyKey(Base):
+    """Caller-supplied key of a wallet operation that already ran, with its response."""
+
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    response: Mapped[dict | None] = mapped_column(JSONType, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
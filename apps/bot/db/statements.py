@@ -0,0 +1,10 @@
+from __future__ import annotations
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def insert_or_skip(session: AsyncSession, model, values: dict):
+    """INSERT that does nothing when a unique constraint already holds the row."""
+    insert = postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+    return insert(model).values(values).on_conflict_do_nothing()
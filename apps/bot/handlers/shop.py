@@ -9,6 +9,7 @@ from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMar
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from apps.bot.core.awards import create_bonus_award, try_unlock_bonuses
+from apps.bot.core.idempotency import RequestInProgress, run_once
 from apps.bot.core.wallets import add_coins_cash, get_wallet_balance
 from apps.bot.infra.settings import get_settings
 from apps.bot.repositories.purchases import record_purchase
@@ -89,47 +90,60 @@ def create_router() -> Router:
         if package is None:
             await message.answer("Не удалось определить пакет, обратитесь в поддержку")
             return
-        user = await get_or_create_user(session, message.from_user)
-        purchase, created = await record_purchase(
-            session,
-            user_id=user.id,
-            charge_id=payment.provider_payment_charge_id,
-            product_code=package.id,
-            amount_xtr=payment.total_amount,
-            coins_granted=package.coins,
-            bonus_granted=package.bonus_coins,
-        )
-        if not created:
-            await message.answer("Эта оплата уже была учтена")
-            return
 
-        await add_coins_cash(
-            session,
-            user.id,
-            package.coins,
-            reason="purchase",
-            metadata={"charge_id": purchase.charge_id, "package": package.id},
-        )
+        async def credit_purchase() -> dict:
+            user = await get_or_create_user(session, message.from_user)
+            purchase, created = await record_purchase(
+                session,
+                user_id=user.id,
+                charge_id=payment.provider_payment_charge_id,
+                product_code=package.id,
+                amount_xtr=payment.total_amount,
+                coins_granted=package.coins,
+                bonus_granted=package.bonus_coins,
+            )
+            if not created:
+                return {"created": False}
 
-        if package.bonus_coins > 0:
-            await create_bonus_award(
+            await add_coins_cash(
                 session,
                 user.id,
-                kind=f"deposit_{package.id}",
-                granted=package.bonus_coins,
-                wr_mult=1.0,
-                cap_cashout=package.bonus_coins,
+                package.coins,
+                reason="purchase",
+                metadata={"charge_id": purchase.charge_id, "package": package.id},
             )
 
-        if user.first_deposit_at is None:
-            user.first_deposit_at = datetime.utcnow()
-            await try_unlock_bonuses(session, user.id)
-        await referral_service.try_activate_referral(session, user.id)
-
-        wallet = await get_wallet_balance(session, user.id)
+            if package.bonus_coins > 0:
+                await create_bonus_award(
+                    session,
+                    user.id,
+                    kind=f"deposit_{package.id}",
+                    granted=package.bonus_coins,
+                    wr_mult=1.0,
+                    cap_cashout=package.bonus_coins,
+                )
+
+            if user.first_deposit_at is None:
+                user.first_deposit_at = datetime.utcnow()
+                await try_unlock_bonuses(session, user.id)
+            await referral_service.try_activate_referral(session, user.id)
+
+            wallet = await get_wallet_balance(session, user.id)
+            return {"created": True, "cash": wallet.coins_cash, "bonus": wallet.coins_bonus}
+
+        # Redelivered payments are turned away before any database work.
+        try:
+            result, replayed = await run_once(session, f"purchase:{payment.provider_payment_charge_id}", credit_purchase)
+        except RequestInProgress:
+            # The first delivery is still crediting; it answers on its own.
+            await message.answer("Оплата ещё обрабатывается, коины скоро появятся на балансе")
+            return
+        if replayed or not result["created"]:
+            await message.answer("Эта оплата уже была учтена")
+            return
         await message.answer(
             f"Оплата успешна! +{package.coins} коинов.\n"
-            f"Текущий баланс: {wallet.coins_cash} cash / {wallet.coins_bonus} bonus",
+            f"Текущий баланс: {result['cash']} cash / {result['bonus']} bonus",
         )
 
     return router
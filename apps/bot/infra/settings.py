@@ -16,6 +16,7 @@ class Settings(BaseSettings):
     app_env: str = Field(default="dev", alias="APP_ENV")
     app_name: str = Field(default="emoji_casino", alias="APP_NAME")
     public_domain: str | None = Field(default=None, alias="PUBLIC_DOMAIN")
+    web_workers: int = Field(default=1, alias="WEB_WORKERS")
     bot_token_test: str = Field(default="", alias="BOT_TOKEN_TEST")
     bot_token_main: str = Field(default="", alias="BOT_TOKEN_MAIN")
     telegram_init_ttl: int = Field(default=60, alias="TELEGRAM_INIT_TTL")
@@ -55,6 +56,31 @@ class Settings(BaseSettings):
     crash_bet_max: int = Field(default=100_000, alias="CRASH_BET_MAX")
     crash_bet_duration_ms: int = Field(default=5000, alias="CRASH_BET_DURATION_MS")
     crash_round_duration_ms: int = Field(default=20000, alias="CRASH_ROUND_DURATION_MS")
+    crash_cooldown_ms: int = Field(default=1000, alias="CRASH_COOLDOWN_MS")
+    crash_cashout_batch_ms: int = Field(default=5, alias="CRASH_CASHOUT_BATCH_MS")
+    crash_cashout_batch_max: int = Field(default=500, alias="CRASH_CASHOUT_BATCH_MAX")
+    crash_seed_chain_path: str | None = Field(default=None, alias="CRASH_SEED_CHAIN_PATH")
+    crash_seed_salt: str = Field(default="", alias="CRASH_SEED_SALT")
+    crash_verify_max_rounds: int = Field(default=100_000, alias="CRASH_VERIFY_MAX_ROUNDS")
+    crash_ws_queue_size: int = Field(default=256, alias="CRASH_WS_QUEUE_SIZE")
+    crash_ws_overflow_policy: str = Field(default="drop_oldest", alias="CRASH_WS_OVERFLOW_POLICY")
+    crash_ws_send_timeout: float = Field(default=5.0, alias="CRASH_WS_SEND_TIMEOUT")
+    crash_ws_idle_timeout: float = Field(default=60.0, alias="CRASH_WS_IDLE_TIMEOUT")
+    crash_ws_reply_pong: bool = Field(default=True, alias="CRASH_WS_REPLY_PONG")
+    crash_ws_ping_interval: float = Field(default=20.0, alias="CRASH_WS_PING_INTERVAL")
+    crash_tick_hz: float = Field(default=10.0, alias="CRASH_TICK_HZ")
+    crash_event_bus: str = Field(default="pubsub", alias="CRASH_EVENT_BUS")
+    crash_event_stream_maxlen: int = Field(default=10_000, alias="CRASH_EVENT_STREAM_MAXLEN")
+    crash_presence_ttl: int = Field(default=30, alias="CRASH_PRESENCE_TTL")
+    crash_event_batch_ms: int = Field(default=5, alias="CRASH_EVENT_BATCH_MS")
+    crash_ws_hub_path: str = Field(default="/tmp/crash-ws-hub.sock", alias="CRASH_WS_HUB_PATH")
+    crash_leader_ttl_ms: int = Field(default=800, alias="CRASH_LEADER_TTL_MS")
+    # Extra crash rooms as JSON, e.g. {"high": {"bet_min": 1000, "bet_duration_ms": 8000}};
+    # omitted values come from the main room (the CRASH_* settings above).
+    crash_rooms: dict[str, dict[str, int]] = Field(default_factory=dict, alias="CRASH_ROOMS")
+    wallet_cache_ttl: int = Field(default=300, alias="WALLET_CACHE_TTL")
+    idempotency_ttl: int = Field(default=86_400, alias="IDEMPOTENCY_TTL")
+    idempotency_purge_interval: int = Field(default=600, alias="IDEMPOTENCY_PURGE_INTERVAL")
 
     @model_validator(mode="after")
     def _auto_disable_payments(self) -> "Settings":
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import logging
 from dataclasses import dataclass, field
 
 import uvicorn
@@ -9,7 +10,10 @@ from aiogram import Bot, Dispatcher
 from fastapi import FastAPI
 
 from apps.bot.api.http import router as http_router
+from apps.bot.core.idempotency import purge_expired, set_idempotency_store
+from apps.bot.core.wallet_cache import set_wallet_cache
 from apps.bot.ws.crash import router as crash_ws_router, CrashWebSocketManager
+from apps.bot.ws.local_hub import hold_host_lock
 from apps.bot.handlers import register_handlers
 from apps.bot.infra.db import Database
 from apps.bot.infra.logging import setup_logging
@@ -28,9 +32,12 @@ class BotRunner:
 
 settings = get_settings()
 setup_logging(settings.log_level)
+logger = logging.getLogger(__name__)
 
 database = Database(settings)
 redis = create_redis_pool(settings)
+set_wallet_cache(redis, ttl=settings.wallet_cache_ttl)
+set_idempotency_store(redis, ttl=settings.idempotency_ttl)
 crash_ws_manager = CrashWebSocketManager(database, redis)
 
 
@@ -54,6 +61,26 @@ def build_bot_runners() -> list[BotRunner]:
 bot_runners = build_bot_runners()
 
 
+async def start_bot_polling() -> None:
+    # With several uvicorn workers only one of them may poll Telegram.
+    if settings.web_workers > 1:
+        await hold_host_lock(f"{settings.crash_ws_hub_path}.bots")
+    for runner in bot_runners:
+        runner.task = asyncio.create_task(runner.dispatcher.start_polling(runner.bot))
+
+
+async def purge_idempotency_keys() -> None:
+    while True:
+        await asyncio.sleep(settings.idempotency_purge_interval)
+        try:
+            async with database.session() as session:
+                # Batches keep each DELETE short after a long downtime.
+                while await purge_expired(session):
+                    pass
+        except Exception:
+            logger.exception("idempotency key purge failed")
+
+
 def build_app() -> FastAPI:
     app = FastAPI(title=settings.app_name)
     app.state.database = database
@@ -62,15 +89,21 @@ def build_app() -> FastAPI:
     app.include_router(http_router)
     app.include_router(crash_ws_router)
 
+    background: list[asyncio.Task] = []
+
     @app.on_event("startup")
     async def on_startup() -> None:
-        for runner in bot_runners:
-            runner.task = asyncio.create_task(runner.dispatcher.start_polling(runner.bot))
+        background.append(asyncio.create_task(start_bot_polling()))
+        background.append(asyncio.create_task(purge_idempotency_keys()))
         await crash_ws_manager.start()
 
     @app.on_event("shutdown")
     async def on_shutdown() -> None:
         await crash_ws_manager.stop()
+        for task in background:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
         for runner in bot_runners:
             if runner.task:
                 runner.task.cancel()
@@ -87,4 +120,15 @@ app = build_app()
 
 
 if __name__ == "__main__":
-    uvicorn.run("apps.bot.main:app", host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "apps.bot.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=settings.web_workers,
+        # Protocol-level ping/pong is handled by uvicorn and only drops peers
+        # that stop answering; the pongs never reach the app, so clients must
+        # still send app-level messages (e.g. {"type":"ping"}) more often
+        # than CRASH_WS_IDLE_TIMEOUT. CRASH_WS_PING_INTERVAL=0 turns it off.
+        ws_ping_interval=settings.crash_ws_ping_interval or None,
+        ws_ping_timeout=settings.crash_ws_ping_interval or None,
+    )
@@ -4,6 +4,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from apps.bot.db.models import Purchase
+from apps.bot.db.statements import insert_or_skip
 
 
 async def record_purchase(
@@ -16,19 +17,23 @@ async def record_purchase(
     coins_granted: int,
     bonus_granted: int,
 ) -> tuple[Purchase, bool]:
-    existing = await session.scalar(select(Purchase).where(Purchase.charge_id == charge_id))
-    if existing is not None:
-        return existing, False
-
-    purchase = Purchase(
-        user_id=user_id,
-        charge_id=charge_id,
-        product_code=product_code,
-        amount_xtr=amount_xtr,
-        coins_granted=coins_granted,
-        bonus_granted=bonus_granted,
-        status="completed",
+    # The unique charge_id decides; a known charge costs one more SELECT, a new one none.
+    purchase = await session.scalar(
+        insert_or_skip(
+            session,
+            Purchase,
+            {
+                "user_id": user_id,
+                "charge_id": charge_id,
+                "product_code": product_code,
+                "amount_xtr": amount_xtr,
+                "coins_granted": coins_granted,
+                "bonus_granted": bonus_granted,
+                "status": "completed",
+            },
+        ).returning(Purchase)
     )
-    session.add(purchase)
-    await session.flush()
-    return purchase, True
+    if purchase is not None:
+        return purchase, True
+    existing = await session.scalar(select(Purchase).where(Purchase.charge_id == charge_id))
+    return existing, False
@@ -1,28 +1,73 @@
 from __future__ import annotations
 
-import hashlib
+import asyncio
+import heapq
+import logging
 import math
 import secrets
-from dataclasses import asdict, dataclass
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime, timedelta, timezone
-from typing import Awaitable, Callable
+from typing import AsyncContextManager, Awaitable, Callable
 
-from sqlalchemy import desc, select
+from sqlalchemy import desc, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from apps.bot.core.awards import apply_turnover
-from apps.bot.core.wallets import add_coins_cash, consume_coins, get_wallet_balance
+from apps.bot.core.awards import apply_turnover, apply_turnover_bulk
+from apps.bot.core.seed_chain import CRASH_POINT_HMAC, crash_point_from_seed, load_seed_chain, next_link
+from apps.bot.core.wallets import add_coins_cash, add_coins_cash_bulk, consume_coins, get_wallet_balance
 from apps.bot.db.models import (
     CrashBet,
     CrashBetStatus,
+    CrashChainCursor,
     CrashRound,
     CrashRoundStatus,
     User,
 )
+from apps.bot.db.statements import insert_or_skip
 from apps.bot.infra.settings import get_settings
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Exponential growth: M(t) = e^(k * t), t in milliseconds since betting closed.
+# k = 0.00006 (approx 6% per second, standard-ish)
+_GROWTH_RATE = 0.00006
+
+DEFAULT_ROOM = "main"
+
+
+@dataclass(frozen=True)
+class CrashRoom:
+    """An independent crash table: its own round loop, bet limits and phase durations."""
+
+    code: str
+    bet_min: int
+    bet_max: int
+    bet_duration_ms: int
+    cooldown_ms: int
+
+
+def crash_rooms() -> dict[str, CrashRoom]:
+    """The main room from the CRASH_* settings plus the rooms of `CRASH_ROOMS`."""
+    main = CrashRoom(
+        code=DEFAULT_ROOM,
+        bet_min=settings.crash_bet_min,
+        bet_max=settings.crash_bet_max,
+        bet_duration_ms=settings.crash_bet_duration_ms,
+        cooldown_ms=settings.crash_cooldown_ms,
+    )
+    rooms = {DEFAULT_ROOM: main}
+    for code, overrides in settings.crash_rooms.items():
+        rooms[code] = replace(main, **overrides, code=code)
+    return rooms
+
+
+def get_room(code: str) -> CrashRoom:
+    room = crash_rooms().get(code)
+    if room is None:
+        raise ValueError("Unknown crash room")
+    return room
+
 
 @dataclass
 class CrashSnapshot:
@@ -48,6 +93,57 @@ class AutoCashoutEvent:
     snapshot: CrashSnapshot
 
 
+@dataclass(frozen=True)
+class RoundState:
+    """Detached copy of a `CrashRound` row.
+
+    Exposes the same attribute names as the ORM model so payload and
+    multiplier helpers accept either one.
+    """
+
+    id: int
+    status: str
+    seed: str
+    seed_hash: str
+    crash_point: float
+    bet_ends_at: datetime
+    crash_at: datetime
+    created_at: datetime
+    settled_at: datetime | None = None
+    room: str = DEFAULT_ROOM
+
+    @classmethod
+    def from_model(cls, round_obj: CrashRound) -> "RoundState":
+        return cls(
+            id=round_obj.id,
+            status=round_obj.status,
+            seed=round_obj.seed,
+            seed_hash=round_obj.seed_hash,
+            crash_point=float(round_obj.crash_point or 1.0),
+            bet_ends_at=_as_utc(round_obj.bet_ends_at),
+            crash_at=_as_utc(round_obj.crash_at),
+            created_at=_as_utc(round_obj.created_at),
+            settled_at=_as_utc(round_obj.settled_at) if round_obj.settled_at else None,
+            room=round_obj.room,
+        )
+
+    def to_payload(self) -> dict:
+        """JSON-ready form, as the leader publishes it for the other nodes."""
+        data = asdict(self)
+        for key in ("bet_ends_at", "crash_at", "created_at", "settled_at"):
+            if data[key] is not None:
+                data[key] = data[key].isoformat()
+        return data
+
+    @classmethod
+    def from_payload(cls, data: dict) -> "RoundState":
+        values = dict(data)
+        for key in ("bet_ends_at", "crash_at", "created_at", "settled_at"):
+            if values.get(key) is not None:
+                values[key] = datetime.fromisoformat(values[key])
+        return cls(**values)
+
+
 AutoCashoutCallback = Callable[[AutoCashoutEvent], Awaitable[None]]
 
 
@@ -77,89 +173,107 @@ def _now() -> datetime:
     return datetime.now(tz=timezone.utc)
 
 
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes even for timezone-aware columns.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
 def _crash_point_from_seed(seed: str) -> float:
-    digest = hashlib.sha256(seed.encode()).hexdigest()
-    value = int(digest[:13], 16)
-    if value == 0:
-        return 1.0
-    base = (2**52 - value % (2**52)) / 2**52
-    crash_point = max(1.01, round(base * 20, 2))
-    return crash_point
+    return crash_point_from_seed(seed, settings.crash_seed_salt, CRASH_POINT_HMAC)
+
+
+async def _allocate_chain_index(session: AsyncSession) -> int:
+    """Take the next seed chain index from the shared cursor row.
+
+    The UPDATE's row lock is held until the round commits, so leaders of
+    different rooms draw indexes one at a time and in round id order.
+    """
+    for _ in range(2):
+        index = await session.scalar(
+            update(CrashChainCursor)
+            .where(CrashChainCursor.id == 1)
+            .values(next_index=CrashChainCursor.next_index + 1)
+            .returning(CrashChainCursor.next_index - 1)
+            .execution_options(synchronize_session=False)
+        )
+        if index is not None:
+            return index
+        # No cursor yet: start after any index already used.
+        last_index = await session.scalar(select(func.max(CrashRound.chain_index)))
+        await session.execute(
+            insert_or_skip(
+                session, CrashChainCursor, {"id": 1, "next_index": 0 if last_index is None else last_index + 1}
+            )
+        )
+    raise RuntimeError("crash chain cursor is missing")
 
 
-async def _create_round(session: AsyncSession) -> CrashRound:
+async def _next_seed(session: AsyncSession) -> tuple[str, int | None]:
+    if not settings.crash_seed_chain_path:
+        return secrets.token_hex(32), None
+    chain = load_seed_chain(settings.crash_seed_chain_path)
+    index = await _allocate_chain_index(session)
+    if index >= chain.length:
+        logger.error("Crash seed chain %s is exhausted at index %s", settings.crash_seed_chain_path, index)
+        return secrets.token_hex(32), None
+    return chain.seed_at(index), index
+
+
+async def _create_round(session: AsyncSession, leader_epoch: int = 0, room: str = DEFAULT_ROOM) -> CrashRound:
     now = _now()
-    seed = secrets.token_hex(32)
-    seed_hash = hashlib.sha256(seed.encode()).hexdigest()
-    bet_end = now + timedelta(milliseconds=settings.crash_bet_duration_ms)
+    seed, chain_index = await _next_seed(session)
+    seed_hash = next_link(seed)
+    bet_end = now + timedelta(milliseconds=get_room(room).bet_duration_ms)
     crash_point = _crash_point_from_seed(seed)
-    
-    # Exponential growth: M(t) = e^(k * t)
-    # k = 0.00006 (approx 6% per second, standard-ish)
-    # t = ln(M) / k
-    k = 0.00006
-    duration_ms = int(math.log(crash_point) / k)
+    duration_ms = int(_elapsed_ms_for(crash_point))
     # Add a small buffer or minimum duration
     duration_ms = max(1000, duration_ms)
     
     crash_at = bet_end + timedelta(milliseconds=duration_ms)
     round_obj = CrashRound(
+        room=room,
         status=CrashRoundStatus.BETTING.value,
         seed=seed,
         seed_hash=seed_hash,
+        chain_index=chain_index,
+        crash_point_version=CRASH_POINT_HMAC,
         crash_point=crash_point,
         bet_ends_at=bet_end,
         crash_at=crash_at,
+        leader_epoch=leader_epoch,
     )
     session.add(round_obj)
     await session.flush()
     return round_obj
 
 
-async def _active_round(session: AsyncSession) -> CrashRound:
-    round_obj = await session.scalar(select(CrashRound).order_by(desc(CrashRound.id)).limit(1))
-    if round_obj is None:
-        return await _create_round(session)
-    await _sync_round(session, round_obj)
-    await _auto_cashout_bets(session, round_obj)
-    if round_obj.status == CrashRoundStatus.CRASHED.value and round_obj.settled_at:
-        return await _create_round(session)
-    return round_obj
-
-
-async def _sync_round(session: AsyncSession, round_obj: CrashRound) -> None:
-    now = _now()
-    updated = False
-    if round_obj.status == CrashRoundStatus.BETTING.value and now >= round_obj.bet_ends_at:
-        round_obj.status = CrashRoundStatus.FLYING.value
-        updated = True
-    if round_obj.status == CrashRoundStatus.FLYING.value and now >= round_obj.crash_at:
-        round_obj.status = CrashRoundStatus.CRASHED.value
-        updated = True
-    if updated:
-        await session.flush()
-    if round_obj.status == CrashRoundStatus.CRASHED.value:
-        await _settle_round(session, round_obj)
+async def _latest_round(session: AsyncSession, room: str = DEFAULT_ROOM) -> CrashRound | None:
+    return await session.scalar(
+        select(CrashRound).where(CrashRound.room == room).order_by(desc(CrashRound.id)).limit(1)
+    )
 
 
-async def _settle_round(session: AsyncSession, round_obj: CrashRound) -> None:
-    if round_obj.settled_at:
-        return
-    now = _now()
-    bets = (
-        await session.scalars(
-            select(CrashBet).where(
-                CrashBet.round_id == round_obj.id,
+async def _settle_bets(session: AsyncSession, round_id: int, now: datetime) -> int:
+    """Mark every still-active bet of the round as lost in one statement."""
+    rows = (
+        await session.execute(
+            update(CrashBet)
+            .where(
+                CrashBet.round_id == round_id,
                 CrashBet.status == CrashBetStatus.ACTIVE.value,
             )
+            .values(status=CrashBetStatus.CRASHED.value, updated_at=now)
+            .returning(CrashBet.user_id, CrashBet.amount_cash + CrashBet.amount_bonus)
+            .execution_options(synchronize_session="fetch")
         )
     ).all()
-    for bet in bets:
-        bet.status = CrashBetStatus.CRASHED.value
-        bet.updated_at = now
-        await apply_turnover(session, bet.user_id, "crash", bet.amount_cash + bet.amount_bonus)
-    round_obj.settled_at = now
-    await session.flush()
+    stakes: dict[int, int] = {}
+    for user_id, stake in rows:
+        stakes[user_id] = stakes.get(user_id, 0) + stake
+    await apply_turnover_bulk(session, "crash", stakes)
+    return len(rows)
 
 
 async def _get_active_bet(session: AsyncSession, round_id: int, user_id: int) -> CrashBet | None:
@@ -178,6 +292,7 @@ def _session_payload(round_obj: CrashRound) -> dict:
     crash_point = float(round_obj.crash_point) if round_obj.status == CrashRoundStatus.CRASHED.value else None
     return {
         "id": round_obj.id,
+        "room": round_obj.room,
         "phase": round_obj.status,
         "seed": round_obj.seed_hash if round_obj.status != CrashRoundStatus.CRASHED.value else round_obj.seed,
         "startTime": int(round_obj.created_at.timestamp() * 1000),
@@ -208,6 +323,11 @@ def _user_payload(wallet, bet: CrashBet | None) -> dict:
     }
 
 
+def _elapsed_ms_for(multiplier: float) -> float:
+    # Inverse of the growth curve: t = ln(M) / k
+    return math.log(multiplier) / _GROWTH_RATE
+
+
 def _current_multiplier(round_obj: CrashRound) -> float:
     if round_obj.status == CrashRoundStatus.BETTING.value:
         return 1.0
@@ -215,12 +335,16 @@ def _current_multiplier(round_obj: CrashRound) -> float:
         return float(round_obj.crash_point or 1.0)
     
     elapsed_ms = max(0.0, (_now() - round_obj.bet_ends_at).total_seconds() * 1000)
-    k = 0.00006
-    current = math.exp(k * elapsed_ms)
+    current = multiplier_after(elapsed_ms)
     
     # Cap at crash_point if we somehow exceeded it but haven't processed crash yet
     crash_point = float(round_obj.crash_point or 1.0)
-    return min(crash_point, round(current, 4))
+    return min(crash_point, current)
+
+
+def multiplier_after(elapsed_ms: float) -> float:
+    """Multiplier of the growth curve `elapsed_ms` after take-off."""
+    return round(math.exp(_GROWTH_RATE * max(0.0, elapsed_ms)), 4)
 
 
 async def _build_snapshot(session: AsyncSession, round_obj: CrashRound, user_id: int) -> CrashSnapshot:
@@ -265,47 +389,492 @@ async def _finalize_cashout(session: AsyncSession, round_obj: CrashRound, bet: C
     return payout_total
 
 
-async def _auto_cashout_bets(session: AsyncSession, round_obj: CrashRound) -> None:
-    if round_obj.status != CrashRoundStatus.FLYING.value:
-        return
-    multiplier = _current_multiplier(round_obj)
-    bets = (
-        await session.scalars(
-            select(CrashBet).where(
-                CrashBet.round_id == round_obj.id,
-                CrashBet.status == CrashBetStatus.ACTIVE.value,
-                CrashBet.auto_cashout.is_not(None),
-                CrashBet.auto_cashout <= multiplier,
+async def _process_auto_cashouts(session: AsyncSession, round_obj: CrashRound | RoundState, bets: list[CrashBet]) -> None:
+    # Auto cashouts pay exactly at the requested target, not at whatever the curve reads now.
+    snapshots = await _cashout_bets(session, round_obj, [(bet, float(bet.auto_cashout)) for bet in bets])
+    for user_id, snapshot in snapshots.items():
+        await _emit_auto_cashout(AutoCashoutEvent(user_id=user_id, snapshot=snapshot))
+
+
+async def _cashout_bets(
+    session: AsyncSession,
+    round_obj: CrashRound | RoundState,
+    claims: list[tuple[CrashBet, float]],
+) -> dict[int, CrashSnapshot]:
+    """Cash out many bets of one round in a single pass.
+
+    Bets are claimed with a conditional UPDATE first, so a bet that was already
+    settled or cashed out by someone else is skipped rather than paid twice.
+    Returns a post-cashout snapshot per paid user.
+    """
+    if not claims:
+        return {}
+    now = _now()
+    claimed = set(
+        (
+            await session.scalars(
+                update(CrashBet)
+                .where(
+                    CrashBet.id.in_([bet.id for bet, _ in claims]),
+                    CrashBet.status == CrashBetStatus.ACTIVE.value,
+                )
+                .values(status=CrashBetStatus.CASHED_OUT.value, cashed_at=now)
+                .returning(CrashBet.id)
+                .execution_options(synchronize_session=False)
             )
+        ).all()
+    )
+    paid: list[tuple[CrashBet, float, int]] = []
+    for bet, multiplier in claims:
+        if bet.id not in claimed:
+            continue
+        payout_total = int((bet.amount_cash + bet.amount_bonus) * multiplier)
+        if payout_total <= 0:
+            raise ValueError("Invalid payout")
+        bet.status = CrashBetStatus.CASHED_OUT.value
+        bet.cashout_multiplier = multiplier
+        bet.payout_cash = payout_total
+        bet.cashed_at = now
+        paid.append((bet, multiplier, payout_total))
+    if not paid:
+        return {}
+
+    wallets = await add_coins_cash_bulk(
+        session,
+        [
+            (bet.user_id, payout_total, {"round_id": round_obj.id, "multiplier": multiplier})
+            for bet, multiplier, payout_total in paid
+        ],
+        reason="crash_payout",
+    )
+    await apply_turnover_bulk(
+        session,
+        "crash",
+        {bet.user_id: bet.amount_cash + bet.amount_bonus for bet, _, _ in paid},
+    )
+    await session.flush()
+
+    session_payload = _session_payload(round_obj)
+    snapshots: dict[int, CrashSnapshot] = {}
+    for bet, multiplier, payout_total in paid:
+        wallet = wallets[bet.user_id]
+        snapshots[bet.user_id] = CrashSnapshot(
+            session=dict(session_payload),
+            user=_user_payload(wallet, None),
+            balance=_balance_payload(wallet),
+            cashout={
+                "multiplier": multiplier,
+                "payout": payout_total,
+                "betId": bet.id,
+            },
         )
-    ).all()
-    for bet in bets:
-        payout_total = await _finalize_cashout(session, round_obj, bet, multiplier)
-        await session.flush()
-        snapshot = await _build_snapshot(session, round_obj, bet.user_id)
-        snapshot.cashout = {
-            "multiplier": multiplier,
-            "payout": payout_total,
-            "betId": bet.id,
-        }
-        await _emit_auto_cashout(AutoCashoutEvent(user_id=bet.user_id, snapshot=snapshot))
-
-
-async def get_state(session: AsyncSession, user_id: int) -> CrashSnapshot:
-    round_obj = await _active_round(session)
+    return snapshots
+
+
+@dataclass
+class _CashoutRequest:
+    round: CrashRound | RoundState
+    user_id: int
+    multiplier: float
+    future: asyncio.Future
+
+
+class CashoutBatcher:
+    """Collects manual cashouts for a few milliseconds and commits them together.
+
+    The multiplier is fixed by the caller when the request arrives; the batch
+    only decides when the money moves. Each flush costs one session and a fixed
+    number of statements regardless of how many cashouts it carries.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]],
+        *,
+        window_ms: int | None = None,
+        max_batch: int | None = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self._window = (window_ms if window_ms is not None else settings.crash_cashout_batch_ms) / 1000
+        self._max_batch = max_batch or settings.crash_cashout_batch_max
+        self._pending: list[_CashoutRequest] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def submit(self, round_obj: CrashRound | RoundState, user_id: int, multiplier: float) -> CrashSnapshot:
+        loop = asyncio.get_running_loop()
+        request = _CashoutRequest(round=round_obj, user_id=user_id, multiplier=multiplier, future=loop.create_future())
+        self._pending.append(request)
+        if len(self._pending) >= self._max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            # Never hold a cashout past the crash: settlement would claim the bet first.
+            until_crash = (_as_utc(round_obj.crash_at) - _now()).total_seconds()
+            self._timer = loop.call_later(max(0.0, min(self._window, until_crash)), self._flush_now)
+        return await request.future
+
+    async def close(self) -> None:
+        self._flush_now()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: list[_CashoutRequest]) -> None:
+        try:
+            async with self._session_factory() as session:
+                try:
+                    snapshots = await _cashout_requests(session, batch)
+                except Exception:
+                    await session.rollback()
+                    raise
+                else:
+                    await session.commit()
+        except Exception as exc:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(exc)
+            return
+        for request in batch:
+            if request.future.done():
+                continue
+            snapshot = snapshots.pop(request.user_id, None)
+            if snapshot is None:
+                request.future.set_exception(ValueError("No active bet"))
+            else:
+                request.future.set_result(snapshot)
+
+
+async def _cashout_requests(session: AsyncSession, batch: list[_CashoutRequest]) -> dict[int, CrashSnapshot]:
+    by_round: dict[int, dict[int, _CashoutRequest]] = {}
+    for request in batch:
+        # A duplicate request from the same user keeps the first arrival's multiplier.
+        by_round.setdefault(request.round.id, {}).setdefault(request.user_id, request)
+    snapshots: dict[int, CrashSnapshot] = {}
+    for round_id, requests in by_round.items():
+        bets = (
+            await session.scalars(
+                select(CrashBet).where(
+                    CrashBet.round_id == round_id,
+                    CrashBet.user_id.in_(list(requests)),
+                    CrashBet.status == CrashBetStatus.ACTIVE.value,
+                )
+            )
+        ).all()
+        round_obj = next(iter(requests.values())).round
+        claims = [(bet, requests[bet.user_id].multiplier) for bet in bets]
+        snapshots.update(await _cashout_bets(session, round_obj, claims))
+    return snapshots
+
+
+_cashout_batcher: CashoutBatcher | None = None
+
+
+def set_cashout_batcher(batcher: CashoutBatcher | None) -> None:
+    global _cashout_batcher
+    _cashout_batcher = batcher
+
+
+class AutoCashoutScheduler:
+    """Pending auto cashouts of the flying round, ordered by target multiplier.
+
+    The curve is monotonic, so the heap head is always the next bet to fire and
+    its exact fire time is `bet_ends_at + ln(target) / k`.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+    async def load(self, session: AsyncSession, round_state: RoundState) -> None:
+        rows = (
+            await session.execute(
+                select(CrashBet.auto_cashout, CrashBet.id).where(
+                    CrashBet.round_id == round_state.id,
+                    CrashBet.status == CrashBetStatus.ACTIVE.value,
+                    CrashBet.auto_cashout.is_not(None),
+                    CrashBet.auto_cashout <= round_state.crash_point,
+                )
+            )
+        ).all()
+        self._heap = [(float(target), bet_id) for target, bet_id in rows]
+        heapq.heapify(self._heap)
+
+    def next_fire_at(self, round_state: RoundState) -> datetime | None:
+        if not self._heap:
+            return None
+        return _fire_at(round_state, self._heap[0][0])
+
+    def pop_due(self, round_state: RoundState, now: datetime) -> dict[float, list[int]]:
+        """Pop every bet whose target has been reached, grouped by target."""
+        due: dict[float, list[int]] = {}
+        while self._heap and _fire_at(round_state, self._heap[0][0]) <= now:
+            target, bet_id = heapq.heappop(self._heap)
+            due.setdefault(target, []).append(bet_id)
+        return due
+
+
+def _fire_at(round_state: RoundState, multiplier: float) -> datetime:
+    return round_state.bet_ends_at + timedelta(milliseconds=_elapsed_ms_for(multiplier))
+
+
+class LeadershipLost(RuntimeError):
+    """A newer round-loop leader has already stamped the round with a larger token."""
+
+
+class CrashRoundEngine:
+    """In-memory owner of the current round of one room on its round-loop leader.
+
+    The leader drives BETTING -> FLYING -> CRASHED from the round deadlines via
+    `advance`; request handlers on the same node read `round` instead of
+    querying and syncing `crash_rounds` themselves.
+
+    With `fencing_token` set, every mutation first stamps the round row with
+    the token inside the same transaction and raises `LeadershipLost` if the
+    row already carries a larger one. Standbys keep an engine warm by
+    `adopt`-ing the round the leader publishes, so request handlers on every
+    node read the round from memory and taking over costs a single fenced
+    update. Published rounds carry `version`, the leader's fencing token and
+    a per-publish sequence, which only grows across leaders.
+    """
+
+    def __init__(self, room: str = DEFAULT_ROOM) -> None:
+        self.room = room
+        self._round: RoundState | None = None
+        self._auto_cashouts = AutoCashoutScheduler()
+        self.fencing_token: int | None = None
+        self.version: tuple[int, int] = (0, 0)
+
+    @property
+    def round(self) -> RoundState | None:
+        return self._round
+
+    def reset(self) -> None:
+        self._round = None
+        self._auto_cashouts.clear()
+        self.version = (0, 0)
+
+    def next_version(self) -> tuple[int, int]:
+        """Version to publish the current round under; the leader calls it once per publish."""
+        self.version = (self.fencing_token or 0, self.version[1] + 1)
+        return self.version
+
+    def next_deadline(self) -> datetime | None:
+        round_state = self._round
+        if round_state is None:
+            return None
+        if round_state.status == CrashRoundStatus.BETTING.value:
+            return round_state.bet_ends_at
+        if round_state.status == CrashRoundStatus.FLYING.value:
+            fire_at = self._auto_cashouts.next_fire_at(round_state)
+            if fire_at is not None and fire_at < round_state.crash_at:
+                return fire_at
+            return round_state.crash_at
+        return round_state.crash_at + timedelta(milliseconds=get_room(self.room).cooldown_ms)
+
+    def due(self, now: datetime | None = None) -> bool:
+        """Whether `advance` has work to do; until then the leader needs no session."""
+        deadline = self.next_deadline()
+        return deadline is None or (now or _now()) >= deadline
+
+    async def load(self, session: AsyncSession) -> RoundState:
+        """Adopt the latest round as is; due transitions are left to `advance`.
+
+        The row is fenced before anything else touches it, so a stale leader
+        fails here without having mutated a thing.
+        """
+        round_obj = await _latest_round(session, self.room)
+        if round_obj is None:
+            round_obj = await _create_round(session, leader_epoch=self.fencing_token or 0, room=self.room)
+        else:
+            await self._fence(session, round_obj.id)
+        self._round = RoundState.from_model(round_obj)
+        self._auto_cashouts.clear()
+        if self._round.status == CrashRoundStatus.FLYING.value:
+            await self._auto_cashouts.load(session, self._round)
+        await session.commit()
+        return self._round
+
+    def adopt(self, round_state: RoundState, version: tuple[int, int]) -> bool:
+        """Follow a round published by the leader; standbys never read it from the DB.
+
+        A `version` not newer than the one this engine holds is ignored, so a
+        read racing a newer publish or a deposed leader's late write never
+        moves the round back. Returns whether the round was taken.
+        """
+        if version <= self.version:
+            return False
+        self._round = round_state
+        self._auto_cashouts.clear()
+        self.version = version
+        return True
+
+    async def claim(self, session: AsyncSession) -> None:
+        """Take over as leader: stamp the warm round with our token, or load it.
+
+        Adopted rounds come without their auto cashouts, so a flying one loads
+        them here.
+        """
+        if self._round is None:
+            await self.load(session)
+            return
+        await self._fence(session, self._round.id)
+        if self._round.status == CrashRoundStatus.FLYING.value:
+            await self._auto_cashouts.load(session, self._round)
+        await session.commit()
+
+    async def _fence(self, session: AsyncSession, round_id: int) -> None:
+        token = self.fencing_token
+        if token is None:
+            return
+        result = await session.execute(
+            update(CrashRound)
+            .where(CrashRound.id == round_id, CrashRound.leader_epoch <= token)
+            .values(leader_epoch=token)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            await session.rollback()
+            self.reset()
+            raise LeadershipLost(f"round {round_id} is fenced above token {token}")
+
+    async def advance(self, session: AsyncSession, now: datetime | None = None) -> list[dict]:
+        """Apply every due transition and return the round summary after each one."""
+        if self._round is None:
+            return [_session_payload(await self.load(session))]
+        now = now or _now()
+        summaries: list[dict] = []
+        round_state = self._round
+        if round_state.status == CrashRoundStatus.BETTING.value and now >= round_state.bet_ends_at:
+            round_state = await self._transition(session, round_state, status=CrashRoundStatus.FLYING.value)
+            if round_state is None:
+                return [_session_payload(await self.load(session))]
+            # Bets lock the row while BETTING (`_lock_betting_round`), so the
+            # pending auto cashouts are final once the transition committed.
+            await self._auto_cashouts.load(session, round_state)
+            summaries.append(_session_payload(round_state))
+        if round_state.status == CrashRoundStatus.FLYING.value:
+            await self._fire_auto_cashouts(session, round_state, now)
+        if round_state.status == CrashRoundStatus.FLYING.value and now >= round_state.crash_at:
+            await _settle_bets(session, round_state.id, now)
+            round_state = await self._transition(
+                session,
+                round_state,
+                status=CrashRoundStatus.CRASHED.value,
+                settled_at=now,
+            )
+            if round_state is None:
+                return [_session_payload(await self.load(session))]
+            self._auto_cashouts.clear()
+            summaries.append(_session_payload(round_state))
+        deadline = self.next_deadline()
+        if round_state.status == CrashRoundStatus.CRASHED.value and deadline is not None and now >= deadline:
+            await self._fence(session, round_state.id)
+            round_obj = await _create_round(session, leader_epoch=self.fencing_token or 0, room=self.room)
+            await session.commit()
+            self._round = RoundState.from_model(round_obj)
+            summaries.append(_session_payload(self._round))
+        return summaries
+
+    async def _fire_auto_cashouts(self, session: AsyncSession, round_state: RoundState, now: datetime) -> None:
+        due = self._auto_cashouts.pop_due(round_state, min(now, round_state.crash_at))
+        if not due:
+            return
+        await self._fence(session, round_state.id)
+        bet_ids = [bet_id for group in due.values() for bet_id in group]
+        bets = (
+            await session.scalars(
+                select(CrashBet)
+                .where(
+                    CrashBet.id.in_(bet_ids),
+                    CrashBet.status == CrashBetStatus.ACTIVE.value,
+                )
+                .order_by(CrashBet.auto_cashout, CrashBet.id)
+            )
+        ).all()
+        await _process_auto_cashouts(session, round_state, list(bets))
+        await session.commit()
+
+    async def _transition(self, session: AsyncSession, round_state: RoundState, **values) -> RoundState | None:
+        await self._fence(session, round_state.id)
+        result = await session.execute(
+            update(CrashRound)
+            .where(CrashRound.id == round_state.id, CrashRound.status == round_state.status)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            # Someone else moved the row; drop our copy and reload from the database.
+            await session.rollback()
+            self._round = None
+            return None
+        await session.commit()
+        self._round = replace(round_state, **values)
+        return self._round
+
+
+_round_engines: dict[str, CrashRoundEngine] = {}
+
+
+def set_round_engine(engine: CrashRoundEngine | None, room: str = DEFAULT_ROOM) -> None:
+    """Register the engine request handlers read `room` from; None unregisters it."""
+    if engine is None:
+        _round_engines.pop(room, None)
+    else:
+        _round_engines[room] = engine
+
+
+def get_round_engine(room: str = DEFAULT_ROOM) -> CrashRoundEngine | None:
+    return _round_engines.get(room)
+
+
+async def _current_round(session: AsyncSession, room: str = DEFAULT_ROOM) -> RoundState:
+    """The round request handlers act on; never transitions or creates rounds.
+
+    Only the leader's engine mutates `crash_rounds`; standbys keep theirs on
+    the published round. Without a warm engine (nothing published yet, or no
+    WS manager in the process) the latest row is read as is, and callers rely
+    on their own deadline checks.
+    """
+    engine = _round_engines.get(room)
+    if engine is not None and engine.round is not None:
+        return engine.round
+    get_room(room)
+    round_obj = await _latest_round(session, room)
+    if round_obj is None:
+        raise ValueError("No crash round yet")
+    return RoundState.from_model(round_obj)
+
+
+async def get_state(session: AsyncSession, user_id: int, room: str = DEFAULT_ROOM) -> CrashSnapshot:
+    round_obj = await _current_round(session, room)
     return await _build_snapshot(session, round_obj, user_id)
 
 
-async def get_round_summary(session: AsyncSession) -> dict:
-    round_obj = await _active_round(session)
+async def get_round_summary(session: AsyncSession, room: str = DEFAULT_ROOM) -> dict:
+    round_obj = await _current_round(session, room)
     return _session_payload(round_obj)
 
 
-async def get_recent_history(session: AsyncSession, limit: int = 20) -> list[dict]:
+async def get_recent_history(session: AsyncSession, limit: int = 20, room: str = DEFAULT_ROOM) -> list[dict]:
     rows = (
         await session.scalars(
             select(CrashRound)
-            .where(CrashRound.status == CrashRoundStatus.CRASHED.value)
+            .where(CrashRound.room == room, CrashRound.status == CrashRoundStatus.CRASHED.value)
             .order_by(desc(CrashRound.id))
             .limit(limit)
         )
@@ -322,8 +891,25 @@ async def get_recent_history(session: AsyncSession, limit: int = 20) -> list[dic
     return history
 
 
-def _ensure_bet_limits(amount: int) -> None:
-    if amount < settings.crash_bet_min or amount > settings.crash_bet_max:
+async def _lock_betting_round(session: AsyncSession, round_id: int) -> None:
+    """Hold a shared lock on the round row for the rest of the bet transaction.
+
+    The BETTING -> FLYING update waits for every bet holding the lock, and a
+    bet arriving after it sees the new status, so the auto cashouts loaded at
+    take-off always include every committed bet.
+    """
+    locked = await session.scalar(
+        select(CrashRound.id)
+        .where(CrashRound.id == round_id, CrashRound.status == CrashRoundStatus.BETTING.value)
+        .with_for_update(read=True)
+    )
+    if locked is None:
+        raise ValueError("Betting phase is closed")
+
+
+def _ensure_bet_limits(amount: int, room: str = DEFAULT_ROOM) -> None:
+    limits = get_room(room)
+    if amount < limits.bet_min or amount > limits.bet_max:
         raise ValueError("Bet outside allowed limits")
 
 
@@ -333,11 +919,19 @@ async def place_bet(
     user: User,
     amount: int,
     auto_cashout: float | None = None,
+    room: str = DEFAULT_ROOM,
+    commit: bool = True,
 ) -> CrashSnapshot:
-    _ensure_bet_limits(amount)
-    round_obj = await _active_round(session)
+    """Place the user's bet in the room's betting round.
+
+    With `commit=False` the bet is only flushed and the caller commits it,
+    e.g. together with the idempotency key of the request.
+    """
+    _ensure_bet_limits(amount, room)
+    round_obj = await _current_round(session, room)
     if round_obj.status != CrashRoundStatus.BETTING.value or _now() >= round_obj.bet_ends_at:
         raise ValueError("Betting phase is closed")
+    await _lock_betting_round(session, round_obj.id)
     existing = await _get_active_bet(session, round_obj.id, user.id)
     if existing:
         raise ValueError("Bet already placed in this round")
@@ -348,7 +942,7 @@ async def place_bet(
         amount,
         prefer="auto_bonus_when_active",
         reason="crash_bet",
-        metadata={"round_id": round_obj.id},
+        metadata={"round_id": round_obj.id, "room": round_obj.room},
     )
     bet = CrashBet(
         round_id=round_obj.id,
@@ -361,16 +955,22 @@ async def place_bet(
     if consumption.cash > 0:
         user.paid_crash_bets_count += 1
     await session.flush()
-    await session.commit()
+    if commit:
+        await session.commit()
     snapshot = await _build_snapshot(session, round_obj, user.id)
     snapshot.bet = _bet_payload(bet)
     return snapshot
 
 
-async def cashout(session: AsyncSession, *, user: User) -> CrashSnapshot:
-    round_obj = await _active_round(session)
-    if round_obj.status != CrashRoundStatus.FLYING.value:
+async def cashout(session: AsyncSession, *, user: User, room: str = DEFAULT_ROOM) -> CrashSnapshot:
+    round_obj = await _current_round(session, room)
+    if round_obj.status != CrashRoundStatus.FLYING.value or _now() >= _as_utc(round_obj.crash_at):
         raise ValueError("Cashout unavailable")
+    if _cashout_batcher is not None:
+        multiplier = _current_multiplier(round_obj)
+        # Hand the connection back to the pool while the batch is pending.
+        await session.commit()
+        return await _cashout_batcher.submit(round_obj, user.id, multiplier)
     bet = await _get_active_bet(session, round_obj.id, user.id)
     if bet is None:
         raise ValueError("No active bet")
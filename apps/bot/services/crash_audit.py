@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor
+from typing import AsyncIterator
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from apps.bot.core.seed_chain import RoundRow, verify_rounds
+from apps.bot.db.models import CrashRound, CrashRoundStatus
+from apps.bot.infra.settings import get_settings
+
+settings = get_settings()
+
+_ROUND_COLUMNS = (
+    CrashRound.id,
+    CrashRound.seed,
+    CrashRound.seed_hash,
+    CrashRound.crash_point,
+    CrashRound.chain_index,
+    CrashRound.crash_point_version,
+)
+
+
+async def _previous_row(session: AsyncSession, before_id: int) -> RoundRow | None:
+    row = (
+        await session.execute(
+            select(*_ROUND_COLUMNS)
+            .where(CrashRound.id < before_id, CrashRound.status == CrashRoundStatus.CRASHED.value)
+            .order_by(desc(CrashRound.id))
+            .limit(1)
+        )
+    ).first()
+    return tuple(row) if row else None
+
+
+async def iter_round_verifications(
+    session: AsyncSession,
+    start_id: int,
+    end_id: int,
+    *,
+    chunk_size: int = 1000,
+    executor: Executor | None = None,
+) -> AsyncIterator[dict]:
+    """Stream verification results for revealed rounds with ids in [start_id, end_id].
+
+    Rows come through a server-side cursor `chunk_size` at a time and each
+    chunk is hashed in `executor` (the loop's default pool when None), so long
+    ranges neither load the table into memory nor block the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    previous = await _previous_row(session, start_id)
+    result = await session.stream(
+        select(*_ROUND_COLUMNS)
+        .where(
+            CrashRound.id.between(start_id, end_id),
+            CrashRound.status == CrashRoundStatus.CRASHED.value,
+        )
+        .order_by(CrashRound.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async for partition in result.partitions():
+        rows = [tuple(row) for row in partition]
+        verified = await loop.run_in_executor(executor, verify_rounds, rows, previous, settings.crash_seed_salt)
+        previous = rows[-1]
+        for item in verified:
+            yield item
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+# Receives (event id or None, encoded frame) for every event published by any node.
+EventHandler = Callable[[str | None, str], Awaitable[None]]
+
+
+class EventBus(ABC):
+    """Cross-node transport for encoded crash WS events.
+
+    `publish` reaches every node; `publish_to` reaches one node only and is
+    used for user-targeted events routed through the presence map. The
+    Redis-backed buses can listen to just one of the two (`shared` /
+    `direct`), which the local worker hub uses to split them.
+    """
+
+    @abstractmethod
+    async def start(self, handler: EventHandler) -> None:
+        """Deliver every event this node listens to to `handler` until `stop`."""
+
+    @abstractmethod
+    async def stop(self) -> None:
+        """Stop listening and release the connection."""
+
+    @abstractmethod
+    async def publish(self, frame: str) -> str | None:
+        """Publish a frame and return its event id, if the bus assigns one."""
+
+    @abstractmethod
+    async def publish_to(self, node_id: str, frame: str) -> None:
+        """Publish a frame to the node `node_id` only."""
+
+    async def replay(self, after_id: str, limit: int, *, inclusive: bool = False) -> list[tuple[str, str]] | None:
+        """Messages after (or from) `after_id`, or None when they can't all be returned."""
+        return None
+
+
+class PubSubEventBus(EventBus):
+    """Fire-and-forget Redis pub/sub: events published while a node is away are lost."""
+
+    def __init__(self, redis: Redis, channel: str, node_id: str, *, shared: bool = True, direct: bool = True) -> None:
+        self._redis = redis
+        self._channel = channel
+        self._channels = [name for name, on in ((channel, shared), (_node_key(channel, node_id), direct)) if on]
+        self._pubsub = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self, handler: EventHandler) -> None:
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(*self._channels)
+        self._task = asyncio.create_task(self._run(handler))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._pubsub is not None:
+            with contextlib.suppress(Exception):
+                await self._pubsub.unsubscribe(*self._channels)
+                await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def publish(self, frame: str) -> str | None:
+        await self._redis.publish(self._channel, frame)
+        return None
+
+    async def publish_to(self, node_id: str, frame: str) -> None:
+        await self._redis.publish(_node_key(self._channel, node_id), frame)
+
+    async def _run(self, handler: EventHandler) -> None:
+        assert self._pubsub is not None
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    await handler(None, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Crash pub/sub reader failed")
+                await asyncio.sleep(1)
+
+
+class StreamEventBus(EventBus):
+    """Redis Stream with approximate MAXLEN retention and a blocking XREAD reader.
+
+    The reader keeps its own offset, so after a Redis hiccup it continues from
+    the last entry it handled instead of dropping what was published meanwhile.
+    Entry ids of the shared stream double as client-visible event ids for
+    `replay`; node streams carry user-targeted events and are not replayable.
+    """
+
+    FIELD = "f"
+    # A node stream outlives its node by this long before Redis drops it.
+    NODE_STREAM_TTL = 3600
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str,
+        node_id: str,
+        *,
+        maxlen: int,
+        block_ms: int = 5000,
+        shared: bool = True,
+        direct: bool = True,
+    ) -> None:
+        self._redis = redis
+        self._stream = stream
+        self._maxlen = maxlen
+        self._block_ms = block_ms
+        self._task: asyncio.Task | None = None
+        self._offsets = {name: "0-0" for name, on in ((stream, shared), (_node_key(stream, node_id), direct)) if on}
+
+    async def start(self, handler: EventHandler) -> None:
+        for stream in self._offsets:
+            tail = await self._redis.xrevrange(stream, count=1)
+            if tail:
+                self._offsets[stream] = tail[0][0]
+        self._task = asyncio.create_task(self._run(handler))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def publish(self, frame: str) -> str | None:
+        return await self._redis.xadd(
+            self._stream, {self.FIELD: frame}, maxlen=self._maxlen, approximate=True
+        )
+
+    async def publish_to(self, node_id: str, frame: str) -> None:
+        stream = _node_key(self._stream, node_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(stream, {self.FIELD: frame}, maxlen=self._maxlen, approximate=True)
+            pipe.expire(stream, self.NODE_STREAM_TTL)
+            await pipe.execute()
+
+    async def replay(self, after_id: str, limit: int, *, inclusive: bool = False) -> list[tuple[str, str]] | None:
+        try:
+            after = _parse_id(after_id)
+            head = await self._redis.xrange(self._stream, count=1)
+            start = after_id if inclusive else f"({after_id}"
+            entries = await self._redis.xrange(self._stream, min=start, count=limit + 1)
+        except (ValueError, ResponseError):
+            # Malformed id from the client.
+            return None
+        if not head or _parse_id(head[0][0]) > after:
+            # The entry right after `after_id` may already be trimmed.
+            return None
+        if len(entries) > limit:
+            return None
+        return [(entry_id, fields[self.FIELD]) for entry_id, fields in entries]
+
+    async def _run(self, handler: EventHandler) -> None:
+        while True:
+            try:
+                response = await self._redis.xread(dict(self._offsets), count=500, block=self._block_ms)
+                for stream, entries in response or ():
+                    shared = stream == self._stream
+                    for entry_id, fields in entries:
+                        self._offsets[stream] = entry_id
+                        await handler(entry_id if shared else None, fields[self.FIELD])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Crash stream reader failed at %s", self._offsets)
+                await asyncio.sleep(1)
+
+
+def _node_key(name: str, node_id: str) -> str:
+    return f"{name}:node:{node_id}"
+
+
+def _parse_id(entry_id: str) -> tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def create_event_bus(
+    redis: Redis,
+    kind: str,
+    node_id: str,
+    *,
+    channel: str,
+    stream: str,
+    maxlen: int,
+    shared: bool = True,
+    direct: bool = True,
+) -> EventBus:
+    if kind == "streams":
+        return StreamEventBus(redis, stream, node_id, maxlen=maxlen, shared=shared, direct=direct)
+    if kind == "pubsub":
+        return PubSubEventBus(redis, channel, node_id, shared=shared, direct=direct)
+    raise ValueError(f"Unknown crash event bus: {kind}")
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from collections import deque
+from enum import Enum
+from typing import Callable
+
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+WS_CONNECTIONS = Gauge("crash_ws_connections", "Registered crash WebSocket connections")
+WS_QUEUED_FRAMES = Gauge("crash_ws_queued_frames", "Frames waiting in crash WebSocket send queues")
+WS_QUEUE_DEPTH = Histogram(
+    "crash_ws_queue_depth",
+    "Send queue depth observed when a frame is enqueued",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+WS_DROPPED_FRAMES = Counter("crash_ws_dropped_frames_total", "Frames dropped before sending", ["reason"])
+WS_EVICTIONS = Counter("crash_ws_evictions_total", "Connections closed by the server", ["reason"])
+
+
+class OverflowPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    DISCONNECT = "disconnect"
+
+
+class CrashConnection:
+    """One WebSocket with a bounded outbound queue drained by its own writer task.
+
+    Broadcasting is a synchronous `enqueue` per connection, so a slow client
+    only ever fills its own queue. Frames with a `coalesce_key` replace a still
+    queued frame with the same key (balance updates: only the latest matters).
+    When the queue is full, `DROP_OLDEST` discards the oldest non-critical
+    frame and `DISCONNECT` evicts the client; a queue full of critical frames
+    or a send stuck past `send_timeout` always evicts.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        *,
+        room: str | None = None,
+        max_queue: int,
+        policy: OverflowPolicy,
+        send_timeout: float,
+        on_close: Callable[["CrashConnection"], None] | None = None,
+        paused: bool = False,
+    ) -> None:
+        self.websocket = websocket
+        self.user_id = user_id
+        # Crash room the socket is subscribed to.
+        self.room = room
+        # Monotonic time of the last inbound message, read by the liveness sweeper.
+        self.last_seen = 0.0
+        self._max_queue = max_queue
+        self._policy = policy
+        self._send_timeout = send_timeout
+        self._on_close = on_close
+        # Entries are [coalesce_key, frame, critical] lists so coalescing can swap the frame in place.
+        self._queue: deque[list] = deque()
+        self._coalesced: dict[str, list] = {}
+        self._wakeup = asyncio.Event()
+        self._resumed = asyncio.Event()
+        if not paused:
+            self._resumed.set()
+        self._closed = False
+        self._writer = asyncio.create_task(self._run())
+        WS_CONNECTIONS.inc()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame: str, *, critical: bool = True, coalesce_key: str | None = None) -> bool:
+        if self._closed:
+            return False
+        if coalesce_key is not None:
+            pending = self._coalesced.get(coalesce_key)
+            if pending is not None:
+                pending[1] = frame
+                WS_DROPPED_FRAMES.labels(reason="coalesced").inc()
+                return True
+        WS_QUEUE_DEPTH.observe(len(self._queue))
+        if len(self._queue) >= self._max_queue and not self._make_room():
+            return False
+        entry = [coalesce_key, frame, critical]
+        self._queue.append(entry)
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = entry
+        WS_QUEUED_FRAMES.inc()
+        self._wakeup.set()
+        return True
+
+    def prepend(self, frames: list[str]) -> None:
+        """Put handshake frames ahead of everything queued while the connection was paused."""
+        if self._closed:
+            return
+        self._queue.extendleft([None, frame, True] for frame in reversed(frames))
+        WS_QUEUED_FRAMES.inc(len(frames))
+        self._wakeup.set()
+
+    def resume(self) -> None:
+        self._resumed.set()
+
+    def _make_room(self) -> bool:
+        if self._policy == OverflowPolicy.DROP_OLDEST:
+            for entry in self._queue:
+                if not entry[2]:
+                    self._queue.remove(entry)
+                    self._forget(entry)
+                    WS_QUEUED_FRAMES.dec()
+                    WS_DROPPED_FRAMES.labels(reason="overflow").inc()
+                    return True
+        self.close(reason="overflow")
+        return False
+
+    def _forget(self, entry: list) -> None:
+        key = entry[0]
+        if key is not None and self._coalesced.get(key) is entry:
+            del self._coalesced[key]
+
+    async def _run(self) -> None:
+        try:
+            await self._resumed.wait()
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue:
+                    entry = self._queue.popleft()
+                    self._forget(entry)
+                    WS_QUEUED_FRAMES.dec()
+                    try:
+                        async with asyncio.timeout(self._send_timeout):
+                            await self.websocket.send_text(entry[1])
+                    except TimeoutError:
+                        self.close(reason="send_timeout")
+                        return
+                    except Exception:
+                        self.close(reason="send_error")
+                        return
+        except asyncio.CancelledError:
+            pass
+
+    def close(self, reason: str | None = None) -> None:
+        """Stop the writer, drop queued frames and close the socket in the background."""
+        if self._closed:
+            return
+        self._closed = True
+        WS_CONNECTIONS.dec()
+        WS_QUEUED_FRAMES.dec(len(self._queue))
+        self._queue.clear()
+        self._coalesced.clear()
+        if reason is not None:
+            WS_EVICTIONS.labels(reason=reason).inc()
+            logger.info("Evicting crash WS user_id=%s: %s", self.user_id, reason)
+        if asyncio.current_task() is not self._writer:
+            self._writer.cancel()
+        if self._on_close is not None:
+            self._on_close(self)
+        if reason is not None:
+            asyncio.get_running_loop().create_task(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        with contextlib.suppress(Exception):
+            await self.websocket.close()
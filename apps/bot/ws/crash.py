@@ -2,65 +2,227 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
-import json
+import math
 import secrets
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
 from typing import Any
 
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from apps.bot.core.security import AuthError, decode_crash_jwt
-from apps.bot.db.models import CrashRoundStatus, User
+from apps.bot.core.wallets import get_wallet_balance
+from apps.bot.db.models import CrashRoundStatus, User, Wallet
 from apps.bot.infra.db import Database
+from apps.bot.infra.settings import get_settings
 from apps.bot.services import crash as crash_service
+from apps.bot.ws.bus import EventBus, create_event_bus
+from apps.bot.ws.connection import CrashConnection, OverflowPolicy
+from apps.bot.ws.leader import LeaderLease
+from apps.bot.ws.liveness import LivenessWheel
+from apps.bot.ws.local_hub import LocalHubEventBus
+from apps.bot.ws.presence import PresenceMap
+from apps.bot.ws.registry import ConnectionRegistry
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter()
 
 
+def _encode(payload: dict[str, Any]) -> str:
+    return orjson.dumps(payload, default=str).decode()
+
+
+_PONG_FRAME = _encode({"type": "pong"})
+
+
+def _with_event_id(frame: str, event_id: str | None) -> str:
+    # Splice the bus id into the already encoded object instead of re-encoding it.
+    if event_id is None:
+        return frame
+    return f'{{"eventId":"{event_id}",{frame[1:]}'
+
+
+def _batch_frame(frames: list[str]) -> str:
+    if len(frames) == 1:
+        return frames[0]
+    return '{"type":"batch","events":[' + ",".join(frames) + "]}"
+
+
+def _event_room(event: dict[str, Any]) -> str:
+    return event.get("room") or crash_service.DEFAULT_ROOM
+
+
+def _collapse_balances(items: list[tuple[dict[str, Any], str]]) -> list[tuple[dict[str, Any], str]]:
+    """Keep only the last `balance-update` per user, leaving other events in order."""
+    latest: dict[int, int] = {}
+    for position, (payload, _) in enumerate(items):
+        if payload.get("type") == "balance-update":
+            latest[int(payload.get("userId", 0))] = position
+    return [
+        item
+        for position, item in enumerate(items)
+        if item[0].get("type") != "balance-update" or latest[int(item[0].get("userId", 0))] == position
+    ]
+
+
+@dataclass
+class _RoomView:
+    """A node's sockets subscribed to one crash room and the room's round as events show it."""
+
+    connections: ConnectionRegistry[CrashConnection] = field(default_factory=ConnectionRegistry)
+    # Latest round summary seen, whether emitted here or delivered by the bus.
+    last_round: dict | None = None
+    # Pre-encoded `sync` and `session-history` frames shared by every
+    # handshake; kept current from round events, loaded from the DB once.
+    sync_frame: str | None = None
+    history: list[dict] | None = None
+    history_frame: str | None = None
+    # Round currently flying (as seen through delivered events) and the
+    # cashouts delivered since the last tick, as [userId, multiplier, payout].
+    flying: dict | None = None
+    tick_cashouts: list[list] = field(default_factory=list)
+
+
 class CrashWebSocketManager:
     EVENT_CHANNEL = "crash:events"
+    EVENT_STREAM = "crash:events:stream"
+    BROADCAST_EVENTS = frozenset({"game-start", "game-flying", "game-crash"})
+    # Sent only to nodes holding a socket for the user. `cashout-processed`
+    # still goes everywhere: every node folds cashouts into its tick frames.
+    ROUTED_EVENTS = frozenset({"balance-update", "bet-accepted"})
+    USER_EVENTS = frozenset({"balance-update", "bet-accepted", "cashout-processed"})
+    # Per room (see `_room_key`): the round-loop lease, and the full state of
+    # the room's current round, written by its leader before the events.
     ROUND_LOCK_KEY = "crash:round-loop"
-    ROUND_LOCK_TTL = 10
+    ROUND_STATE_KEY = "crash:round:state"
+    # Keys of the round summary carried by `sync`, as built by the crash service.
+    SYNC_KEYS = ("id", "room", "phase", "seed", "startTime", "betEndTime", "crashTime", "crashPoint")
+    HISTORY_LIMIT = 30
 
     def __init__(self, database: Database, redis: Redis) -> None:
         self._database = database
         self._redis = redis
-        self._connections: dict[int, set[WebSocket]] = {}
-        self._round_task: asyncio.Task | None = None
-        self._pubsub_task: asyncio.Task | None = None
-        self._pubsub = None
-        self._lock = asyncio.Lock()
-        self._last_round: dict | None = None
+        self._connections: ConnectionRegistry[CrashConnection] = ConnectionRegistry()
+        self._rooms = crash_service.crash_rooms()
+        self._views: dict[str, _RoomView] = {}
+        self._round_tasks: dict[str, asyncio.Task] = {}
         self._node_id = secrets.token_hex(8)
+        if settings.web_workers > 1:
+            self._bus = LocalHubEventBus(settings.crash_ws_hub_path, self._make_bus)
+        else:
+            self._bus = self._make_bus(True, True)
+        self._bus_started = False
+        # Every room has its own lease, so each is led by whichever node wins it.
+        self._leases = {
+            room: LeaderLease(
+                redis, self._room_key(self.ROUND_LOCK_KEY, room), self._node_id, ttl_ms=settings.crash_leader_ttl_ms
+            )
+            for room in self._rooms
+        }
+        self._presence = PresenceMap(redis, self._node_id, ttl=settings.crash_presence_ttl)
+        self._presence_task: asyncio.Task | None = None
+        # Events emitted during the current batch window, as (payload, frame).
+        self._outbox: list[tuple[dict[str, Any], str]] = []
+        self._flush_task: asyncio.Task | None = None
+        self._liveness: LivenessWheel | None = None
+        self._liveness_task: asyncio.Task | None = None
+        if settings.crash_ws_idle_timeout > 0:
+            self._liveness = LivenessWheel(settings.crash_ws_idle_timeout, self._evict_idle)
+        self._cashout_batcher: crash_service.CashoutBatcher | None = None
+        self._tick_task: asyncio.Task | None = None
+        self._handshake_lock = asyncio.Lock()
+
+    def _make_bus(self, shared: bool, direct: bool) -> EventBus:
+        return create_event_bus(
+            self._redis,
+            settings.crash_event_bus,
+            self._node_id,
+            channel=self.EVENT_CHANNEL,
+            stream=self.EVENT_STREAM,
+            maxlen=settings.crash_event_stream_maxlen,
+            shared=shared,
+            direct=direct,
+        )
+
+    @staticmethod
+    def _room_key(key: str, room: str) -> str:
+        # The main room keeps the keys from before rooms existed, so nodes on
+        # both sides of a rolling deploy agree on its lease.
+        return key if room == crash_service.DEFAULT_ROOM else f"{key}:{room}"
+
+    def _view(self, room: str) -> _RoomView:
+        view = self._views.get(room)
+        if view is None:
+            view = self._views[room] = _RoomView()
+        return view
 
     async def start(self) -> None:
         crash_service.set_auto_cashout_consumer(self._handle_auto_cashout_event)
+        if settings.crash_cashout_batch_ms > 0 and self._cashout_batcher is None:
+            self._cashout_batcher = crash_service.CashoutBatcher(self._database.session)
+            crash_service.set_cashout_batcher(self._cashout_batcher)
         await self._drain_pending_auto_cashouts()
-        if self._pubsub_task is None:
-            await self._start_pubsub()
-        if self._round_task is None:
-            self._round_task = asyncio.create_task(self._round_loop())
+        if not self._bus_started:
+            await self._bus.start(self._on_bus_event)
+            self._bus_started = True
+        for room in self._rooms:
+            if room not in self._round_tasks:
+                self._round_tasks[room] = asyncio.create_task(self._round_loop(room))
+        if self._tick_task is None and settings.crash_tick_hz > 0:
+            self._tick_task = asyncio.create_task(self._tick_loop())
+        if self._presence_task is None:
+            self._presence_task = asyncio.create_task(self._presence_loop())
+        if self._liveness is not None and self._liveness_task is None:
+            self._liveness_task = asyncio.create_task(self._liveness.run())
 
     async def stop(self) -> None:
         crash_service.set_auto_cashout_consumer(None)
-        if self._round_task:
-            self._round_task.cancel()
+        if self._cashout_batcher is not None:
+            crash_service.set_cashout_batcher(None)
+            await self._cashout_batcher.close()
+            self._cashout_batcher = None
+        round_tasks, self._round_tasks = list(self._round_tasks.values()), {}
+        for task in round_tasks:
+            task.cancel()
+        for task in round_tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        if self._tick_task:
+            self._tick_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._tick_task
+            self._tick_task = None
+        if self._liveness_task:
+            self._liveness_task.cancel()
             with contextlib.suppress(asyncio.CancelledError):
-                await self._round_task
-            self._round_task = None
-        if self._pubsub_task:
-            self._pubsub_task.cancel()
+                await self._liveness_task
+            self._liveness_task = None
+        if self._presence_task:
+            self._presence_task.cancel()
             with contextlib.suppress(asyncio.CancelledError):
-                await self._pubsub_task
-            self._pubsub_task = None
-        if self._pubsub is not None:
+                await self._presence_task
+            self._presence_task = None
             with contextlib.suppress(Exception):
-                await self._pubsub.unsubscribe(self.EVENT_CHANNEL)
-                await self._pubsub.close()
-            self._pubsub = None
+                await self._presence.clear(self._connections.users())
+        if self._flush_task:
+            self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+        with contextlib.suppress(Exception):
+            await self._flush_outbox()
+        if self._bus_started:
+            await self._bus.stop()
+            self._bus_started = False
 
     async def handle_websocket(self, websocket: WebSocket) -> None:
         await websocket.accept()
@@ -81,49 +243,76 @@ class CrashWebSocketManager:
             return
         user_id = int(payload.get("sub", 0))
         logger.info(f"WS Auth success for user_id={user_id}")
+        room = str(auth_message.get("room") or crash_service.DEFAULT_ROOM)
+        if room not in self._rooms:
+            await websocket.close(code=4404)
+            return
+        last_event_id = auth_message.get("lastEventId")
+        connection: CrashConnection | None = None
         async with self._database.session() as session:
             try:
-                user = await session.get(User, user_id)
-                if user is None or user.banned:
+                row = (
+                    await session.execute(
+                        select(User, Wallet).outerjoin(Wallet, Wallet.user_id == User.id).where(User.id == user_id)
+                    )
+                ).first()
+                if row is None or row[0].banned:
                     await websocket.close(code=4403)
                     return
-                snapshot = await crash_service.get_state(session, user.id)
-                history = await crash_service.get_recent_history(session, limit=30)
+                user, wallet = row
+                if wallet is None:
+                    wallet = await get_wallet_balance(session, user_id)
+                # Registered paused: live events queue up behind the handshake
+                # instead of racing it or slipping between snapshot and register.
+                connection = await self._register(user_id, websocket, room=room, paused=True)
+                handshake = [
+                    _encode(
+                        {
+                            "type": "auth-success",
+                            "user": {
+                                "id": user_id,
+                                "telegramId": payload.get("tg_id"),
+                                "username": user.username,
+                            },
+                        }
+                    )
+                ]
+                balance_frame = _encode(
+                    {"type": "balance-update", "userId": user_id, "balance": wallet.coins_cash + wallet.coins_bonus}
+                )
+                missed = await self._replay(user_id, str(last_event_id), room) if last_event_id else None
+                if missed is not None:
+                    # Balance updates are routed per node and never land in the
+                    # shared stream, so the balance read above is sent instead.
+                    handshake.append(_encode({"type": "resumed", "missed": len(missed)}))
+                    handshake.extend(missed)
+                    handshake.append(balance_frame)
+                else:
+                    sync_frame, history_frame = await self._shared_handshake(session, room)
+                    handshake.extend((sync_frame, balance_frame, history_frame))
             except Exception:
                 await session.rollback()
+                if connection is not None:
+                    connection.close()
                 raise
             else:
                 await session.commit()
-        await websocket.send_json(
-            {
-                "type": "auth-success",
-                "user": {
-                    "id": user_id,
-                    "telegramId": payload.get("tg_id"),
-                    "username": user.username,
-                },
-            }
-        )
-        await websocket.send_json({"type": "sync", **snapshot.session})
-        await websocket.send_json({"type": "balance-update", "userId": user_id, "balance": snapshot.balance["total"]})
-        await websocket.send_json({"type": "session-history", "history": history})
-
-        await self._register(user_id, websocket)
+        # The whole handshake goes out as a single WS frame.
+        connection.prepend([_batch_frame(handshake)])
+        connection.resume()
         try:
             while True:
+                # No per-message timeout: the liveness wheel closes sockets
+                # that stay silent for CRASH_WS_IDLE_TIMEOUT seconds.
                 try:
-                    # Wait for messages with a timeout (e.g. 60s)
-                    # If client doesn't ping, we disconnect
-                    message = await asyncio.wait_for(websocket.receive_json(), timeout=60.0)
-                except asyncio.TimeoutError:
-                    logger.info(f"WS Client timeout user_id={user_id}")
-                    break
-                except WebSocketDisconnect:
+                    message = await websocket.receive_json()
+                except (WebSocketDisconnect, RuntimeError):
                     break
-                if message.get("type") == "ping":
-                    await websocket.send_json({"type": "pong"})
+                connection.last_seen = time.monotonic()
+                if message.get("type") == "ping" and settings.crash_ws_reply_pong:
+                    connection.enqueue(_PONG_FRAME, critical=False, coalesce_key="pong")
         finally:
-            await self._unregister(user_id, websocket)
+            await self._unregister(connection)
 
     async def notify_bet(self, user_id: int, snapshot: crash_service.CrashSnapshot) -> None:
         await self._emit_event(
@@ -132,6 +321,7 @@ class CrashWebSocketManager:
                 "userId": user_id,
                 "bet": snapshot.bet,
                 "sessionId": snapshot.session["id"],
+                "room": snapshot.session["room"],
             }
         )
         await self._emit_event(
@@ -145,58 +335,286 @@ class CrashWebSocketManager:
                 "userId": user_id,
                 "cashout": snapshot.cashout,
                 "sessionId": snapshot.session["id"],
+                "room": snapshot.session["room"],
             }
         )
         await self._emit_event(
             {"type": "balance-update", "userId": user_id, "balance": snapshot.balance["total"]},
         )
 
-    async def _register(self, user_id: int, websocket: WebSocket) -> None:
-        async with self._lock:
-            self._connections.setdefault(user_id, set()).add(websocket)
-
-    async def _unregister(self, user_id: int, websocket: WebSocket) -> None:
-        async with self._lock:
-            conns = self._connections.get(user_id)
-            if conns and websocket in conns:
-                conns.remove(websocket)
-            if conns is not None and not conns:
-                self._connections.pop(user_id, None)
+    async def _register(
+        self,
+        user_id: int,
+        websocket: WebSocket,
+        *,
+        room: str = crash_service.DEFAULT_ROOM,
+        paused: bool = False,
+    ) -> CrashConnection:
+        connection = CrashConnection(
+            websocket,
+            user_id,
+            room=room,
+            max_queue=settings.crash_ws_queue_size,
+            policy=OverflowPolicy(settings.crash_ws_overflow_policy),
+            send_timeout=settings.crash_ws_send_timeout,
+            on_close=self._discard,
+            paused=paused,
+        )
+        self._connections.add(connection)
+        self._view(room).connections.add(connection)
+        if self._liveness is not None:
+            self._liveness.add(connection)
+        if len(self._connections.for_user(user_id)) == 1:
+            try:
+                await self._presence.add(user_id)
+            except RedisError:
+                # The connection still works locally; the next heartbeat
+                # publishes the user's presence.
+                logger.warning("Crash presence add failed user_id=%s", user_id, exc_info=True)
+        return connection
+
+    async def _unregister(self, connection: CrashConnection) -> None:
+        connection.close()
+
+    def _discard(self, connection: CrashConnection) -> None:
+        if self._liveness is not None:
+            self._liveness.discard(connection)
+        self._view(connection.room).connections.remove(connection)
+        if self._connections.remove(connection) and not self._connections.for_user(connection.user_id):
+            asyncio.get_running_loop().create_task(self._leave(connection.user_id))
+
+    @staticmethod
+    def _evict_idle(connection: CrashConnection) -> None:
+        logger.info("WS Client timeout user_id=%s", connection.user_id)
+        connection.close(reason="idle")
+
+    async def _leave(self, user_id: int) -> None:
+        # A reconnect on this node may have re-added the user meanwhile; if the
+        # removal still wins the race, the next heartbeat restores the entry.
+        if self._connections.for_user(user_id):
+            return
+        try:
+            await self._presence.remove(user_id)
+        except RedisError:
+            # The entry expires with the presence TTL.
+            logger.warning("Crash presence remove failed user_id=%s", user_id, exc_info=True)
 
-    async def _round_loop(self) -> None:
-        lock = self._redis.lock(self.ROUND_LOCK_KEY, timeout=self.ROUND_LOCK_TTL)
+    async def _presence_loop(self) -> None:
+        interval = settings.crash_presence_ttl / 3
         while True:
+            await asyncio.sleep(interval)
             try:
-                acquired = await lock.acquire(blocking=False)
-                if not acquired:
-                    await asyncio.sleep(1)
+                await self._presence.heartbeat(self._connections.users())
+            except Exception:
+                logger.exception("Crash presence heartbeat failed")
+
+    async def _replay(
+        self, user_id: int, last_event_id: str, room: str = crash_service.DEFAULT_ROOM
+    ) -> list[str] | None:
+        """Frames this user missed after `last_event_id`, or None if a full sync is needed.
+
+        Event ids are `<stream entry id>-<index in the batch>`, so the entry the
+        client stopped in is read again and its already seen events skipped.
+        """
+        entry_id, _, index = last_event_id.rpartition("-")
+        if entry_id.count("-") != 1 or not index.isdigit():
+            return None
+        limit = settings.crash_ws_queue_size
+        entries = await self._bus.replay(entry_id, limit, inclusive=True)
+        if entries is None:
+            return None
+        frames = []
+        for stream_id, data in entries:
+            for position, frame in enumerate(data.split("\n")):
+                if stream_id == entry_id and position <= int(index):
                     continue
+                event = orjson.loads(frame)
+                if event.get("type") in self.BROADCAST_EVENTS:
+                    wanted = _event_room(event) == room
+                else:
+                    wanted = int(event.get("userId", 0)) == user_id
+                if wanted:
+                    frames.append(_with_event_id(frame, f"{stream_id}-{position}"))
+        if len(frames) > limit:
+            return None
+        return frames
+
+    async def _shared_handshake(self, session: AsyncSession, room: str = crash_service.DEFAULT_ROOM) -> tuple[str, str]:
+        """The room's cached `sync` and `session-history` frames, loading them on first use.
+
+        Concurrent connects wait on one load instead of each querying the DB.
+        Before the room's first round the `sync` frame carries no round and
+        is not cached; the first round event fills the cache.
+        """
+        view = self._view(room)
+        if view.sync_frame is None or view.history_frame is None:
+            async with self._handshake_lock:
+                if view.sync_frame is None:
+                    try:
+                        summary = await crash_service.get_round_summary(session, room)
+                    except ValueError:
+                        summary = None
+                    # A round event delivered during the query is newer; keep it.
+                    if view.sync_frame is None and summary is not None:
+                        self._cache_sync(view, summary)
+                if view.history_frame is None:
+                    history = await crash_service.get_recent_history(session, limit=self.HISTORY_LIMIT, room=room)
+                    if view.history_frame is None:
+                        view.history = history
+                        view.history_frame = _encode({"type": "session-history", "history": history})
+        if view.sync_frame is None:
+            return _encode({"type": "sync", **dict.fromkeys(self.SYNC_KEYS)}), view.history_frame
+        return view.sync_frame, view.history_frame
+
+    def _cache_sync(self, view: _RoomView, summary: dict[str, Any]) -> None:
+        view.sync_frame = _encode({"type": "sync", **{key: summary.get(key) for key in self.SYNC_KEYS}})
+
+    def _cache_round_event(self, event: dict[str, Any]) -> None:
+        """Refresh the room's cached handshake frames from a delivered round event."""
+        view = self._view(_event_room(event))
+        self._cache_sync(view, event)
+        view.last_round = {key: event.get(key) for key in self.SYNC_KEYS}
+        if event["type"] != "game-crash" or view.history is None:
+            return
+        if view.history and view.history[0]["roundId"] == event["id"]:
+            return
+        entry = {
+            "roundId": event["id"],
+            "crashPoint": float(event.get("crashPoint") or 1.0),
+            "crashedAt": event["crashTime"],
+        }
+        view.history = [entry, *view.history][: self.HISTORY_LIMIT]
+        view.history_frame = _encode({"type": "session-history", "history": view.history})
+
+    async def _round_loop(self, room: str = crash_service.DEFAULT_ROOM) -> None:
+        """Lead the room's rounds while holding its lease, otherwise stand by warm.
+
+        Standbys poll the lease several times per TTL and keep their engine on
+        the round the leader publishes to Redis, so a dead leader is replaced
+        within one TTL plus a poll, and the new one starts with a single fenced
+        update. The engine is registered on every node: request handlers read
+        the round from it and never query `crash_rounds` for it.
+
+        A node polls a room's lease more slowly the more rooms it already
+        leads, so free rooms tend to go to the least loaded node.
+        """
+        engine = crash_service.CrashRoundEngine(room)
+        lease = self._leases[room]
+        poll = settings.crash_leader_ttl_ms / 1000 / 8
+        crash_service.set_round_engine(engine, room)
+        try:
+            while True:
                 try:
-                    while True:
-                        async with self._database.session() as session:
-                            try:
-                                summary = await crash_service.get_round_summary(session)
-                            except Exception:
-                                await session.rollback()
-                                raise
-                            else:
-                                await session.commit()
-                        await self._maybe_emit_round_events(summary)
-                        await lock.extend(self.ROUND_LOCK_TTL)
-                        await asyncio.sleep(1)
-                finally:
-                    if await lock.locked():
+                    if not await lease.acquire():
+                        await self._warm_standby(engine)
+                        await asyncio.sleep(poll * (1 + self._rooms_led()))
+                        continue
+                    engine.fencing_token = lease.token
+                    logger.info(
+                        "Crash room %s leader is %s with token %s", room, self._node_id, engine.fencing_token
+                    )
+                    try:
+                        await self._lead(engine)
+                    finally:
+                        engine.fencing_token = None
                         with contextlib.suppress(Exception):
-                            await lock.release()
-            except asyncio.CancelledError:
-                raise
-            except Exception as exc:
-                # TODO: Add proper logging
-                print(f"Error in round loop: {exc}")
-                await asyncio.sleep(1)
+                            await lease.release()
+                except asyncio.CancelledError:
+                    raise
+                except crash_service.LeadershipLost as exc:
+                    logger.warning("Crash room %s leadership lost: %s", room, exc)
+                except Exception:
+                    logger.exception("Error in crash round loop of room %s", room)
+                    engine.reset()
+                    await asyncio.sleep(1)
+        finally:
+            if crash_service.get_round_engine(room) is engine:
+                crash_service.set_round_engine(None, room)
+
+    def _rooms_led(self) -> int:
+        return sum(lease.held for lease in self._leases.values())
+
+    async def _lead(self, engine: crash_service.CrashRoundEngine) -> None:
+        """Drive the room's round while the lease holds.
+
+        The loop sleeps until the next known deadline (phase change, cooldown
+        end or auto-cashout threshold) and opens a database session only when
+        one has passed; in between it wakes just to renew the lease in Redis.
+        """
+        lease = self._leases[engine.room]
+        renew_every = settings.crash_leader_ttl_ms / 1000 / 3
+        renew_at = time.monotonic() + renew_every
+        if not lease.held:
+            raise crash_service.LeadershipLost("lease expired before the claim")
+        async with self._database.session() as session:
+            await engine.claim(session)
+        await self._publish_round(engine)
+        while True:
+            if not lease.held:
+                raise crash_service.LeadershipLost("lease expired")
+            summaries: list[dict] = []
+            if engine.due():
+                async with self._database.session() as session:
+                    try:
+                        summaries = await engine.advance(session)
+                    except crash_service.LeadershipLost:
+                        raise
+                    except Exception:
+                        await session.rollback()
+                        engine.reset()
+                        raise
+                    else:
+                        await session.commit()
+            if summaries:
+                # Published before the events, so a node reacting to one finds the new state.
+                await self._publish_round(engine)
+            for summary in summaries:
+                await self._maybe_emit_round_events(summary)
+            if time.monotonic() >= renew_at:
+                if not await lease.renew():
+                    raise crash_service.LeadershipLost("lease taken over")
+                renew_at = time.monotonic() + renew_every
+            delay = self._seconds_until(engine.next_deadline())
+            await asyncio.sleep(min(delay, max(0.0, renew_at - time.monotonic())))
+
+    async def _publish_round(self, engine: crash_service.CrashRoundEngine) -> None:
+        round_state = engine.round
+        if round_state is None:
+            return
+        epoch, seq = engine.next_version()
+        data = orjson.dumps({"epoch": epoch, "seq": seq, "round": round_state.to_payload()}).decode()
+        key = self._room_key(self.ROUND_STATE_KEY, engine.room)
+        if not await self._leases[engine.room].set_if_held(key, data):
+            raise crash_service.LeadershipLost("lease taken over before publishing the round")
+
+    async def _warm_standby(self, engine: crash_service.CrashRoundEngine) -> None:
+        # Re-read the published round only when the bus shows it moved on, or
+        # when its next deadline passed and the event may have been missed.
+        seen = self._view(engine.room).last_round
+        current = engine.round
+        if current is not None:
+            moved = seen is not None and (seen["id"], seen["phase"]) != (current.id, current.status)
+            deadline = engine.next_deadline()
+            if not moved and (deadline is None or crash_service._now() < deadline):
+                return
+        data = await self._redis.get(self._room_key(self.ROUND_STATE_KEY, engine.room))
+        if data is not None:
+            published = orjson.loads(data)
+            engine.adopt(
+                crash_service.RoundState.from_payload(published["round"]), (published["epoch"], published["seq"])
+            )
+
+    @staticmethod
+    def _seconds_until(deadline: datetime | None) -> float:
+        # Wake exactly at the next transition or auto-cashout threshold; the
+        # lease renewal bounds the sleep when there is none.
+        if deadline is None:
+            return math.inf
+        return max(0.0, (deadline - crash_service._now()).total_seconds())
 
     async def _maybe_emit_round_events(self, summary: dict) -> None:
-        last = self._last_round
+        view = self._view(_event_room(summary))
+        last = view.last_round
         event_type = None
         if last is None or summary["id"] != last["id"]:
             event_type = "game-start"
@@ -208,99 +626,207 @@ class CrashWebSocketManager:
         if event_type:
             payload = {"type": event_type, "sessionId": summary["id"], **summary}
             await self._emit_event(payload)
-        self._last_round = summary
-
-    async def _send_to_user(self, user_id: int, payload: dict) -> None:
-        async with self._lock:
-            sockets = list(self._connections.get(user_id, set()))
-        await self._send_many(sockets, payload)
-
-    async def _broadcast_local(self, payload: dict) -> None:
-        async with self._lock:
-            sockets = [ws for ws_set in self._connections.values() for ws in ws_set]
-        await self._send_many(sockets, payload)
-
-    async def _send_many(self, sockets: list[WebSocket], payload: dict) -> None:
-        if not sockets:
-            return
-
-        async def _send_one(websocket: WebSocket) -> WebSocket | None:
-            try:
-                await asyncio.wait_for(websocket.send_json(payload), timeout=0.5)
-                return None
-            except Exception:
-                return websocket
-
-        results = await asyncio.gather(*[_send_one(ws) for ws in sockets], return_exceptions=True)
-        
-        stale = []
-        for result in results:
-            if isinstance(result, WebSocket):
-                stale.append(result)
-            elif isinstance(result, Exception):
-                # Should not happen due to return_exceptions=True but safe to handle
-                pass
-        
-        for websocket in stale:
-            await self._remove_socket(websocket)
-
-    async def _remove_socket(self, websocket: WebSocket) -> None:
-        with contextlib.suppress(Exception):
-            await websocket.close()
-        async with self._lock:
-            for user_id, conns in list(self._connections.items()):
-                if websocket in conns:
-                    conns.remove(websocket)
-                    if not conns:
-                        self._connections.pop(user_id, None)
-                    break
+        view.last_round = summary
 
     async def _emit_event(self, event: dict[str, Any], publish: bool = True) -> None:
         payload = dict(event)
         payload["origin"] = self._node_id
-        await self._deliver_event(payload)
-        if publish:
-            await self._redis.publish(self.EVENT_CHANNEL, json.dumps(payload, default=str))
-
-    async def _deliver_event(self, event: dict[str, Any]) -> None:
-        event_type = event.get("type")
-        if event_type in {"bet-accepted", "cashout-processed"}:
-            user_id = int(event.get("userId", 0))
-            await self._send_to_user(user_id, event)
-        if event_type in {"bet-accepted", "cashout-processed"}:
-            # nothing else to do here; balance update handled separately
-            return
-        if event_type == "balance-update":
-            await self._send_to_user(int(event.get("userId", 0)), event)
+        # Encoded once: the same frame goes to local sockets and to the other nodes.
+        frame = _encode(payload)
+        if not publish:
+            await self._deliver_batch([(payload, frame)])
             return
-        if event_type in {"game-start", "game-flying", "game-crash"}:
-            await self._broadcast_local(event)
+        self._outbox.append((payload, frame))
+        if settings.crash_event_batch_ms <= 0:
+            await self._flush_outbox()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
 
-    async def _start_pubsub(self) -> None:
-        self._pubsub = self._redis.pubsub()
-        await self._pubsub.subscribe(self.EVENT_CHANNEL)
-        self._pubsub_task = asyncio.create_task(self._pubsub_loop())
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(settings.crash_event_batch_ms / 1000)
+            await self._flush_outbox()
+        except asyncio.CancelledError:
+            self._flush_task = None
+            raise
+        except Exception:
+            logger.exception("Crash event flush failed")
+        self._flush_task = None
+        if self._outbox:
+            # Emitted while the bus publish was in flight: no flush was armed for them.
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_outbox(self) -> None:
+        """Publish everything emitted during the batch window, then deliver it locally.
+
+        Shared events go out as one bus message (frames joined by newlines) and
+        routed ones as one message per owning node. Only the latest
+        `balance-update` per user survives the window. Local sockets get the
+        batch even when Redis is unreachable; only the other nodes miss it.
+        """
+        items, self._outbox = self._outbox, []
+        if not items:
+            return
+        items = _collapse_balances(items)
+        shared = [(payload, frame) for payload, frame in items if payload["type"] not in self.ROUTED_EVENTS]
+        routed = [(payload, frame) for payload, frame in items if payload["type"] in self.ROUTED_EVENTS]
+        delivered: dict[int, str] = {}
+        if shared:
+            try:
+                entry_id = await self._bus.publish("\n".join(frame for _, frame in shared))
+            except Exception:
+                logger.exception("Crash event publish failed")
+                entry_id = None
+            if entry_id is not None:
+                delivered = {
+                    id(payload): _with_event_id(frame, f"{entry_id}-{index}")
+                    for index, (payload, frame) in enumerate(shared)
+                }
+        if routed:
+            try:
+                await self._publish_to_owners(routed)
+            except Exception:
+                logger.exception("Crash user event publish failed")
+        await self._deliver_batch([(payload, delivered.get(id(payload), frame)) for payload, frame in items])
+
+    async def _publish_to_owners(self, items: list[tuple[dict[str, Any], str]]) -> None:
+        """Send user events only to the other nodes the presence map lists for each user."""
+        user_ids = {int(payload.get("userId", 0)) for payload, _ in items}
+        owners = await self._presence.nodes_for_many(user_ids)
+        per_node: dict[str, list[str]] = {}
+        for payload, frame in items:
+            for node_id in owners[int(payload.get("userId", 0))]:
+                if node_id != self._node_id:
+                    per_node.setdefault(node_id, []).append(frame)
+        for node_id, frames in per_node.items():
+            await self._bus.publish_to(node_id, "\n".join(frames))
+
+    async def _deliver_event(self, event: dict[str, Any], frame: str) -> None:
+        await self._deliver_batch([(event, frame)])
+
+    async def _deliver_batch(self, items: list[tuple[dict[str, Any], str]]) -> None:
+        """Fan a batch of events out to local sockets, one WS frame per socket.
+
+        Round events go to the sockets subscribed to their room. Sockets of
+        users with their own events in the batch get those merged in order with
+        their room's round events (balance updates reach every room, the rest
+        only the room they happened in); every other socket of a room shares
+        one frame. Events of users without a socket on this node are only
+        recorded.
+        """
+        items = _collapse_balances(items)
+        # room -> [(position, type, frame)] of its round events.
+        broadcast: dict[str, list[tuple[int, str, str]]] = {}
+        # user id -> [(position, type, frame, room)] for users with a local
+        # socket; the room is None for events shown in every room.
+        targeted: dict[int, list[tuple[int, str, str, str | None]]] = {}
+        absent: set[int] = set()
+        for position, (payload, frame) in enumerate(items):
+            event_type = payload.get("type")
+            if event_type == "cashout-processed":
+                self._record_tick_cashout(payload)
+            if event_type in self.BROADCAST_EVENTS:
+                self._cache_round_event(payload)
+                await self._track_flight(payload)
+                broadcast.setdefault(_event_room(payload), []).append((position, event_type, frame))
+            elif event_type in self.USER_EVENTS:
+                user_id = int(payload.get("userId", 0))
+                if user_id in absent:
+                    continue
+                if user_id not in targeted and not self._connections.for_user(user_id):
+                    absent.add(user_id)
+                    continue
+                event_room = None if event_type == "balance-update" else _event_room(payload)
+                targeted.setdefault(user_id, []).append((position, event_type, frame, event_room))
+        for user_id, own in targeted.items():
+            # Most users have a single socket, so frames are built per socket.
+            for connection in self._connections.for_user(user_id):
+                frames = [item[:3] for item in own if item[3] is None or item[3] == connection.room]
+                room_broadcast = broadcast.get(connection.room)
+                if room_broadcast:
+                    frames = sorted(frames + room_broadcast)
+                if not frames:
+                    continue
+                frame = _batch_frame([frame for _, _, frame in frames])
+                if all(event_type == "balance-update" for _, event_type, _ in frames):
+                    # Only the latest balance matters, so a queued one is replaced rather than stacked.
+                    connection.enqueue(frame, critical=False, coalesce_key="balance")
+                else:
+                    connection.enqueue(frame)
+        for room, events in broadcast.items():
+            frame = _batch_frame([frame for _, _, frame in events])
+            # Queue one pre-encoded frame per connection: O(N) appends, no task per socket.
+            for connection in self._view(room).connections.snapshot():
+                if connection.user_id not in targeted:
+                    connection.enqueue(frame)
+
+    async def _broadcast_local(self, room: str, frame: str, *, critical: bool = True) -> None:
+        for connection in self._view(room).connections.snapshot():
+            connection.enqueue(frame, critical=critical)
+
+    async def _track_flight(self, event: dict[str, Any]) -> None:
+        room = _event_room(event)
+        view = self._view(room)
+        if event["type"] == "game-flying":
+            view.flying = event
+            view.tick_cashouts = []
+        elif view.flying is not None:
+            if event["type"] == "game-crash" and event.get("crashPoint") is not None:
+                # Last cashouts of the round still go out before the crash frame.
+                await self._tick(room, float(event["crashPoint"]))
+            view.flying = None
+            view.tick_cashouts = []
+
+    def _record_tick_cashout(self, event: dict[str, Any]) -> None:
+        cashout = event.get("cashout") or {}
+        view = self._views.get(_event_room(event))
+        if view is None or view.flying is None or event.get("sessionId") != view.flying.get("id"):
+            return
+        view.tick_cashouts.append([event.get("userId"), cashout.get("multiplier"), cashout.get("payout")])
 
-    async def _pubsub_loop(self) -> None:
-        assert self._pubsub is not None
+    async def _tick_loop(self) -> None:
+        interval = 1 / settings.crash_tick_hz
         while True:
+            await asyncio.sleep(interval)
+            for room in list(self._views):
+                try:
+                    await self._tick(room)
+                except Exception:
+                    logger.exception("Crash tick failed in room %s", room)
+
+    async def _tick(self, room: str = crash_service.DEFAULT_ROOM, multiplier: float | None = None) -> None:
+        """Broadcast one delta frame to the room: current multiplier plus cashouts since the last tick.
+
+        Every node ticks from its own clock and the events it already receives,
+        so ticks cost no Redis traffic, and a burst of cashouts costs one frame.
+        """
+        view = self._views.get(room)
+        flying = view.flying if view is not None else None
+        if flying is None:
+            return
+        if multiplier is None:
+            now_ms = crash_service._now().timestamp() * 1000
+            if now_ms >= flying["crashTime"]:
+                return
+            multiplier = crash_service.multiplier_after(now_ms - flying["betEndTime"])
+        cashouts, view.tick_cashouts = view.tick_cashouts, []
+        frame = _encode({"type": "tick", "s": flying["id"], "m": multiplier, "c": cashouts})
+        # Ticks are superseded by the next one, so a slow client may lose them first.
+        await self._broadcast_local(room, frame, critical=False)
+
+    async def _on_bus_event(self, event_id: str | None, data: str) -> None:
+        items = []
+        for index, frame in enumerate(data.split("\n")):
             try:
-                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                if message and message["type"] == "message":
-                    data = message["data"]
-                    if isinstance(data, bytes):
-                        data = data.decode()
-                    try:
-                        payload = json.loads(data)
-                    except (TypeError, json.JSONDecodeError):
-                        continue
-                    if payload.get("origin") == self._node_id:
-                        continue
-                    await self._deliver_event(payload)
-            except asyncio.CancelledError:
-                raise
-            except Exception:
-                await asyncio.sleep(1)
+                payload = orjson.loads(frame)
+            except orjson.JSONDecodeError:
+                continue
+            if payload.get("origin") == self._node_id:
+                continue
+            # Forward the published text as is instead of re-encoding it.
+            items.append((payload, _with_event_id(frame, f"{event_id}-{index}" if event_id else None)))
+        if items:
+            await self._deliver_batch(items)
 
     async def _handle_auto_cashout_event(self, event: crash_service.AutoCashoutEvent) -> None:
         asyncio.create_task(self._process_auto_cashout_event(event))
@@ -313,6 +839,7 @@ class CrashWebSocketManager:
                 "userId": event.user_id,
                 "cashout": snapshot.cashout,
                 "sessionId": snapshot.session["id"],
+                "room": snapshot.session["room"],
             }
         )
         await self._emit_event(
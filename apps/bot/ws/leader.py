@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import time
+
+from redis.asyncio import Redis
+from redis.exceptions import WatchError
+
+
+class LeaderLease:
+    """Short Redis lease naming the single node that drives crash rounds.
+
+    Every successful `acquire` draws a fencing token from `<key>:epoch`, so a
+    later leader always holds a larger token than any earlier one; the round
+    engine stamps it on the rows it mutates and refuses to touch rows stamped
+    by a newer leader. `held` is judged from the local clock against the time
+    the last acquire or renew was sent, so a leader that stalled past its TTL
+    stops acting before it even talks to Redis again.
+    """
+
+    def __init__(self, redis: Redis, key: str, node_id: str, *, ttl_ms: int) -> None:
+        self._redis = redis
+        self._key = key
+        self._node_id = node_id
+        self._ttl_ms = ttl_ms
+        self._expires = 0.0
+        self.token: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self.token is not None and time.monotonic() < self._expires
+
+    async def acquire(self) -> bool:
+        started = time.monotonic()
+        # The lease and its token are taken in one transaction: a node that
+        # stalls here can never draw a token older than a later leader's.
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self._key)
+                if await pipe.exists(self._key):
+                    return False
+                pipe.multi()
+                pipe.set(self._key, self._node_id, px=self._ttl_ms)
+                pipe.incr(f"{self._key}:epoch")
+                _, token = await pipe.execute()
+            except WatchError:
+                return False
+        self.token = int(token)
+        self._expires = started + self._ttl_ms / 1000
+        return True
+
+    async def renew(self) -> bool:
+        started = time.monotonic()
+        if not await self._if_owner(lambda pipe: pipe.pexpire(self._key, self._ttl_ms)):
+            self.token = None
+            return False
+        self._expires = started + self._ttl_ms / 1000
+        return True
+
+    async def release(self) -> None:
+        if self.token is None:
+            return
+        self.token = None
+        await self._if_owner(lambda pipe: pipe.delete(self._key))
+
+    async def set_if_held(self, key: str, value: str) -> bool:
+        """SET `key` only while the lease still names this node."""
+        return await self._if_owner(lambda pipe: pipe.set(key, value))
+
+    async def _if_owner(self, command) -> bool:
+        # WATCH/MULTI rather than a Lua script: the key must still name this
+        # node when the command runs.
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self._key)
+                if await pipe.get(self._key) != self._node_id:
+                    return False
+                pipe.multi()
+                command(pipe)
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Protocol, TypeVar
+
+logger = logging.getLogger(__name__)
+
+
+class _Tracked(Protocol):
+    last_seen: float
+
+
+C = TypeVar("C", bound=_Tracked)
+
+
+class LivenessWheel:
+    """Timer wheel that evicts connections silent for longer than `timeout`.
+
+    Activity only writes `connection.last_seen`; nothing is rescheduled per
+    message. Each connection sits in the slot of its next check, and a sweep
+    every `resolution` seconds looks at one slot: connections idle past the
+    timeout are evicted, the rest move to the slot of `last_seen + timeout`.
+    An idle connection therefore costs one check per timeout period.
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        on_idle: Callable[[C], None],
+        *,
+        resolution: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._timeout = timeout
+        self._on_idle = on_idle
+        self._resolution = resolution
+        self._clock = clock
+        self._slots: list[set] = [set() for _ in range(math.ceil(timeout / resolution) + 1)]
+        self._slot_of: dict[int, int] = {}
+        self._cursor = 0
+        self._swept_at = clock()
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def add(self, connection: C) -> None:
+        connection.last_seen = self._clock()
+        self._schedule(connection, connection.last_seen + self._timeout)
+
+    def discard(self, connection: C) -> None:
+        slot = self._slot_of.pop(id(connection), None)
+        if slot is not None:
+            self._slots[slot].discard(connection)
+
+    def _schedule(self, connection: C, deadline: float) -> None:
+        ticks = max(1, math.ceil((deadline - self._swept_at) / self._resolution))
+        slot = (self._cursor + min(ticks, len(self._slots) - 1)) % len(self._slots)
+        self._slots[slot].add(connection)
+        self._slot_of[id(connection)] = slot
+
+    def sweep(self) -> int:
+        """Process every slot that came due since the last sweep; returns evictions."""
+        now = self._clock()
+        evicted = 0
+        while self._swept_at + self._resolution <= now:
+            self._swept_at += self._resolution
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            due, self._slots[self._cursor] = self._slots[self._cursor], set()
+            for connection in due:
+                del self._slot_of[id(connection)]
+                if now - connection.last_seen >= self._timeout:
+                    evicted += 1
+                    self._on_idle(connection)
+                else:
+                    self._schedule(connection, connection.last_seen + self._timeout)
+        return evicted
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._resolution)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Crash WS liveness sweep failed")
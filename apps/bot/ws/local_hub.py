@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import itertools
+import logging
+import os
+import struct
+from typing import Callable
+
+import orjson
+
+from apps.bot.ws.bus import EventBus, EventHandler
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+# Builds the Redis bus for this worker: (listen to the shared channel, listen to the node channel).
+BusFactory = Callable[[bool, bool], EventBus]
+
+
+async def _read_message(reader: asyncio.StreamReader) -> list:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return orjson.loads(await reader.readexactly(size))
+
+
+def _pack(message: list) -> bytes:
+    body = orjson.dumps(message)
+    return _HEADER.pack(len(body)) + body
+
+
+class LocalHubEventBus(EventBus):
+    """Shares one Redis subscription between the uvicorn workers of a host.
+
+    The worker holding an exclusive lock on `<path>.lock` becomes the hub and
+    binds the Unix socket at `path`: it alone listens to the shared Redis
+    channel or stream and relays every message to the sibling workers
+    connected to the socket. Siblings publish through the hub too. Each
+    worker still listens to its own node channel directly, since routed
+    traffic there only concerns that worker's users.
+
+    The kernel drops the lock when the hub process exits, and siblings race
+    for it again; messages published during the handover are lost, as with
+    plain pub/sub.
+    """
+
+    RETRY_DELAY = 0.5
+
+    def __init__(self, path: str, make_bus: BusFactory) -> None:
+        self._path = path
+        self._make_bus = make_bus
+        self._direct = make_bus(False, True)
+        self._shared: EventBus | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._lock_fd: int | None = None
+        self._siblings: set[asyncio.StreamWriter] = set()
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count()
+        self._handler: EventHandler | None = None
+        self._task: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    async def start(self, handler: EventHandler) -> None:
+        self._handler = handler
+        await self._direct.start(handler)
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self._direct.stop()
+
+    async def publish(self, frame: str) -> str | None:
+        await self._ready.wait()
+        if self._shared is not None:
+            return await self._shared.publish(frame)
+        assert self._writer is not None
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(_pack(["pub", request_id, frame]))
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def publish_to(self, node_id: str, frame: str) -> None:
+        await self._direct.publish_to(node_id, frame)
+
+    async def replay(self, after_id: str, limit: int, *, inclusive: bool = False) -> list[tuple[str, str]] | None:
+        return await self._direct.replay(after_id, limit, inclusive=inclusive)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self._serve():
+                    return
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The hub holds the lock but has not bound the socket yet.
+                pass
+            except Exception:
+                logger.exception("Local crash event hub failed")
+            self._ready.clear()
+            await asyncio.sleep(self.RETRY_DELAY)
+
+    async def _serve(self) -> bool:
+        """Try to become the hub; returns False if another worker already is."""
+        fd = os.open(f"{self._path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        # A socket file left by a dead hub is replaced by start_unix_server.
+        self._server = await asyncio.start_unix_server(self._accept, path=self._path)
+        self._shared = self._make_bus(True, False)
+        await self._shared.start(self._relay)
+        logger.info("Crash WS worker %s is the local event hub", os.getpid())
+        self._ready.set()
+        try:
+            await asyncio.Future()
+        finally:
+            await self._shared.stop()
+            self._shared = None
+            self._server.close()
+            for writer in list(self._siblings):
+                writer.close()
+            self._server = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._path)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        return True
+
+    async def _relay(self, event_id: str | None, data: str) -> None:
+        packet = _pack(["evt", event_id, data])
+        for writer in list(self._siblings):
+            writer.write(packet)
+        assert self._handler is not None
+        await self._handler(event_id, data)
+        for writer in list(self._siblings):
+            with contextlib.suppress(ConnectionError):
+                await writer.drain()
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._siblings.add(writer)
+        try:
+            while True:
+                kind, request_id, frame = await _read_message(reader)
+                if kind == "pub":
+                    assert self._shared is not None
+                    event_id = await self._shared.publish(frame)
+                    writer.write(_pack(["ack", request_id, event_id]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._siblings.discard(writer)
+            writer.close()
+
+    async def _follow(self) -> None:
+        reader, self._writer = await asyncio.open_unix_connection(self._path)
+        self._ready.set()
+        assert self._handler is not None
+        try:
+            while True:
+                kind, key, value = await _read_message(reader)
+                if kind == "evt":
+                    await self._handler(key, value)
+                elif kind == "ack":
+                    future = self._pending.get(key)
+                    if future is not None and not future.done():
+                        future.set_result(value)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning("Local crash event hub went away, re-electing")
+        finally:
+            self._writer.close()
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("local event hub went away"))
+
+
+async def hold_host_lock(path: str, retry: float = 1.0) -> int:
+    """Wait until this process holds an exclusive lock on `path` and return its fd.
+
+    Used to run exactly one copy of per-host singletons (bot polling) across
+    uvicorn workers; the lock is released when the process exits.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            await asyncio.sleep(retry)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import time
+from typing import Iterable
+
+from redis.asyncio import Redis
+
+
+class PresenceMap:
+    """Which nodes hold a crash socket for a user, kept in Redis.
+
+    Each user has a sorted set of node ids scored by expiry time, so a node
+    that dies without cleaning up drops out once its entries stop being
+    refreshed by `heartbeat`. Lookups ignore expired members and the whole
+    key expires with the last one.
+    """
+
+    KEY_PREFIX = "crash:presence:"
+
+    def __init__(self, redis: Redis, node_id: str, *, ttl: int) -> None:
+        self._redis = redis
+        self._node_id = node_id
+        self._ttl = ttl
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+    async def add(self, user_id: int) -> None:
+        await self.heartbeat((user_id,))
+
+    async def remove(self, user_id: int) -> None:
+        await self._redis.zrem(self._key(user_id), self._node_id)
+
+    async def heartbeat(self, user_ids: Iterable[int]) -> None:
+        expires = time.time() + self._ttl
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                key = self._key(user_id)
+                pipe.zadd(key, {self._node_id: expires})
+                pipe.expire(key, self._ttl)
+            await pipe.execute()
+
+    async def clear(self, user_ids: Iterable[int]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zrem(self._key(user_id), self._node_id)
+            await pipe.execute()
+
+    async def nodes_for(self, user_id: int) -> list[str]:
+        return await self._redis.zrangebyscore(self._key(user_id), time.time(), "+inf")
+
+    async def nodes_for_many(self, user_ids: Iterable[int]) -> dict[int, list[str]]:
+        user_ids = list(user_ids)
+        now = time.time()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zrangebyscore(self._key(user_id), now, "+inf")
+            results = await pipe.execute()
+        return dict(zip(user_ids, results))
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Any, Generic, Protocol, TypeVar
+
+
+class _Registered(Protocol):
+    user_id: int
+    websocket: Any
+
+
+C = TypeVar("C", bound=_Registered)
+
+
+class ConnectionRegistry(Generic[C]):
+    """Copy-on-write index of live connections, safe without a lock.
+
+    Every method is synchronous, so on a single event loop no other task can
+    observe a half-applied change. Readers get immutable tuples: the per-user
+    tuple is replaced on each change, and the broadcast snapshot is rebuilt
+    at most once per batch of changes, on the next `snapshot()` call. A
+    broadcast in progress keeps iterating the tuple it already holds.
+
+    Sockets are indexed by `id()`: Starlette's WebSocket is a Mapping, and its
+    equality compares whole ASGI scopes.
+    """
+
+    def __init__(self) -> None:
+        self._by_user: dict[int, tuple[C, ...]] = {}
+        self._by_socket: dict[int, C] = {}
+        self._snapshot: tuple[C, ...] | None = ()
+
+    def __len__(self) -> int:
+        return len(self._by_socket)
+
+    def add(self, connection: C) -> None:
+        self._by_socket[id(connection.websocket)] = connection
+        self._by_user[connection.user_id] = (*self._by_user.get(connection.user_id, ()), connection)
+        self._snapshot = None
+
+    def remove(self, connection: C) -> bool:
+        key = id(connection.websocket)
+        if self._by_socket.get(key) is not connection:
+            return False
+        del self._by_socket[key]
+        remaining = tuple(item for item in self._by_user[connection.user_id] if item is not connection)
+        if remaining:
+            self._by_user[connection.user_id] = remaining
+        else:
+            del self._by_user[connection.user_id]
+        self._snapshot = None
+        return True
+
+    def get(self, websocket: Any) -> C | None:
+        return self._by_socket.get(id(websocket))
+
+    def for_user(self, user_id: int) -> tuple[C, ...]:
+        return self._by_user.get(user_id, ())
+
+    def users(self) -> tuple[int, ...]:
+        return tuple(self._by_user)
+
+    def snapshot(self) -> tuple[C, ...]:
+        if self._snapshot is None:
+            self._snapshot = tuple(self._by_socket.values())
+        return self._snapshot
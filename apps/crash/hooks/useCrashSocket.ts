@@ -15,10 +15,29 @@ export interface CrashGameState {
     crashTime: number;
     crashPoint: number | null;
     sessionId: string;
+    multiplier: number;
+}
+
+// [userId, multiplier, payout] as sent in `tick` frames
+export type LiveCashout = [number, number, number];
+
+// Event ids look like "<ms>-<seq>-<index in batch>"; compare them part by part.
+function isNewerEventId(id: string, last: string | null): boolean {
+    if (!last) return true;
+    const parts = id.split('-').map(Number);
+    const lastParts = last.split('-').map(Number);
+    for (let i = 0; i < Math.max(parts.length, lastParts.length); i++) {
+        const a = parts[i] ?? 0;
+        const b = lastParts[i] ?? 0;
+        if (a !== b) return a > b;
+    }
+    return false;
 }
 
 export function useCrashSocket({ token }: UseCrashSocketParams) {
     const wsRef = useRef<WebSocket | null>(null);
+    // Last bus event id seen, sent on reconnect so the server replays only what was missed.
+    const lastEventIdRef = useRef<string | null>(null);
     const [connected, setConnected] = useState(false);
     const [gameState, setGameState] = useState<CrashGameState>({
         phase: 'betting',
@@ -27,8 +46,10 @@ export function useCrashSocket({ token }: UseCrashSocketParams) {
         crashTime: 0,
         crashPoint: null,
         sessionId: '',
+        multiplier: 1,
     });
     const [history, setHistory] = useState<any[]>([]);
+    const [liveCashouts, setLiveCashouts] = useState<LiveCashout[]>([]);
     const [activeBet, setActiveBet] = useState<any>(null);
     const setBalance = useStore((state) => state.setBalance);
 
@@ -69,58 +90,79 @@ export function useCrashSocket({ token }: UseCrashSocketParams) {
 
         ws.onopen = () => {
             setConnected(true);
-            ws.send(JSON.stringify({ type: 'auth', token }));
+            ws.send(JSON.stringify({ type: 'auth', token, lastEventId: lastEventIdRef.current }));
+        };
+
+        const handleEvent = (data: any) => {
+            const type = data.type;
+            if (typeof data.eventId === 'string') {
+                // Replayed and live frames can overlap right after a resume.
+                if (!isNewerEventId(data.eventId, lastEventIdRef.current)) return;
+                lastEventIdRef.current = data.eventId;
+            }
+
+            if (type === 'auth-success') {
+                // Initial state might be sent here or separately?
+                // Backend sends: auth-success, sync, balance-update, session-history
+            } else if (type === 'sync') {
+                setGameState({
+                    phase: data.phase,
+                    startTime: data.startTime,
+                    betEndTime: data.betEndTime,
+                    crashTime: data.crashTime,
+                    crashPoint: data.crashPoint,
+                    sessionId: data.id,
+                    multiplier: 1,
+                });
+            } else if (type === 'balance-update') {
+                updateBalance(data);
+            } else if (type === 'session-history') {
+                setHistory(data.history);
+            } else if (type === 'game-start') {
+                setGameState(prev => ({
+                    ...prev,
+                    phase: 'betting',
+                    sessionId: data.id,
+                    startTime: data.startTime,
+                    betEndTime: data.betEndTime,
+                    crashTime: data.crashTime,
+                    crashPoint: null,
+                    multiplier: 1,
+                }));
+                setActiveBet(null); // Reset bet on new round
+                setLiveCashouts([]);
+            } else if (type === 'game-flying') {
+                setGameState(prev => ({
+                    ...prev,
+                    phase: 'flying',
+                }));
+            } else if (type === 'game-crash') {
+                setGameState(prev => ({
+                    ...prev,
+                    phase: 'crashed',
+                    crashPoint: data.crashPoint,
+                }));
+            } else if (type === 'tick') {
+                // Compact delta frame: s = sessionId, m = multiplier, c = cashouts since last tick
+                setGameState(prev => (String(prev.sessionId) === String(data.s) ? { ...prev, multiplier: data.m } : prev));
+                if (data.c.length) {
+                    setLiveCashouts(prev => [...prev, ...data.c]);
+                }
+            } else if (type === 'bet-accepted') {
+                setActiveBet(data.bet);
+            } else if (type === 'cashout-processed') {
+                setActiveBet((prev: any) => prev ? { ...prev, status: 'cashed_out', ...data.cashout } : null);
+            }
         };
 
         ws.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
-                const type = data.type;
-
-                if (type === 'auth-success') {
-                    // Initial state might be sent here or separately?
-                    // Backend sends: auth-success, sync, balance-update, session-history
-                } else if (type === 'sync') {
-                    setGameState({
-                        phase: data.phase,
-                        startTime: data.startTime,
-                        betEndTime: data.betEndTime,
-                        crashTime: data.crashTime,
-                        crashPoint: data.crashPoint,
-                        sessionId: data.id,
-                    });
-                } else if (type === 'balance-update') {
-                    updateBalance(data);
-                } else if (type === 'session-history') {
-                    setHistory(data.history);
-                } else if (type === 'game-start') {
-                    setGameState(prev => ({
-                        ...prev,
-                        phase: 'betting',
-                        sessionId: data.id,
-                        startTime: data.startTime,
-                        betEndTime: data.betEndTime,
-                        crashTime: data.crashTime,
-                        crashPoint: null,
-                    }));
-                    setActiveBet(null); // Reset bet on new round
-                } else if (type === 'game-flying') {
-                    setGameState(prev => ({
-                        ...prev,
-                        phase: 'flying',
-                    }));
-                } else if (type === 'game-crash') {
-                    setGameState(prev => ({
-                        ...prev,
-                        phase: 'crashed',
-                        crashPoint: data.crashPoint,
-                    }));
-                } else if (type === 'bet-accepted') {
-                    setActiveBet(data.bet);
-                } else if (type === 'cashout-processed') {
-                    setActiveBet((prev: any) => prev ? { ...prev, status: 'cashed_out', ...data.cashout } : null);
+                const message = JSON.parse(event.data);
+                // Events emitted in the same few-ms window arrive as one `batch` frame.
+                const events = message.type === 'batch' ? message.events : [message];
+                for (const data of events) {
+                    handleEvent(data);
                 }
-
             } catch (e) {
                 console.error("WS Parse error", e);
             }
@@ -152,5 +194,6 @@ export function useCrashSocket({ token }: UseCrashSocketParams) {
         gameState,
         history,
         activeBet,
+        liveCashouts,
     };
 }
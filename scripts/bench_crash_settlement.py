@@ -0,0 +1,114 @@
+"""Settlement time of a crashed round versus bet count.
+
+Compares the old per-bet loop (one `apply_turnover` per bet) with the bulk
+`_settle_bets` path. Runs against in-memory SQLite by default; pass a
+`DATABASE_URL`-style URL as the first argument to benchmark Postgres.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from apps.bot.core.awards import apply_turnover
+from apps.bot.db import Base
+from apps.bot.db.models import BonusAward, CrashBet, CrashBetStatus, CrashRound, CrashRoundStatus, TurnoverRule, User
+from apps.bot.services import crash as crash_service
+
+BET_COUNTS = (100, 1_000, 5_000)
+BONUS_SHARE = 10  # every N-th user holds an active bonus award
+
+
+async def _seed_round(session: AsyncSession, bets: int, tg_offset: int) -> int:
+    now = crash_service._now()
+    round_obj = CrashRound(
+        status=CrashRoundStatus.CRASHED.value,
+        seed="bench",
+        seed_hash="bench",
+        crash_point=1.5,
+        bet_ends_at=now - timedelta(seconds=10),
+        crash_at=now,
+    )
+    session.add(round_obj)
+    await session.flush()
+    user_ids = (
+        await session.scalars(
+            insert(User).returning(User.id),
+            [{"tg_id": tg_offset + index, "username": f"bench{index}"} for index in range(bets)],
+        )
+    ).all()
+    await session.execute(
+        insert(BonusAward),
+        [
+            {
+                "user_id": user_id,
+                "kind": "bench",
+                "granted": 1_000,
+                "wr_mult": 1,
+                "turnover_required": 1_000,
+                "cap_cashout": 1_000,
+            }
+            for user_id in user_ids[::BONUS_SHARE]
+        ],
+    )
+    await session.execute(
+        insert(CrashBet),
+        [{"round_id": round_obj.id, "user_id": user_id, "amount_cash": 100} for user_id in user_ids],
+    )
+    await session.commit()
+    return round_obj.id
+
+
+async def _legacy_settle(session: AsyncSession, round_id: int) -> None:
+    now = crash_service._now()
+    bets = (
+        await session.scalars(
+            select(CrashBet).where(CrashBet.round_id == round_id, CrashBet.status == CrashBetStatus.ACTIVE.value)
+        )
+    ).all()
+    for bet in bets:
+        bet.status = CrashBetStatus.CRASHED.value
+        bet.updated_at = now
+        await apply_turnover(session, bet.user_id, "crash", bet.amount_cash + bet.amount_bonus)
+    await session.execute(update(CrashRound).where(CrashRound.id == round_id).values(settled_at=now))
+
+
+async def _bulk_settle(session: AsyncSession, round_id: int) -> None:
+    now = crash_service._now()
+    await crash_service._settle_bets(session, round_id, now)
+    await session.execute(update(CrashRound).where(CrashRound.id == round_id).values(settled_at=now))
+
+
+async def main(url: str) -> None:
+    engine = create_async_engine(url, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(TurnoverRule), [{"game": "crash", "contribution": 50}])
+    session_factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    print(f"{'bets':>8} {'legacy, s':>12} {'bulk, s':>12} {'speedup':>8}")
+    tg_offset = 1
+    for bets in BET_COUNTS:
+        timings = []
+        for settle in (_legacy_settle, _bulk_settle):
+            async with session_factory() as session:
+                round_id = await _seed_round(session, bets, tg_offset)
+                tg_offset += bets
+                started = time.perf_counter()
+                await settle(session, round_id)
+                await session.commit()
+                timings.append(time.perf_counter() - started)
+        legacy, bulk = timings
+        print(f"{bets:>8} {legacy:>12.3f} {bulk:>12.3f} {legacy / bulk:>7.1f}x")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "sqlite+aiosqlite:///:memory:"))
@@ -0,0 +1,112 @@
+"""Idle crash WS sockets: per-receive `wait_for` timeouts versus the liveness wheel.
+
+Parks 50k simulated sockets in their receive loops, then delivers a few rounds
+of `ping` messages to all of them. The legacy loop wraps every receive in
+`asyncio.wait_for(..., 60)`, which allocates a timer (and, before 3.12, a task)
+per message; the new loop only stamps `last_seen`, and one `LivenessWheel`
+sweep per second checks the connections whose deadline came due.
+
+    PYTHONPATH=. python scripts/bench_crash_ws_liveness.py [sockets] [rounds]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from apps.bot.ws.liveness import LivenessWheel
+
+TIMEOUT = 60.0
+
+
+class FakeSocket:
+    __slots__ = ("_waiter", "last_seen")
+    parked = 0
+
+    def __init__(self) -> None:
+        self._waiter: asyncio.Future | None = None
+        self.last_seen = 0.0
+
+    async def receive(self) -> str:
+        self._waiter = asyncio.get_running_loop().create_future()
+        FakeSocket.parked += 1
+        return await self._waiter
+
+    def deliver(self, message: str) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            FakeSocket.parked -= 1
+            self._waiter.set_result(message)
+
+
+async def _legacy_loop(socket: FakeSocket, handled: list[int]) -> None:
+    while True:
+        try:
+            await asyncio.wait_for(socket.receive(), timeout=TIMEOUT)
+        except asyncio.TimeoutError:
+            return
+        handled[0] += 1
+
+
+async def _wheel_loop(socket: FakeSocket, handled: list[int]) -> None:
+    while True:
+        await socket.receive()
+        socket.last_seen = time.monotonic()
+        handled[0] += 1
+
+
+async def _parked(count: int) -> None:
+    # Every loop must be waiting in receive() again before the next delivery.
+    while FakeSocket.parked < count:
+        await asyncio.sleep(0)
+
+
+async def _measure(loop_fn, sockets: int, rounds: int) -> tuple[float, float, float]:
+    handled = [0]
+    FakeSocket.parked = 0
+    fakes = [FakeSocket() for _ in range(sockets)]
+    skew = [0.0]
+    wheel = LivenessWheel(TIMEOUT, lambda connection: None, clock=lambda: time.monotonic() + skew[0])
+    tracemalloc.start()
+    tasks = [asyncio.create_task(loop_fn(socket, handled)) for socket in fakes]
+    if loop_fn is _wheel_loop:
+        for socket in fakes:
+            wheel.add(socket)
+    await _parked(sockets)
+    idle_memory = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for round_index in range(1, rounds + 1):
+        for socket in fakes:
+            socket.deliver("ping")
+        while handled[0] < sockets * round_index:
+            await asyncio.sleep(0)
+        await _parked(sockets)
+    per_message_us = (time.perf_counter() - started) / (sockets * rounds) * 1e6
+
+    # Jump one full timeout ahead: every tracked connection comes due once.
+    skew[0] = TIMEOUT
+    started = time.perf_counter()
+    wheel.sweep()
+    sweep_ms = (time.perf_counter() - started) * 1000
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return idle_memory, per_message_us, sweep_ms
+
+
+async def main(sockets: int, rounds: int) -> None:
+    print(f"{sockets} idle sockets, {rounds} ping rounds, {TIMEOUT:.0f}s idle timeout")
+    print(f"{'loop':>8} {'idle MiB':>9} {'us/message':>11} {'sweeps per timeout, ms':>23}")
+    for name, loop_fn in (("wait_for", _legacy_loop), ("wheel", _wheel_loop)):
+        memory, per_message, sweep = await _measure(loop_fn, sockets, rounds)
+        sweep_cell = f"{sweep:.1f}" if loop_fn is _wheel_loop else "-"
+        print(f"{name:>8} {memory:>9.1f} {per_message:>11.2f} {sweep_cell:>23}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(*(args + [50_000, 5][len(args):])))
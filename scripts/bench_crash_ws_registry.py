@@ -0,0 +1,127 @@
+"""Crash WS connection registry under churn.
+
+Keeps 50k simulated sockets registered and replaces 500 of them every
+simulated second while broadcasting and sending per-user frames, comparing
+the old lock-guarded `dict[int, set]` (with its linear-scan socket removal)
+against `ConnectionRegistry`. Enqueueing is replaced by a counter so only
+registry overhead is measured.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+
+from apps.bot.ws.registry import ConnectionRegistry
+
+SOCKETS = 50_000
+CHURN_PER_SECOND = 500
+BROADCASTS_PER_SECOND = 10
+USER_SENDS_PER_SECOND = 2_000
+SECONDS = 5
+
+
+class FakeConnection:
+    __slots__ = ("user_id", "websocket")
+
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.websocket = object()
+
+
+class LegacyRegistry:
+    """The pre-registry manager: one lock around a dict of per-user sets."""
+
+    def __init__(self) -> None:
+        self._lock = asyncio.Lock()
+        self._connections: dict[int, set[FakeConnection]] = {}
+
+    async def add(self, connection: FakeConnection) -> None:
+        async with self._lock:
+            self._connections.setdefault(connection.user_id, set()).add(connection)
+
+    async def remove_socket(self, websocket: object) -> None:
+        async with self._lock:
+            for user_id, conns in list(self._connections.items()):
+                for connection in list(conns):
+                    if connection.websocket is websocket:
+                        conns.remove(connection)
+                if not conns:
+                    self._connections.pop(user_id, None)
+
+    async def broadcast(self) -> int:
+        async with self._lock:
+            connections = [connection for conns in self._connections.values() for connection in conns]
+        return len(connections)
+
+    async def send_to_user(self, user_id: int) -> int:
+        async with self._lock:
+            connections = list(self._connections.get(user_id, ()))
+        return len(connections)
+
+
+class CowRegistry:
+    def __init__(self) -> None:
+        self._registry: ConnectionRegistry[FakeConnection] = ConnectionRegistry()
+
+    async def add(self, connection: FakeConnection) -> None:
+        self._registry.add(connection)
+
+    async def remove_socket(self, websocket: object) -> None:
+        connection = self._registry.get(websocket)
+        if connection is not None:
+            self._registry.remove(connection)
+
+    async def broadcast(self) -> int:
+        return sum(1 for _ in self._registry.snapshot())
+
+    async def send_to_user(self, user_id: int) -> int:
+        return len(self._registry.for_user(user_id))
+
+
+async def _run(registry, rng: random.Random) -> tuple[float, float, float, float]:
+    live = [FakeConnection(user_id) for user_id in range(SOCKETS)]
+    for connection in live:
+        await registry.add(connection)
+    next_user = SOCKETS
+    churn = broadcast = sends = 0.0
+    for _ in range(SECONDS):
+        # Interleave the second's work the way the event loop would see it.
+        ops = (
+            ["churn"] * CHURN_PER_SECOND
+            + ["broadcast"] * BROADCASTS_PER_SECOND
+            + ["send"] * USER_SENDS_PER_SECOND
+        )
+        rng.shuffle(ops)
+        for op in ops:
+            started = time.perf_counter()
+            if op == "churn":
+                index = rng.randrange(len(live))
+                await registry.remove_socket(live[index].websocket)
+                live[index] = FakeConnection(next_user)
+                next_user += 1
+                await registry.add(live[index])
+                churn += time.perf_counter() - started
+            elif op == "broadcast":
+                await registry.broadcast()
+                broadcast += time.perf_counter() - started
+            else:
+                await registry.send_to_user(live[rng.randrange(len(live))].user_id)
+                sends += time.perf_counter() - started
+    return churn, broadcast, sends, churn + broadcast + sends
+
+
+async def main() -> None:
+    print(
+        f"{SOCKETS} sockets, {CHURN_PER_SECOND} churn/s, {BROADCASTS_PER_SECOND} broadcasts/s, "
+        f"{USER_SENDS_PER_SECOND} user sends/s, {SECONDS} simulated seconds"
+    )
+    print(f"{'registry':>10} {'churn, s':>10} {'broadcast, s':>13} {'sends, s':>10} {'busy/sim s':>11}")
+    for name, factory in (("legacy", LegacyRegistry), ("cow", CowRegistry)):
+        churn, broadcast, sends, total = await _run(factory(), random.Random(1))
+        print(f"{name:>10} {churn:>10.3f} {broadcast:>13.3f} {sends:>10.3f} {total / SECONDS:>10.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Crash WS broadcast throughput versus uvicorn worker count.
+
+The driver plays the local event hub: it serves the hub's Unix socket and
+pushes broadcast events to 1, 2, 4... worker processes, each holding an equal
+share of the simulated sockets behind a real `CrashWebSocketManager`. A fake
+socket's `send_text` only encodes the frame to bytes, standing in for the
+per-frame work of the WS stack. Scaling is bounded by the CPU cores available.
+
+    PYTHONPATH=. python scripts/bench_crash_ws_workers.py [sockets] [events]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import fakeredis
+
+from apps.bot.ws.connection import CrashConnection, OverflowPolicy
+from apps.bot.ws.crash import CrashWebSocketManager, _encode
+from apps.bot.ws.local_hub import _pack, _read_message
+
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+class CountingWebSocket:
+    __slots__ = ("sent",)
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send_text(self, data: str) -> None:
+        data.encode()
+        self.sent += 1
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+async def _worker(path: str, sockets: int, events: int) -> None:
+    manager = CrashWebSocketManager(database=None, redis=fakeredis.aioredis.FakeRedis())
+    websockets = [CountingWebSocket() for _ in range(sockets)]
+    for user_id, websocket in enumerate(websockets):
+        manager._connections.add(
+            CrashConnection(websocket, user_id, max_queue=events + 1, policy=OverflowPolicy.DROP_OLDEST, send_timeout=5)
+        )
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(_pack(["ready", None, None]))
+    for _ in range(events):
+        _, event_id, data = await _read_message(reader)
+        await manager._on_bus_event(event_id, data)
+    while sum(websocket.sent for websocket in websockets) < sockets * events:
+        await asyncio.sleep(0.01)
+    writer.write(_pack(["done", None, None]))
+    await writer.drain()
+    writer.close()
+
+
+def _run_worker(path: str, sockets: int, events: int) -> None:
+    asyncio.run(_worker(path, sockets, events))
+
+
+async def _measure(workers: int, sockets: int, events: int) -> float:
+    path = os.path.join(tempfile.mkdtemp(), "hub.sock")
+    connected: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+    all_ready = asyncio.Event()
+
+    async def accept(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await _read_message(reader)
+        connected.append((reader, writer))
+        if len(connected) == workers:
+            all_ready.set()
+
+    server = await asyncio.start_unix_server(accept, path=path)
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(path, sockets // workers, events)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    await all_ready.wait()
+
+    frames = [
+        _encode({"type": "game-start", "id": index, "sessionId": index, "seed": "f" * 64, "origin": "driver"})
+        for index in range(events)
+    ]
+    started = time.perf_counter()
+    for frame in frames:
+        packet = _pack(["evt", None, frame])
+        for _, writer in connected:
+            writer.write(packet)
+        await asyncio.gather(*(writer.drain() for _, writer in connected))
+    for reader, _ in connected:
+        await _read_message(reader)
+    elapsed = time.perf_counter() - started
+
+    for process in processes:
+        process.join()
+    server.close()
+    return elapsed
+
+
+async def main(sockets: int, events: int) -> None:
+    print(f"{sockets} sockets, {events} broadcast events, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'seconds':>9} {'frames/s':>12} {'speedup':>8}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        elapsed = await _measure(workers, sockets, events)
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>9.2f} {sockets * events / elapsed:>12,.0f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(*(args + [20_000, 100][len(args):])))
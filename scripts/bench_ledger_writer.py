@@ -0,0 +1,73 @@
+"""Ledger inserts per second: one ORM object per entry versus the batched writer.
+
+Writes `entries` synthetic ledger rows (1M by default) in transactions of
+`per_transaction` rows, once with `session.add(Ledger(...))` and once through
+`apps.bot.core.ledger.add_entry`. Runs against in-memory SQLite by default;
+pass a `DATABASE_URL`-style URL as the third argument to benchmark Postgres
+(batches of `COPY_MIN_ROWS` or more then go through COPY).
+
+    PYTHONPATH=. python scripts/bench_ledger_writer.py [entries] [per_transaction] [url]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from apps.bot.core import ledger
+from apps.bot.db import Base
+from apps.bot.db.models import Ledger, User
+
+
+def _row(index: int, user_id: int) -> tuple:
+    return user_id, "coins_cash", index % 1_000 - 500, "bench", None, {"round_id": index}
+
+
+async def _orm(session: AsyncSession, rows: list[tuple]) -> None:
+    for user_id, currency, amount, reason, award_id, payload in rows:
+        session.add(
+            Ledger(user_id=user_id, currency=currency, amount=amount, reason=reason, award_id=award_id, payload=payload)
+        )
+
+
+async def _writer(session: AsyncSession, rows: list[tuple]) -> None:
+    for user_id, currency, amount, reason, award_id, payload in rows:
+        ledger.add_entry(session, user_id, currency, amount, reason, award_id=award_id, payload=payload)
+
+
+async def main(entries: int, per_transaction: int, url: str) -> None:
+    engine = create_async_engine(url, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        user_id = (await conn.execute(insert(User).values(tg_id=1, username="bench").returning(User.id))).scalar_one()
+    session_factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    print(f"{'path':>8} {'entries':>10} {'seconds':>10} {'inserts/s':>12}")
+    for name, write in (("orm", _orm), ("writer", _writer)):
+        started = time.perf_counter()
+        async with session_factory() as session:
+            for offset in range(0, entries, per_transaction):
+                count = min(per_transaction, entries - offset)
+                await write(session, [_row(offset + index, user_id) for index in range(count)])
+                await session.commit()
+        elapsed = time.perf_counter() - started
+        print(f"{name:>8} {entries:>10} {elapsed:>10.2f} {entries / elapsed:>12,.0f}")
+        async with engine.begin() as conn:
+            await conn.execute(delete(Ledger))
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+            sys.argv[3] if len(sys.argv) > 3 else "sqlite+aiosqlite:///:memory:",
+        )
+    )
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+from apps.bot.core.seed_chain import generate_chain
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute a reverse SHA-256 seed chain for crash rounds")
+    parser.add_argument("output", help="Path of the binary chain file (set CRASH_SEED_CHAIN_PATH to it)")
+    parser.add_argument("--length", type=int, default=1_000_000, help="Number of rounds the chain covers")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    commitment = generate_chain(args.output, args.length)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {args.length} links to {args.output} in {elapsed:.1f}s")
+    print(f"Commitment (publish before the first round): {commitment}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+
+from apps.bot.core.awards import rebuild_active_bonus_counts
+from apps.bot.infra.db import Database
+from apps.bot.infra.settings import get_settings
+
+
+async def run(check_only: bool) -> int:
+    database = Database(get_settings())
+    try:
+        async with database.session() as session:
+            mismatched = await rebuild_active_bonus_counts(session, fix=not check_only)
+            for user_id, stored, actual in mismatched:
+                print(json.dumps({"userId": user_id, "stored": stored, "actual": actual}))
+            await session.commit()
+    finally:
+        await database.dispose()
+    action = "found" if check_only else "fixed"
+    print(f"{len(mismatched)} wallets with a wrong active bonus count {action}", file=sys.stderr)
+    return 1 if mismatched and check_only else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recount wallets.active_bonus_count from bonus_awards")
+    parser.add_argument("--check", action="store_true", help="Only report wallets whose counter is off")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.check)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+
+from apps.bot.infra.db import Database
+from apps.bot.infra.settings import get_settings
+from apps.bot.services.crash_audit import iter_round_verifications
+
+
+async def run(start_id: int, end_id: int, quiet: bool) -> int:
+    database = Database(get_settings())
+    total = failed = 0
+    try:
+        async with database.session() as session:
+            async for item in iter_round_verifications(session, start_id, end_id):
+                total += 1
+                ok = item["hashValid"] and item["crashPointValid"] and item["linkValid"] is not False
+                if not ok:
+                    failed += 1
+                if not quiet or not ok:
+                    print(json.dumps(item))
+    finally:
+        await database.dispose()
+    print(f"Verified {total} rounds, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute crash points and seed-chain links for a range of rounds")
+    parser.add_argument("from_id", type=int)
+    parser.add_argument("to_id", type=int)
+    parser.add_argument("--quiet", action="store_true", help="Only print rounds that fail verification")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.from_id, args.to_id, args.quiet)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
+import contextlib
+
+import pytest
 import pytest_asyncio
-from sqlalchemy import insert
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import Engine, event, insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from apps.bot.db import Base
 from apps.bot.db.models import TurnoverRule
 
 
-@pytest_asyncio.fixture()
-async def session():
-    engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+async def _create_schema(engine: AsyncEngine) -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         await conn.execute(
@@ -21,7 +22,52 @@ async def session():
                 {"game": "duel", "contribution": 25},
             ],
         )
-    session_factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+
+@pytest_asyncio.fixture()
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", future=True)
+    await _create_schema(engine)
+    yield async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture()
+async def file_session_factory(tmp_path):
+    # The in-memory database shares one connection between all sessions, so
+    # tests with concurrent transactions (several nodes) need a real file.
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'casino.db'}", future=True)
+    await _create_schema(engine)
+    yield async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture()
+async def session(session_factory):
     async with session_factory() as db:
         yield db
-    await engine.dispose()
+
+
+@pytest.fixture()
+def count_statements():
+    """`with count_statements(engine) as statements:` collects the SQL run on `engine` in the block.
+
+    With `params=True` the entries are `(sql, parameters)` pairs.
+    """
+
+    @contextlib.contextmanager
+    def capture(engine: Engine | AsyncEngine, *, params: bool = False):
+        if isinstance(engine, AsyncEngine):
+            engine = engine.sync_engine
+        statements: list = []
+
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters) if params else statement)
+
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+    return capture
@@ -1,14 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import replace
 from datetime import timedelta
 from decimal import Decimal
 
 import pytest
 from sqlalchemy import desc, select
 
+from apps.bot.core.awards import create_bonus_award
+from apps.bot.core.seed_chain import (
+    CRASH_POINT_HMAC,
+    CRASH_POINT_SHA256,
+    crash_point_from_seed,
+    generate_chain,
+    next_link,
+)
 from apps.bot.core.wallets import add_coins_cash, get_wallet_balance
-from apps.bot.db.models import CrashBet, CrashBetStatus, CrashRound, CrashRoundStatus, User
+from apps.bot.db.models import CrashBet, CrashBetStatus, CrashChainCursor, CrashRound, CrashRoundStatus, Ledger, User
 from apps.bot.services import crash as crash_service
+from apps.bot.services import crash_audit
+
+
+async def _start_round(session) -> crash_service.CrashRoundEngine:
+    engine = crash_service.CrashRoundEngine()
+    await engine.advance(session)
+    return engine
 
 
 @pytest.mark.asyncio
@@ -18,6 +35,7 @@ async def test_crash_place_bet_deducts_balance(session):
     await session.flush()
 
     await add_coins_cash(session, user.id, 1_000)
+    await _start_round(session)
 
     snapshot = await crash_service.place_bet(session, user=user, amount=200)
 
@@ -41,6 +59,7 @@ async def test_crash_cashout_returns_payout(session):
     await session.flush()
 
     await add_coins_cash(session, user.id, 1_000)
+    await _start_round(session)
     await crash_service.place_bet(session, user=user, amount=100)
 
     round_obj = await session.scalar(select(CrashRound).order_by(desc(CrashRound.id)))
@@ -49,7 +68,7 @@ async def test_crash_cashout_returns_payout(session):
     now = crash_service._now()
     round_obj.bet_ends_at = now - timedelta(seconds=2)
     round_obj.crash_at = now + timedelta(seconds=10)
-    round_obj.status = CrashRoundStatus.BETTING.value
+    round_obj.status = CrashRoundStatus.FLYING.value
     round_obj.crash_point = Decimal("3.0")
     await session.flush()
 
@@ -65,7 +84,7 @@ async def test_crash_cashout_returns_payout(session):
 
 
 @pytest.mark.asyncio
-async def test_auto_cashout_triggers(session):
+async def test_auto_cashout_events_buffer_when_no_consumer(session):
     crash_service.set_auto_cashout_consumer(None)
     crash_service.consume_auto_cashout_events()
     user = User(tg_id=9999, username="auto")
@@ -73,19 +92,13 @@ async def test_auto_cashout_triggers(session):
     await session.flush()
 
     await add_coins_cash(session, user.id, 1_000)
+    engine = await _start_round(session)
     await crash_service.place_bet(session, user=user, amount=100, auto_cashout=1.1)
+    round_state = replace(engine.round, crash_point=3.0, crash_at=engine.round.bet_ends_at + timedelta(seconds=30))
+    engine._round = round_state
 
-    round_obj = await session.scalar(select(CrashRound).order_by(desc(CrashRound.id)))
-    assert round_obj is not None
-
-    now = crash_service._now()
-    round_obj.bet_ends_at = now - timedelta(seconds=2)
-    round_obj.crash_at = now + timedelta(seconds=10)
-    round_obj.status = CrashRoundStatus.FLYING.value
-    round_obj.crash_point = Decimal("3.0")
-    await session.flush()
-
-    await crash_service.get_round_summary(session)
+    await engine.advance(session, now=round_state.bet_ends_at)
+    await engine.advance(session, now=engine.next_deadline())
 
     events = crash_service.consume_auto_cashout_events()
     assert len(events) == 1
@@ -94,31 +107,360 @@ async def test_auto_cashout_triggers(session):
     assert event.snapshot.cashout is not None
     wallet = await get_wallet_balance(session, user.id)
     assert wallet.coins_cash > 900
-    crash_service.set_auto_cashout_consumer(None)
 
 
 @pytest.mark.asyncio
-async def test_auto_cashout_events_buffer_when_no_consumer(session):
+async def test_request_paths_never_advance_rounds_without_the_engine(session):
     crash_service.set_auto_cashout_consumer(None)
     crash_service.consume_auto_cashout_events()
-    user = User(tg_id=12345, username="no_events")
+    with pytest.raises(ValueError):
+        await crash_service.get_round_summary(session)
+
+    user = User(tg_id=12345, username="follower")
     session.add(user)
     await session.flush()
-
     await add_coins_cash(session, user.id, 500)
+    await _start_round(session)
     await crash_service.place_bet(session, user=user, amount=100, auto_cashout=1.05)
 
     round_obj = await session.scalar(select(CrashRound).order_by(desc(CrashRound.id)))
-    assert round_obj is not None
-
     now = crash_service._now()
-    round_obj.bet_ends_at = now - timedelta(seconds=2)
-    round_obj.crash_at = now + timedelta(seconds=5)
-    round_obj.status = CrashRoundStatus.FLYING.value
-    round_obj.crash_point = Decimal("2.0")
+    round_obj.bet_ends_at = now - timedelta(seconds=10)
+    round_obj.crash_at = now - timedelta(seconds=5)
+    await session.commit()
+
+    # Both deadlines are long gone, but only the leader's engine may act on them.
+    summary = await crash_service.get_round_summary(session)
+    await crash_service.get_state(session, user.id)
+
+    assert summary["phase"] == CrashRoundStatus.BETTING.value
+    assert crash_service.consume_auto_cashout_events() == []
+    rounds = (await session.scalars(select(CrashRound))).all()
+    assert [(row.id, row.status) for row in rounds] == [(round_obj.id, CrashRoundStatus.BETTING.value)]
+    bet = await session.scalar(select(CrashBet))
+    assert bet.status == CrashBetStatus.ACTIVE.value
+
+
+@pytest.mark.asyncio
+async def test_round_engine_drives_phase_transitions(session):
+    engine = crash_service.CrashRoundEngine()
+    summaries = await engine.advance(session)
+    assert len(summaries) == 1
+    round_state = engine.round
+    assert round_state is not None
+    assert round_state.status == CrashRoundStatus.BETTING.value
+
+    summaries = await engine.advance(session, now=round_state.bet_ends_at)
+    assert [summary["phase"] for summary in summaries] == [CrashRoundStatus.FLYING.value]
+
+    summaries = await engine.advance(session, now=round_state.crash_at)
+    assert [summary["phase"] for summary in summaries] == [CrashRoundStatus.CRASHED.value]
+    stored = await session.get(CrashRound, round_state.id)
+    await session.refresh(stored)
+    assert stored.status == CrashRoundStatus.CRASHED.value
+    assert stored.settled_at is not None
+
+    summaries = await engine.advance(session, now=engine.next_deadline())
+    assert [summary["phase"] for summary in summaries] == [CrashRoundStatus.BETTING.value]
+    assert engine.round.id != round_state.id
+
+
+@pytest.mark.asyncio
+async def test_request_paths_read_engine_round(session):
+    user = User(tg_id=4242, username="engine")
+    session.add(user)
     await session.flush()
+    await add_coins_cash(session, user.id, 1_000)
+
+    engine = crash_service.CrashRoundEngine()
+    await engine.advance(session)
+    crash_service.set_round_engine(engine)
+    try:
+        snapshot = await crash_service.place_bet(session, user=user, amount=100)
+        assert snapshot.session["id"] == engine.round.id
+
+        # Betting closes as soon as the deadline passes, even before the leader ticks.
+        now = crash_service._now()
+        engine._round = replace(engine.round, bet_ends_at=now - timedelta(seconds=1))
+        with pytest.raises(ValueError):
+            await crash_service.place_bet(session, user=user, amount=100)
+    finally:
+        crash_service.set_round_engine(None)
+
+
+@pytest.mark.asyncio
+async def test_bets_are_refused_once_the_round_took_off_in_the_database(session):
+    user = User(tg_id=4343, username="late")
+    session.add(user)
+    await session.flush()
+    await add_coins_cash(session, user.id, 1_000)
+
+    engine = await _start_round(session)
+    betting = engine.round
+    await engine.advance(session, now=betting.bet_ends_at)
+    # A node still holding the BETTING copy with time left on its clock.
+    engine._round = replace(betting, bet_ends_at=crash_service._now() + timedelta(seconds=5))
+    crash_service.set_round_engine(engine)
+    try:
+        with pytest.raises(ValueError, match="Betting phase is closed"):
+            await crash_service.place_bet(session, user=user, amount=100, auto_cashout=1.01)
+    finally:
+        crash_service.set_round_engine(None)
+
+    assert await session.scalar(select(CrashBet)) is None
+    assert (await get_wallet_balance(session, user.id)).coins_cash == 1_000
+
 
-    await crash_service.get_round_summary(session)
+@pytest.mark.asyncio
+async def test_auto_cashout_scheduler_fires_at_exact_threshold(session):
+    crash_service.set_auto_cashout_consumer(None)
+    crash_service.consume_auto_cashout_events()
+    engine = crash_service.CrashRoundEngine()
+    await engine.advance(session)
+    round_state = replace(
+        engine.round,
+        crash_point=10.0,
+        crash_at=engine.round.bet_ends_at + timedelta(minutes=1),
+    )
+    engine._round = round_state
+    crash_service.set_round_engine(engine)
+    try:
+        users = []
+        for tg_id, target in ((31, 1.5), (32, 1.5), (33, 2.0)):
+            user = User(tg_id=tg_id, username=f"auto{tg_id}")
+            session.add(user)
+            await session.flush()
+            await add_coins_cash(session, user.id, 1_000)
+            await crash_service.place_bet(session, user=user, amount=100, auto_cashout=target)
+            users.append(user)
+    finally:
+        crash_service.set_round_engine(None)
 
+    await engine.advance(session, now=round_state.bet_ends_at)
+    first_fire = engine.next_deadline()
+    assert first_fire == round_state.bet_ends_at + timedelta(milliseconds=crash_service._elapsed_ms_for(1.5))
+
+    await engine.advance(session, now=first_fire)
     events = crash_service.consume_auto_cashout_events()
-    assert len(events) == 1
+    assert sorted(event.user_id for event in events) == [users[0].id, users[1].id]
+    assert all(event.snapshot.cashout["multiplier"] == 1.5 for event in events)
+    assert all(event.snapshot.cashout["payout"] == 150 for event in events)
+
+    pending = await session.scalar(select(CrashBet).where(CrashBet.user_id == users[2].id))
+    assert pending.status == CrashBetStatus.ACTIVE.value
+    assert engine.next_deadline() == round_state.bet_ends_at + timedelta(
+        milliseconds=crash_service._elapsed_ms_for(2.0)
+    )
+
+
+@pytest.mark.asyncio
+async def test_settlement_marks_bets_crashed_and_applies_turnover(session):
+    engine = crash_service.CrashRoundEngine()
+    await engine.advance(session)
+    round_state = engine.round
+    crash_service.set_round_engine(engine)
+    try:
+        awards = []
+        for tg_id in (41, 42):
+            user = User(tg_id=tg_id, username=f"settle{tg_id}")
+            session.add(user)
+            await session.flush()
+            await add_coins_cash(session, user.id, 1_000)
+            awards.append(
+                await create_bonus_award(session, user.id, kind="welcome", granted=500, wr_mult=2.0, cap_cashout=500)
+            )
+            await crash_service.place_bet(session, user=user, amount=200)
+    finally:
+        crash_service.set_round_engine(None)
+
+    await engine.advance(session, now=round_state.bet_ends_at)
+    await engine.advance(session, now=round_state.crash_at)
+
+    bets = (await session.scalars(select(CrashBet).where(CrashBet.round_id == round_state.id))).all()
+    assert len(bets) == 2
+    assert all(bet.status == CrashBetStatus.CRASHED.value for bet in bets)
+    for award in awards:
+        await session.refresh(award)
+        # crash contributes 50% of the stake
+        assert award.turnover_progress == 100
+
+
+@pytest.mark.asyncio
+async def test_cashout_batcher_commits_batch_at_arrival_multipliers(session, session_factory):
+    engine = crash_service.CrashRoundEngine()
+    await engine.advance(session)
+    crash_service.set_round_engine(engine)
+    try:
+        users = []
+        for tg_id in (51, 52, 53):
+            user = User(tg_id=tg_id, username=f"batch{tg_id}")
+            session.add(user)
+            await session.flush()
+            await add_coins_cash(session, user.id, 1_000)
+            await crash_service.place_bet(session, user=user, amount=100)
+            users.append(user)
+    finally:
+        crash_service.set_round_engine(None)
+    round_state = replace(
+        engine.round,
+        status=CrashRoundStatus.FLYING.value,
+        crash_at=crash_service._now() + timedelta(minutes=1),
+    )
+
+    batcher = crash_service.CashoutBatcher(session_factory, window_ms=20)
+    results = await asyncio.gather(
+        batcher.submit(round_state, users[0].id, 1.5),
+        batcher.submit(round_state, users[1].id, 2.25),
+        batcher.submit(round_state, users[0].id, 3.0),
+        return_exceptions=True,
+    )
+    await batcher.close()
+
+    first, second, duplicate = results
+    assert first.cashout["multiplier"] == 1.5
+    assert first.balance["cash"] == 900 + 150
+    assert second.cashout["payout"] == 225
+    assert isinstance(duplicate, ValueError)
+
+    async with session_factory() as check:
+        bets = {
+            bet.user_id: bet
+            for bet in (await check.scalars(select(CrashBet).where(CrashBet.round_id == round_state.id))).all()
+        }
+        assert bets[users[0].id].status == CrashBetStatus.CASHED_OUT.value
+        assert float(bets[users[1].id].cashout_multiplier) == 2.25
+        assert bets[users[2].id].status == CrashBetStatus.ACTIVE.value
+        payouts = (
+            await check.scalars(select(Ledger.amount).where(Ledger.reason == "crash_payout").order_by(Ledger.amount))
+        ).all()
+        assert payouts == [150, 225]
+
+
+@pytest.mark.asyncio
+async def test_rounds_consume_seed_chain(session, tmp_path, monkeypatch):
+    path = tmp_path / "chain.bin"
+    commitment = generate_chain(path, 3)
+    monkeypatch.setattr(crash_service.settings, "crash_seed_chain_path", str(path))
+
+    first = await crash_service._create_round(session)
+    first.status = CrashRoundStatus.CRASHED.value
+    await session.flush()
+    second = await crash_service._create_round(session)
+
+    assert (first.chain_index, second.chain_index) == (0, 1)
+    assert first.seed_hash == commitment
+    # Revealing a round's seed lets players check it against the next round's commitment.
+    assert second.seed_hash == first.seed
+    assert next_link(second.seed) == first.seed
+    assert float(second.crash_point) == crash_service._crash_point_from_seed(second.seed)
+
+
+@pytest.mark.asyncio
+async def test_rooms_draw_distinct_chain_indexes_concurrently(file_session_factory, tmp_path, monkeypatch):
+    path = tmp_path / "chain.bin"
+    generate_chain(path, 10)
+    monkeypatch.setattr(crash_service.settings, "crash_seed_chain_path", str(path))
+    monkeypatch.setattr(crash_service.settings, "crash_rooms", {"high": {}})
+
+    async def create(room: str) -> int:
+        async with file_session_factory() as db:
+            round_obj = await crash_service._create_round(db, room=room)
+            # A leader still inside its transaction when the other room's leader starts.
+            await asyncio.sleep(0.05)
+            await db.commit()
+            return round_obj.chain_index
+
+    assert sorted(await asyncio.gather(create("main"), create("high"))) == [0, 1]
+    async with file_session_factory() as db:
+        assert (await db.get(CrashChainCursor, 1)).next_index == 2
+
+
+@pytest.mark.asyncio
+async def test_round_verification_streams_chain_checks(session, tmp_path, monkeypatch):
+    path = tmp_path / "chain.bin"
+    generate_chain(path, 5)
+    monkeypatch.setattr(crash_service.settings, "crash_seed_chain_path", str(path))
+    rounds = []
+    for _ in range(3):
+        round_obj = await crash_service._create_round(session)
+        round_obj.status = CrashRoundStatus.CRASHED.value
+        await session.flush()
+        rounds.append(round_obj)
+    rounds[2].crash_point = Decimal("99.0")
+    await session.commit()
+
+    results = [
+        item
+        async for item in crash_audit.iter_round_verifications(session, rounds[0].id, rounds[2].id, chunk_size=2)
+    ]
+
+    assert [item["roundId"] for item in results] == [round_obj.id for round_obj in rounds]
+    assert all(item["hashValid"] for item in results)
+    assert [item["linkValid"] for item in results] == [None, True, True]
+    assert [item["crashPointValid"] for item in results] == [True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_round_verification_uses_each_rounds_crash_point_version(session):
+    legacy_seed = "a" * 64
+    legacy = CrashRound(
+        status=CrashRoundStatus.CRASHED.value,
+        seed=legacy_seed,
+        seed_hash=next_link(legacy_seed),
+        crash_point_version=CRASH_POINT_SHA256,
+        crash_point=crash_point_from_seed(legacy_seed, version=CRASH_POINT_SHA256),
+        bet_ends_at=crash_service._now(),
+        crash_at=crash_service._now(),
+    )
+    session.add(legacy)
+    await session.flush()
+    current = await crash_service._create_round(session)
+    current.status = CrashRoundStatus.CRASHED.value
+    await session.commit()
+
+    results = [item async for item in crash_audit.iter_round_verifications(session, legacy.id, current.id)]
+
+    assert [item["crashPointVersion"] for item in results] == [CRASH_POINT_SHA256, CRASH_POINT_HMAC]
+    assert all(item["crashPointValid"] for item in results)
+
+
+@pytest.mark.asyncio
+async def test_rooms_run_independent_rounds_with_their_own_limits(session, monkeypatch):
+    monkeypatch.setattr(crash_service.settings, "crash_rooms", {"high": {"bet_min": 500, "bet_duration_ms": 9000}})
+    user = User(tg_id=4444, username="rooms")
+    session.add(user)
+    await session.flush()
+    await add_coins_cash(session, user.id, 2_000)
+
+    main = await _start_round(session)
+    high = crash_service.CrashRoundEngine("high")
+    await high.advance(session)
+    # Both rooms have a live round at once.
+    assert main.round.status == high.round.status == CrashRoundStatus.BETTING.value
+    assert main.round.id != high.round.id
+    assert high.round.bet_ends_at - high.round.created_at >= timedelta(milliseconds=8_000)
+
+    crash_service.set_round_engine(main)
+    crash_service.set_round_engine(high, "high")
+    try:
+        with pytest.raises(ValueError, match="limits"):
+            await crash_service.place_bet(session, user=user, amount=100, room="high")
+        await crash_service.place_bet(session, user=user, amount=100)
+        snapshot = await crash_service.place_bet(session, user=user, amount=500, room="high")
+        assert snapshot.session["room"] == "high"
+        assert snapshot.bet["roundId"] == high.round.id
+        with pytest.raises(ValueError, match="Unknown crash room"):
+            await crash_service.get_state(session, user.id, "missing")
+    finally:
+        crash_service.set_round_engine(None)
+        crash_service.set_round_engine(None, "high")
+
+    # Crashing one room leaves the other's round and bets alone.
+    await high.advance(session, now=high.round.bet_ends_at)
+    await high.advance(session, now=high.round.crash_at)
+    assert high.round.status == CrashRoundStatus.CRASHED.value
+    assert main.round.status == CrashRoundStatus.BETTING.value
+    statuses = dict((await session.execute(select(CrashBet.round_id, CrashBet.status))).all())
+    assert statuses == {main.round.id: CrashBetStatus.ACTIVE.value, high.round.id: CrashBetStatus.CRASHED.value}
+    assert [entry["roundId"] for entry in await crash_service.get_recent_history(session, room="high")] == [high.round.id]
+    assert await crash_service.get_recent_history(session) == []
@@ -0,0 +1,720 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import fakeredis
+import orjson
+import pytest
+from fastapi import WebSocketDisconnect
+from sqlalchemy import func, select
+
+from apps.bot.core.security import create_crash_jwt
+from apps.bot.core.wallets import add_coins_cash
+from apps.bot.db.models import CrashRound, User
+from apps.bot.services import crash as crash_service
+from apps.bot.ws.bus import PubSubEventBus, StreamEventBus
+from apps.bot.ws.connection import CrashConnection, OverflowPolicy
+from apps.bot.ws.crash import CrashWebSocketManager, _encode
+from apps.bot.ws.crash import settings as ws_settings
+from apps.bot.ws.liveness import LivenessWheel
+from apps.bot.ws.local_hub import LocalHubEventBus
+from apps.bot.ws.registry import ConnectionRegistry
+
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.frames: list[str] = []
+        self.closed = False
+        self.gate: asyncio.Event | None = None
+
+    async def send_text(self, data: str) -> None:
+        if self.gate is not None:
+            await self.gate.wait()
+        self.frames.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+
+
+async def _drain() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _close_all(manager: CrashWebSocketManager) -> None:
+    if manager._flush_task is not None:
+        manager._flush_task.cancel()
+    for connection in manager._connections.snapshot():
+        connection.close()
+    await _drain()
+
+
+class FakeRedis(fakeredis.aioredis.FakeRedis):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(decode_responses=True, **kwargs)
+        self.published: list[tuple[str, str]] = []
+
+    async def publish(self, channel: str, message: str) -> int:
+        self.published.append((channel, message))
+        return await super().publish(channel, message)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_encodes_event_once_for_all_sockets():
+    redis = FakeRedis()
+    manager = CrashWebSocketManager(database=None, redis=redis)
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for user_id, websocket in enumerate(sockets, start=1):
+        await manager._register(user_id, websocket)
+
+    await manager._emit_event({"type": "game-start", "sessionId": 7, "id": 7})
+    await manager._flush_outbox()
+    await _drain()
+
+    frames = [websocket.frames[0] for websocket in sockets]
+    assert frames[0] is frames[1] is frames[2]
+    assert redis.published == [(CrashWebSocketManager.EVENT_CHANNEL, frames[0])]
+    assert orjson.loads(frames[0])["sessionId"] == 7
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_user_events_only_reach_that_user():
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    mine, other = FakeWebSocket(), FakeWebSocket()
+    await manager._register(1, mine)
+    await manager._register(2, other)
+
+    await manager._emit_event({"type": "balance-update", "userId": 1, "balance": 500})
+    await manager._flush_outbox()
+    await _drain()
+
+    assert len(mine.frames) == 1
+    assert other.frames == []
+    await _close_all(manager)
+
+
+def _stalled_connection(policy: OverflowPolicy, max_queue: int = 3) -> tuple[CrashConnection, FakeWebSocket]:
+    websocket = FakeWebSocket()
+    websocket.gate = asyncio.Event()
+    return CrashConnection(websocket, 1, max_queue=max_queue, policy=policy, send_timeout=5), websocket
+
+
+@pytest.mark.asyncio
+async def test_balance_updates_are_coalesced_while_queued():
+    connection, websocket = _stalled_connection(OverflowPolicy.DROP_OLDEST)
+    connection.enqueue("b1", critical=False, coalesce_key="balance")
+    connection.enqueue("e1")
+    connection.enqueue("b2", critical=False, coalesce_key="balance")
+
+    assert len(connection) == 2
+    websocket.gate.set()
+    await _drain()
+    assert websocket.frames == ["b2", "e1"]
+    connection.close()
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_discards_non_critical_frames_first():
+    connection, websocket = _stalled_connection(OverflowPolicy.DROP_OLDEST)
+    connection.enqueue("e1")
+    connection.enqueue("pong", critical=False)
+    connection.enqueue("e2")
+    assert connection.enqueue("e3")
+
+    websocket.gate.set()
+    await _drain()
+    assert websocket.frames == ["e1", "e2", "e3"]
+    assert not connection.closed
+    connection.close()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_of_critical_frames_evicts_client():
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    websocket = FakeWebSocket()
+    websocket.gate = asyncio.Event()
+    connection = await manager._register(1, websocket)
+    for index in range(300):
+        connection.enqueue(f"e{index}")
+
+    await _drain()
+    assert connection.closed
+    assert websocket.closed
+    assert len(manager._connections) == 0
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_evicts_on_first_overflow():
+    connection, websocket = _stalled_connection(OverflowPolicy.DISCONNECT, max_queue=1)
+    connection.enqueue("e1")
+    assert not connection.enqueue("b1", critical=False)
+    assert connection.closed
+
+
+@pytest.mark.asyncio
+async def test_tick_batches_cashouts_into_one_shared_frame():
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    sockets = [FakeWebSocket() for _ in range(2)]
+    for user_id, websocket in enumerate(sockets, start=1):
+        await manager._register(user_id, websocket)
+    now_ms = int(time.time() * 1000)
+    flying = {"type": "game-flying", "id": 5, "betEndTime": now_ms - 2_000, "crashTime": now_ms + 60_000}
+    await manager._deliver_event(flying, _encode(flying))
+    for user_id in (1, 2, 3):
+        cashout = {
+            "type": "cashout-processed",
+            "userId": user_id,
+            "sessionId": 5,
+            "cashout": {"multiplier": 1.1, "payout": 110},
+        }
+        await manager._deliver_event(cashout, _encode(cashout))
+
+    await manager._tick()
+    await manager._tick()
+    await _drain()
+
+    ticks = [[frame for frame in websocket.frames if '"tick"' in frame] for websocket in sockets]
+    assert ticks[0][0] is ticks[1][0]
+    first, second = (orjson.loads(frame) for frame in ticks[0])
+    assert first["s"] == 5
+    assert first["m"] > 1.1
+    assert first["c"] == [[1, 1.1, 110], [2, 1.1, 110], [3, 1.1, 110]]
+    assert second["c"] == []
+
+    crash = {"type": "game-crash", "id": 5, "crashPoint": 1.2}
+    await manager._deliver_event(crash, _encode(crash))
+    await manager._tick()
+    await _drain()
+    assert sum('"tick"' in frame for frame in sockets[0].frames) == 3
+    await _close_all(manager)
+
+
+class _Conn:
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.websocket = FakeWebSocket()
+
+
+@pytest.mark.asyncio
+async def test_register_survives_presence_outage():
+    server = fakeredis.FakeServer()
+    manager = CrashWebSocketManager(database=None, redis=fakeredis.aioredis.FakeRedis(server=server))
+    server.connected = False
+    websocket = FakeWebSocket()
+
+    connection = await manager._register(1, websocket)
+    assert manager._connections.for_user(1) == (connection,)
+    await _close_all(manager)
+
+
+def test_registry_snapshot_is_stable_across_changes():
+    registry = ConnectionRegistry()
+    first, second, third = _Conn(1), _Conn(1), _Conn(2)
+    for connection in (first, second, third):
+        registry.add(connection)
+
+    snapshot = registry.snapshot()
+    assert registry.snapshot() is snapshot
+    assert registry.remove(second)
+    assert not registry.remove(second)
+
+    assert snapshot == (first, second, third)
+    assert registry.snapshot() == (first, third)
+    assert registry.for_user(1) == (first,)
+    assert registry.get(second.websocket) is None
+    assert registry.get(third.websocket) is third
+    registry.remove(first)
+    assert registry.for_user(1) == ()
+    assert len(registry) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_bus_delivers_in_order_and_replays():
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    bus = StreamEventBus(redis, "test:events", "node-a", maxlen=1_000, block_ms=50)
+    received: list[tuple[str, str]] = []
+
+    async def handler(event_id, frame):
+        received.append((event_id, frame))
+
+    await bus.start(handler)
+    ids = [await bus.publish(f'{{"n":{index}}}') for index in range(3)]
+    for _ in range(50):
+        if len(received) == 3:
+            break
+        await asyncio.sleep(0.01)
+
+    assert received == [(ids[index], f'{{"n":{index}}}') for index in range(3)]
+    assert await bus.replay(ids[0], limit=10) == received[1:]
+    assert await bus.replay(ids[2], limit=10) == []
+    assert await bus.replay(ids[0], limit=1) is None
+    assert await bus.replay("not-an-id", limit=10) is None
+    await redis.xtrim("test:events", minid=ids[2])
+    assert await bus.replay(ids[0], limit=10) is None
+    await bus.stop()
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_only_events_for_that_user():
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    manager = CrashWebSocketManager(database=None, redis=redis)
+    manager._bus = StreamEventBus(redis, "test:events", manager._node_id, maxlen=1_000)
+    websocket = FakeWebSocket()
+    await manager._register(1, websocket)
+
+    await manager._emit_event({"type": "game-flying", "sessionId": 2, "id": 2, "betEndTime": 0, "crashTime": 0})
+    await manager._flush_outbox()
+    await _drain()
+    last_seen = orjson.loads(websocket.frames[-1])["eventId"]
+    await manager._emit_event({"type": "balance-update", "userId": 2, "balance": 5})
+    await manager._emit_event({"type": "game-start", "sessionId": 3, "id": 3})
+    await manager._emit_event({"type": "cashout-processed", "userId": 1, "sessionId": 3, "cashout": {}})
+    await manager._emit_event({"type": "cashout-processed", "userId": 2, "sessionId": 3, "cashout": {}})
+    await manager._flush_outbox()
+
+    missed = [orjson.loads(frame) for frame in await manager._replay(1, last_seen)]
+    assert [(event["type"], event.get("userId")) for event in missed] == [
+        ("game-start", None),
+        ("cashout-processed", 1),
+    ]
+    assert all(event["eventId"] > last_seen for event in missed)
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_user_events_are_routed_only_to_owning_nodes():
+    server = fakeredis.FakeServer()
+    redis = FakeRedis(server=server)
+    owner = CrashWebSocketManager(database=None, redis=redis)
+    bystander = CrashWebSocketManager(database=None, redis=FakeRedis(server=server))
+    sender = CrashWebSocketManager(database=None, redis=redis)
+    await owner._register(1, FakeWebSocket())
+    await sender._register(1, FakeWebSocket())
+    await bystander._register(2, FakeWebSocket())
+
+    await sender._emit_event({"type": "balance-update", "userId": 1, "balance": 7})
+    await sender._emit_event({"type": "bet-accepted", "userId": 3, "bet": {}, "sessionId": 1})
+    await sender._flush_outbox()
+
+    owner_channel = f"{CrashWebSocketManager.EVENT_CHANNEL}:node:{owner._node_id}"
+    assert [channel for channel, _ in redis.published] == [owner_channel]
+    assert sorted(await owner._presence.nodes_for(1)) == sorted([owner._node_id, sender._node_id])
+
+    for manager in (owner, sender, bystander):
+        await _close_all(manager)
+    await _drain()
+    assert await owner._presence.nodes_for(1) == []
+
+
+@pytest.mark.asyncio
+async def test_events_in_one_window_go_out_as_one_message_per_socket():
+    redis = FakeRedis()
+    manager = CrashWebSocketManager(database=None, redis=redis)
+    bettor, watcher = FakeWebSocket(), FakeWebSocket()
+    await manager._register(1, bettor)
+    await manager._register(2, watcher)
+
+    await manager._emit_event({"type": "bet-accepted", "userId": 1, "bet": {"amount": 10}, "sessionId": 4})
+    await manager._emit_event({"type": "balance-update", "userId": 1, "balance": 90})
+    await manager._emit_event({"type": "balance-update", "userId": 1, "balance": 80})
+    await manager._emit_event({"type": "game-flying", "sessionId": 4, "id": 4, "betEndTime": 0, "crashTime": 0})
+    await manager._flush_outbox()
+    await _drain()
+
+    assert [channel for channel, _ in redis.published] == [CrashWebSocketManager.EVENT_CHANNEL]
+    assert len(bettor.frames) == len(watcher.frames) == 1
+    batch = orjson.loads(bettor.frames[0])
+    assert batch["type"] == "batch"
+    assert [(event["type"], event.get("balance")) for event in batch["events"]] == [
+        ("bet-accepted", None),
+        ("balance-update", 80),
+        ("game-flying", None),
+    ]
+    assert orjson.loads(watcher.frames[0])["type"] == "game-flying"
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_events_emitted_during_a_slow_publish_are_flushed_by_the_timer():
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    watcher = FakeWebSocket()
+    await manager._register(1, watcher)
+    release = asyncio.Event()
+    publish = manager._bus.publish
+
+    async def slow_publish(frame: str) -> str | None:
+        await release.wait()
+        return await publish(frame)
+
+    manager._bus.publish = slow_publish
+    await manager._emit_event({"type": "game-flying", "sessionId": 4, "id": 4, "betEndTime": 0, "crashTime": 0})
+    while not manager._outbox == []:
+        await asyncio.sleep(0.001)
+    # The first window is stuck in the bus publish when the crash is emitted.
+    await manager._emit_event({"type": "game-crash", "sessionId": 4, "id": 4, "crashPoint": None, "crashTime": 0})
+    release.set()
+    deadline = time.monotonic() + 1
+    while len(watcher.frames) < 2 and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+    assert [orjson.loads(frame)["type"] for frame in watcher.frames] == ["game-flying", "game-crash"]
+    assert manager._outbox == [] and manager._flush_task is None
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_local_sockets_get_events_while_the_bus_is_down(monkeypatch):
+    monkeypatch.setattr(ws_settings, "crash_event_batch_ms", 0)
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    mine = FakeWebSocket()
+    await manager._register(1, mine)
+
+    async def broken(*args) -> None:
+        raise ConnectionError("redis is down")
+
+    manager._bus.publish = broken
+    manager._presence.nodes_for_many = broken
+    await manager.notify_cashout(1, crash_service.CrashSnapshot(
+        session={"id": 4, "room": "main"}, user={}, balance={"total": 70}, cashout={"multiplier": 2.0, "payout": 20, "betId": 1},
+    ))
+    await _drain()
+
+    events = [event for frame in mine.frames for event in orjson.loads(frame).get("events", [orjson.loads(frame)])]
+    assert [event["type"] for event in events] == ["cashout-processed", "balance-update"]
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_batched_bus_message_is_demultiplexed_on_receiving_node():
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    mine, other = FakeWebSocket(), FakeWebSocket()
+    await manager._register(1, mine)
+    await manager._register(2, other)
+    frames = [
+        _encode({"type": "balance-update", "userId": 1, "balance": 5, "origin": "remote"}),
+        _encode({"type": "balance-update", "userId": 1, "balance": 6, "origin": "remote"}),
+        _encode({"type": "game-start", "id": 9, "origin": "remote"}),
+    ]
+
+    await manager._on_bus_event("5-0", "\n".join(frames))
+    await _drain()
+
+    events = orjson.loads(mine.frames[0])["events"]
+    assert [(event["eventId"], event.get("balance")) for event in events] == [("5-0-1", 6), ("5-0-2", None)]
+    assert orjson.loads(other.frames[0])["eventId"] == "5-0-2"
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_local_hub_relays_shared_events_between_workers(tmp_path):
+    server = fakeredis.FakeServer()
+    path = str(tmp_path / "hub.sock")
+    received: dict[str, list[str]] = {"a": [], "b": []}
+
+    def make_worker(name: str) -> LocalHubEventBus:
+        redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        return LocalHubEventBus(
+            path,
+            lambda shared, direct: PubSubEventBus(redis, "test:events", name, shared=shared, direct=direct),
+        )
+
+    async def wait_for(predicate) -> None:
+        for _ in range(200):
+            if predicate():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("condition not reached")
+
+    first, second = make_worker("a"), make_worker("b")
+    await first.start(lambda event_id, data: _append(received["a"], data))
+    await second.start(lambda event_id, data: _append(received["b"], data))
+    assert first.is_hub and not second.is_hub
+
+    await second.publish('{"n":1}')
+    await wait_for(lambda: received["a"] == received["b"] == ['{"n":1}'])
+
+    await first.stop()
+    await wait_for(lambda: second.is_hub)
+    await second.publish('{"n":2}')
+    await wait_for(lambda: received["b"] == ['{"n":1}', '{"n":2}'])
+    await second.stop()
+
+
+async def _append(target: list[str], data: str) -> None:
+    target.append(data)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _Tracked:
+    last_seen = 0.0
+
+
+def test_liveness_wheel_evicts_only_silent_connections():
+    clock = _Clock()
+    evicted = []
+    wheel = LivenessWheel(10, evicted.append, clock=clock)
+    quiet, chatty = _Tracked(), _Tracked()
+    wheel.add(quiet)
+    wheel.add(chatty)
+
+    for _ in range(12):
+        clock.now += 1
+        chatty.last_seen = clock.now
+        wheel.sweep()
+
+    assert evicted == [quiet]
+    assert len(wheel) == 1
+    wheel.discard(chatty)
+    clock.now += 30
+    assert wheel.sweep() == 0
+    assert len(wheel) == 0
+
+
+class _ScriptedWebSocket(FakeWebSocket):
+    def __init__(self, auth: dict) -> None:
+        super().__init__()
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.inbox.put_nowait(auth)
+
+    async def accept(self) -> None:
+        pass
+
+    async def receive_json(self) -> dict:
+        message = await self.inbox.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return message
+
+
+class _Database:
+    def __init__(self, session_factory) -> None:
+        self.session = session_factory
+
+
+@pytest.mark.asyncio
+async def test_handshake_before_the_first_round_sends_an_empty_sync(session_factory):
+    async with session_factory() as db:
+        user = User(tg_id=778, username="early")
+        db.add(user)
+        await db.commit()
+    manager = CrashWebSocketManager(database=_Database(session_factory), redis=FakeRedis())
+    token, _ = create_crash_jwt(user.id, 778)
+    websocket = _ScriptedWebSocket({"type": "auth", "token": token})
+    task = asyncio.create_task(manager.handle_websocket(websocket))
+    while not websocket.frames:
+        await asyncio.sleep(0.01)
+    websocket.inbox.put_nowait(None)
+    await task
+
+    events = orjson.loads(websocket.frames[0])["events"]
+    assert [event["type"] for event in events] == ["auth-success", "sync", "balance-update", "session-history"]
+    assert events[1]["id"] is None and events[1]["phase"] is None
+    assert manager._view(crash_service.DEFAULT_ROOM).sync_frame is None
+
+
+@pytest.mark.asyncio
+async def test_handshake_shares_cached_frames_and_reads_only_the_user(session_factory, count_statements):
+    async with session_factory() as db:
+        user = User(tg_id=777, username="storm")
+        db.add(user)
+        await db.flush()
+        await add_coins_cash(db, user.id, 250)
+        await db.commit()
+        await crash_service.CrashRoundEngine().advance(db)
+    manager = CrashWebSocketManager(database=_Database(session_factory), redis=FakeRedis())
+    token, _ = create_crash_jwt(user.id, 777)
+
+    async def connect() -> list[dict]:
+        websocket = _ScriptedWebSocket({"type": "auth", "token": token})
+        task = asyncio.create_task(manager.handle_websocket(websocket))
+        while not websocket.frames:
+            await asyncio.sleep(0.01)
+        websocket.inbox.put_nowait(None)
+        await task
+        assert len(websocket.frames) == 1
+        return orjson.loads(websocket.frames[0])["events"]
+
+    with count_statements(session_factory.kw["bind"]) as statements:
+        first = await connect()
+        assert [event["type"] for event in first] == ["auth-success", "sync", "balance-update", "session-history"]
+        assert first[2]["balance"] == 250
+
+        statements.clear()
+        second = await connect()
+        assert [event["type"] for event in second] == [event["type"] for event in first]
+        assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 1
+
+        # A crash delivered through the bus refreshes both cached frames without the DB.
+        summary = first[1]
+        crash = {**summary, "type": "game-crash", "phase": "crashed", "crashPoint": 2.5, "origin": "other"}
+        await manager._on_bus_event(None, _encode(crash))
+        statements.clear()
+        third = await connect()
+        assert third[1]["phase"] == "crashed"
+        assert third[3]["history"][0] == {"roundId": summary["id"], "crashPoint": 2.5, "crashedAt": summary["crashTime"]}
+        assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 1
+    await _close_all(manager)
+
+
+async def _until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_standby_takes_over_within_a_second_and_fences_the_old_leader(file_session_factory):
+    server = fakeredis.FakeServer()
+    database = _Database(file_session_factory)
+    managers = [CrashWebSocketManager(database=database, redis=FakeRedis(server=server)) for _ in range(2)]
+    tasks = {manager: asyncio.create_task(manager._round_loop()) for manager in managers}
+
+    async def stamped_with(token: int | None) -> bool:
+        async with file_session_factory() as db:
+            return token is not None and await db.scalar(select(func.max(CrashRound.leader_epoch))) == token
+
+    async def anyone_leads() -> bool:
+        return any(manager._leases[crash_service.DEFAULT_ROOM].held for manager in managers)
+
+    try:
+        await _until(anyone_leads)
+        leader, standby = sorted(managers, key=lambda manager: not manager._leases[crash_service.DEFAULT_ROOM].held)
+        stale_token = leader._leases[crash_service.DEFAULT_ROOM].token
+        await _until(lambda: stamped_with(stale_token))
+
+        async def crash_without_release() -> None:
+            pass
+
+        # A crashed leader never releases its lease: the standby has to wait it out.
+        leader._leases[crash_service.DEFAULT_ROOM].release = crash_without_release
+        killed = time.monotonic()
+        tasks[leader].cancel()
+        await _until(lambda: stamped_with(standby._leases[crash_service.DEFAULT_ROOM].token))
+        failover = time.monotonic() - killed
+
+        assert failover < 1.0
+        assert standby._leases[crash_service.DEFAULT_ROOM].token > stale_token
+        stale = crash_service.CrashRoundEngine()
+        stale.fencing_token = stale_token
+        async with file_session_factory() as db:
+            with pytest.raises(crash_service.LeadershipLost):
+                await stale.load(db)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for manager in managers:
+            await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_followers_read_the_round_the_leader_publishes(session_factory, count_statements):
+    server = fakeredis.FakeServer()
+    database = _Database(session_factory)
+    leading = CrashWebSocketManager(database=database, redis=FakeRedis(server=server))
+    follower = CrashWebSocketManager(database=database, redis=FakeRedis(server=server))
+    leader_engine, follower_engine = crash_service.CrashRoundEngine(), crash_service.CrashRoundEngine()
+    async with session_factory() as db:
+        await leader_engine.advance(db)
+    assert await leading._leases[crash_service.DEFAULT_ROOM].acquire()
+    await leading._publish_round(leader_engine)
+
+    await follower._warm_standby(follower_engine)
+    assert follower_engine.round == leader_engine.round
+    state_key = follower._room_key(CrashWebSocketManager.ROUND_STATE_KEY, crash_service.DEFAULT_ROOM)
+    betting_state = await FakeRedis(server=server).get(state_key)
+
+    crash_service.set_round_engine(follower_engine)
+    try:
+        with count_statements(session_factory.kw["bind"]) as statements:
+            async with session_factory() as db:
+                summary = await crash_service.get_round_summary(db)
+            assert summary["phase"] == "betting"
+            assert statements == []
+
+            async with session_factory() as db:
+                flying = (await leader_engine.advance(db, now=leader_engine.round.bet_ends_at))[0]
+            await leading._publish_round(leader_engine)
+            statements.clear()
+            await follower._on_bus_event(None, _encode({**flying, "type": "game-flying", "origin": "other"}))
+            await follower._warm_standby(follower_engine)
+            assert follower_engine.round.status == "flying"
+            assert statements == []
+
+            # A stale copy read back later (e.g. a deposed leader's late write) is ignored.
+            await FakeRedis(server=server).set(state_key, betting_state)
+            follower._view(crash_service.DEFAULT_ROOM).last_round = {"id": flying["id"], "phase": "betting"}
+            await follower._warm_standby(follower_engine)
+            assert follower_engine.round.status == "flying"
+            assert follower_engine.version == leader_engine.version
+    finally:
+        crash_service.set_round_engine(None)
+
+    # Once the lease is gone the old leader can no longer overwrite the state.
+    await FakeRedis(server=server).delete(CrashWebSocketManager.ROUND_LOCK_KEY)
+    with pytest.raises(crash_service.LeadershipLost):
+        await leading._publish_round(leader_engine)
+    await _close_all(leading)
+    await _close_all(follower)
+
+
+@pytest.mark.asyncio
+async def test_sockets_only_get_round_events_of_their_room():
+    manager = CrashWebSocketManager(database=None, redis=FakeRedis())
+    main, high = FakeWebSocket(), FakeWebSocket()
+    await manager._register(1, main)
+    await manager._register(1, high, room="high")
+
+    now_ms = int(time.time() * 1000)
+    flying = {"id": 8, "sessionId": 8, "room": "high", "betEndTime": now_ms, "crashTime": now_ms + 60_000}
+    await manager._emit_event({"type": "game-flying", **flying})
+    await manager._emit_event({"type": "cashout-processed", "userId": 1, "sessionId": 8, "room": "high", "cashout": {"multiplier": 2.0, "payout": 20}})
+    await manager._emit_event({"type": "balance-update", "userId": 1, "balance": 70})
+    await manager._flush_outbox()
+    await manager._tick()
+    await manager._tick("high")
+    await _drain()
+
+    assert [orjson.loads(frame)["type"] for frame in main.frames] == ["balance-update"]
+    batch, tick = (orjson.loads(frame) for frame in high.frames)
+    assert [event["type"] for event in batch["events"]] == ["game-flying", "cashout-processed", "balance-update"]
+    assert tick["type"] == "tick" and tick["c"] == [[1, 2.0, 20]]
+    await _close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_leader_opens_sessions_only_at_deadlines(session_factory, monkeypatch):
+    monkeypatch.setattr(ws_settings, "crash_bet_duration_ms", 300)
+    opened = []
+
+    class CountingDatabase:
+        def session(self):
+            opened.append(crash_service._now())
+            return session_factory()
+
+    manager = CrashWebSocketManager(database=CountingDatabase(), redis=FakeRedis())
+    task = asyncio.create_task(manager._round_loop())
+    try:
+        await asyncio.sleep(0.7)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await _close_all(manager)
+
+    async with session_factory() as db:
+        round_obj = await db.scalar(select(CrashRound))
+    # One session to claim the room, one at take-off; none while waiting or renewing the lease.
+    assert len(opened) == 2
+    assert round_obj.status == "flying"
+    lag = opened[1] - crash_service._as_utc(round_obj.bet_ends_at)
+    assert 0 <= lag.total_seconds() < 0.05
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+
+from apps.bot.api import crash as crash_api
+from apps.bot.core import idempotency
+from apps.bot.core.wallets import add_coins_cash, get_wallet_balance
+from apps.bot.db.models import CrashBet, IdempotencyKey, Purchase, User
+from apps.bot.repositories.purchases import record_purchase
+from apps.bot.services import crash as crash_service
+
+
+@pytest.fixture(autouse=True)
+def _local_store():
+    idempotency.set_idempotency_store(None)
+    yield
+    idempotency.set_idempotency_store(None)
+
+
+async def _user_with_coins(session, tg_id: int, coins: int) -> User:
+    user = User(tg_id=tg_id, username=f"idem{tg_id}")
+    session.add(user)
+    await session.flush()
+    await add_coins_cash(session, user.id, coins)
+    await session.commit()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_duplicate_crash_bets_replay_the_first_response_without_queries(session, count_statements):
+    user_id = (await _user_with_coins(session, 7001, 1_000)).id
+    await crash_service.CrashRoundEngine().advance(session)
+    await session.commit()
+
+    async def bet(amount: int, key: str | None) -> dict:
+        return await crash_api.crash_bet(
+            request=crash_api.BetRequest(amount=amount),
+            fastapi_request=SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace())),
+            room=crash_service.DEFAULT_ROOM,
+            idempotency_key=key,
+            session=session,
+            user_id=user_id,
+        )
+
+    first = await bet(200, "retry-1")
+    with count_statements(session.get_bind()) as statements:
+        assert await bet(200, "retry-1") == first
+    assert not statements
+    assert await session.scalar(select(func.count()).select_from(CrashBet)) == 1
+    assert (await get_wallet_balance(session, user_id)).coins_cash == 800
+
+    # A new key runs the request, which fails as before and leaves the key
+    # free: its row goes with the rollback get_session does.
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            await bet(200, "retry-2")
+        assert error.value.status_code == 400
+        await session.rollback()
+    assert await session.scalar(select(func.count()).select_from(IdempotencyKey)) == 1
+
+
+@pytest.mark.asyncio
+async def test_database_row_answers_when_the_fast_store_forgot_the_key(session):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    idempotency.set_idempotency_store(redis)
+    calls: list[int] = []
+
+    async def operation() -> dict:
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return {"ok": len(calls)}
+
+    with pytest.raises(RuntimeError):
+        await idempotency.run_once(session, "op:1", operation)
+    await session.rollback()
+    assert await redis.exists("idem:op:1") == 0
+
+    assert await idempotency.run_once(session, "op:1", operation) == ({"ok": 2}, False)
+    assert await idempotency.run_once(session, "op:1", operation) == ({"ok": 2}, True)
+    await redis.flushall()
+    assert await idempotency.run_once(session, "op:1", operation) == ({"ok": 2}, True)
+    assert len(calls) == 2
+
+    await redis.set("idem:op:2", "")
+    with pytest.raises(idempotency.RequestInProgress):
+        await idempotency.run_once(session, "op:2", operation)
+
+
+@pytest.mark.asyncio
+async def test_record_purchase_relies_on_the_unique_charge_id(session):
+    user = await _user_with_coins(session, 7002, 1)
+    values = dict(user_id=user.id, product_code="p1", amount_xtr=50, coins_granted=500, bonus_granted=0)
+
+    purchase, created = await record_purchase(session, charge_id="ch-1", **values)
+    assert created and purchase.charge_id == "ch-1"
+    again, created = await record_purchase(session, charge_id="ch-1", **values)
+    assert not created and again.id == purchase.id
+    assert await session.scalar(select(func.count()).select_from(Purchase)) == 1
+
+
+@pytest.mark.asyncio
+async def test_purge_expired_drops_rows_past_the_ttl(session):
+    async def operation() -> dict:
+        return {"ok": True}
+
+    for key in ("old", "new"):
+        await idempotency.run_once(session, key, operation)
+    await session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == "old")
+        .values(created_at=datetime.now(timezone.utc) - timedelta(days=2))
+    )
+    await session.commit()
+
+    assert await idempotency.purge_expired(session) == 1
+    assert (await session.scalars(select(IdempotencyKey.key))).all() == ["new"]
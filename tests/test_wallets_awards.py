@@ -1,11 +1,20 @@
 from __future__ import annotations
 
+import fakeredis
 import pytest
-from sqlalchemy import select
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql
 
-from apps.bot.core.awards import apply_turnover, create_bonus_award, try_unlock_bonuses
-from apps.bot.core.wallets import add_coins_bonus, add_coins_cash, consume_coins, get_wallet_balance
-from apps.bot.db.models import BonusAwardStatus, Ledger, User
+from apps.bot.core import wallet_cache
+from apps.bot.core.awards import (
+    apply_turnover,
+    create_bonus_award,
+    rebuild_active_bonus_counts,
+    try_unlock_bonuses,
+    user_has_locked_bonuses,
+)
+from apps.bot.core.wallets import _debit_statement, add_coins_bonus, add_coins_cash, consume_coins, get_wallet, get_wallet_balance
+from apps.bot.db.models import BonusAwardStatus, Ledger, User, Wallet
 
 
 @pytest.mark.asyncio
@@ -66,3 +75,167 @@ async def test_bonus_award_unlock_flow(session):
     assert wallet.coins_bonus == 0
     assert result["awards"][0]["transferred"] == 1_000
     assert award.status == BonusAwardStatus.COMPLETED.value
+
+
+@pytest.mark.asyncio
+async def test_credits_are_one_update_and_keep_loaded_wallets_current(session, count_statements):
+    user = User(tg_id=3003, username="atomic")
+    session.add(user)
+    await session.flush()
+    await add_coins_cash(session, user.id, 100)
+    wallet = await get_wallet(session, user.id)
+
+    with count_statements(session.get_bind()) as statements:
+        assert await add_coins_cash(session, user.id, 50) == 150
+        assert await add_coins_bonus(session, user.id, 20) == 20
+
+    assert (wallet.coins_cash, wallet.coins_bonus) == (150, 20)
+    updates = [sql for sql in statements if sql.startswith("UPDATE wallets")]
+    assert len(updates) == 2 and all("RETURNING" in sql for sql in updates)
+    assert not [sql for sql in statements if sql.startswith("SELECT")]
+
+
+def test_postgres_debit_is_a_single_locking_statement():
+    sql = str(_debit_statement(1, 100, "auto_bonus_when_active").compile(dialect=postgresql.asyncpg.dialect()))
+    assert sql.count("UPDATE wallets") == 1
+    assert "FOR UPDATE" in sql and "RETURNING" in sql
+    assert "active_bonus_count" in sql and "bonus_awards" not in sql
+
+
+@pytest.mark.asyncio
+async def test_ledger_rows_are_written_together_at_commit(session_factory, count_statements):
+    async with session_factory() as db:
+        user = User(tg_id=4004, username="ledger")
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+        with count_statements(db.get_bind(), params=True) as statements:
+            await add_coins_cash(db, user.id, 100)
+            await add_coins_bonus(db, user.id, 50)
+            await consume_coins(db, user.id, 120)
+            assert not [sql for sql, _ in statements if "ledger" in sql]
+            await db.commit()
+        inserts = [(sql, params) for sql, params in statements if sql.startswith("INSERT INTO ledger")]
+        assert len(inserts) == 1 and len(inserts[0][1]) == 4
+
+        # Uncommitted rows are visible to ledger reads in the same transaction and dropped on rollback.
+        await add_coins_cash(db, user.id, 7)
+        assert len((await db.scalars(select(Ledger).where(Ledger.user_id == user.id))).all()) == 5
+        await add_coins_cash(db, user.id, 9)
+        await db.rollback()
+
+    async with session_factory() as db:
+        amounts = (await db.scalars(select(Ledger.amount).where(Ledger.user_id == user_id).order_by(Ledger.id))).all()
+    assert amounts == [100, 50, -100, -20]
+
+
+@pytest.mark.asyncio
+async def test_wallet_cache_serves_committed_balances_without_queries(session_factory, monkeypatch, count_statements):
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    wallet_cache.set_wallet_cache(redis)
+    engine = session_factory.kw["bind"].sync_engine
+
+    # The write-through must only start once the connection is back in the pool.
+    in_use = [0]
+    event.listen(engine.pool, "checkout", lambda *args: in_use.__setitem__(0, in_use[0] + 1))
+    event.listen(engine.pool, "checkin", lambda *args: in_use.__setitem__(0, in_use[0] - 1))
+    in_use_at_publish: list[int] = []
+    publish = wallet_cache.publish
+
+    async def recording_publish(balances):
+        in_use_at_publish.append(in_use[0])
+        await publish(balances)
+
+    monkeypatch.setattr(wallet_cache, "publish", recording_publish)
+    try:
+        async with session_factory() as db:
+            user = User(tg_id=5005, username="cached")
+            db.add(user)
+            await db.flush()
+            user_id = user.id
+            await add_coins_cash(db, user_id, 100)
+            await db.commit()
+        cached = await redis.hgetall(f"wallet:{user_id}")
+        assert cached["coins_cash"] == "100"
+        assert in_use_at_publish == [0]
+
+        with count_statements(engine) as statements:
+            async with session_factory() as db:
+                assert (await get_wallet_balance(db, user_id)).coins_cash == 100
+                assert not statements
+
+                # The transaction sees its own writes; the cache only after commit.
+                await add_coins_cash(db, user_id, 5)
+                assert (await get_wallet_balance(db, user_id)).coins_cash == 105
+                assert (await wallet_cache.load(user_id)).coins_cash == 100
+                await db.commit()
+            balance = await wallet_cache.load(user_id)
+            assert (balance.coins_cash, balance.version) == (105, int(cached["version"]) + 1)
+            assert await wallet_cache.store([wallet_cache.WalletBalance(user_id, 100, 0, 0, int(cached["version"]))]) == 0
+
+            async with session_factory() as db:
+                await add_coins_cash(db, user_id, 30)
+                await db.rollback()
+            assert await redis.exists(f"wallet:{user_id}") == 0
+
+            statements.clear()
+            async with session_factory() as db:
+                assert (await get_wallet_balance(db, user_id)).coins_cash == 105
+            assert len(statements) == 1
+            assert (await wallet_cache.load(user_id)).coins_cash == 105
+    finally:
+        wallet_cache.set_wallet_cache(None)
+
+
+@pytest.mark.asyncio
+async def test_active_bonus_count_drives_bonus_first_without_award_queries(session, count_statements):
+    user = User(tg_id=6006, username="counter")
+    session.add(user)
+    await session.flush()
+    await add_coins_cash(session, user.id, 500)
+    wallet = await get_wallet(session, user.id)
+    assert not await user_has_locked_bonuses(session, user.id)
+
+    await create_bonus_award(session, user.id, kind="welcome", granted=300, wr_mult=1.0, cap_cashout=300)
+    await create_bonus_award(session, user.id, kind="promo", granted=100, wr_mult=50.0, cap_cashout=100)
+    assert wallet.active_bonus_count == 2
+
+    with count_statements(session.get_bind()) as statements:
+        spent = await consume_coins(session, user.id, 50, prefer="auto_bonus_when_active")
+        assert await user_has_locked_bonuses(session, user.id)
+    assert (spent.cash, spent.bonus) == (0, 50)
+    assert not [sql for sql in statements if "bonus_awards" in sql]
+
+    # The welcome award reaches its wagering target and is unlocked; the promo one stays.
+    await apply_turnover(session, user.id, "slot", stake=300)
+    await try_unlock_bonuses(session, user.id)
+    assert wallet.active_bonus_count == 1
+
+    wallet.active_bonus_count = 7
+    await session.flush()
+    assert await rebuild_active_bonus_counts(session, fix=False) == [(user.id, 7, 1)]
+    assert await rebuild_active_bonus_counts(session) == [(user.id, 7, 1)]
+    assert await session.scalar(select(Wallet.active_bonus_count).where(Wallet.user_id == user.id)) == 1
+    assert await rebuild_active_bonus_counts(session) == []
+
+
+@pytest.mark.asyncio
+async def test_turnover_sees_awards_created_after_the_wallet_was_loaded(session_factory):
+    async with session_factory() as db:
+        user = User(tg_id=6007, username="stale")
+        db.add(user)
+        await db.flush()
+        await add_coins_cash(db, user.id, 500)
+        await db.commit()
+
+    async with session_factory() as playing, session_factory() as granting:
+        wallet = await get_wallet(playing, user.id)
+        await playing.commit()
+        assert wallet.active_bonus_count == 0
+
+        await create_bonus_award(granting, user.id, kind="welcome", granted=100, wr_mult=1.0, cap_cashout=100)
+        await granting.commit()
+
+        assert await apply_turnover(playing, user.id, "slot", stake=50) > 0
+        assert wallet.active_bonus_count == 1